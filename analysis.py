@@ -0,0 +1,659 @@
+# -*- coding: utf-8 -*-
+"""Análise espacial de levantamentos: um buraco por local, somando todas as passagens.
+
+As detecções de muitas imagens ou frames são convertidas em avistamentos com
+posição GPS e horário, que vêm de:
+
+- EXIF das fotos (GPSLatitude/GPSLongitude e DateTimeOriginal, via Pillow);
+- um CSV por imagem (image_name, lat, lon e opcionalmente timestamp);
+- um trajeto GPS (CSV com time, lat, lon ou GPX) para frames de vídeo, com a
+  posição interpolada pelo tempo do frame. As trilhas de tracking.py
+  (<vídeo>_tracks.jsonl) viram um avistamento por buraco.
+
+As posições são projetadas em metros (projeção local equiretangular em torno
+de uma origem fixa, precisa o bastante na escala de uma cidade) e indexadas
+em uma grade (hash de células de ANALYSIS_CELL_SIZE metros). Um avistamento a
+menos de ANALYSIS_MERGE_RADIUS metros de um buraco já conhecido é somado a
+ele (posição média, contagem, melhor confiança, primeira/última vez visto);
+detecções da mesma imagem nunca se fundem entre si. A posição é a da câmera,
+então buracos muito próximos vistos sempre juntos podem virar um só.
+
+O índice é salvo em uma pasta (arrays numpy + metadados JSON) e novas
+execuções são somadas sem reprocessar as anteriores; cada dataset de
+resultados é ingerido uma única vez (pelo hash do conteúdo).
+
+    python analysis.py ingest --index levantamento/ --results output_processed/detections.parquet --images fotos/
+    python analysis.py ingest --index levantamento/ --tracks output_processed/dashcam/dashcam_tracks.jsonl \\
+        --gps-track trajeto.gpx
+    python analysis.py query --index levantamento/ --bbox=-23.56,-46.66,-23.55,-46.65
+    python analysis.py roads --index levantamento/ --roads vias.geojson
+"""
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import re
+
+import numpy as np
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371008.8
+
+# Um buraco (avistamentos fundidos) no índice
+POTHOLE_DTYPE = np.dtype([
+    ("x", "<f8"),
+    ("y", "<f8"),
+    ("sightings", "<i4"),
+    ("runs", "<i4"),
+    ("last_run", "<i4"),
+    ("confidence_sum", "<f8"),
+    ("best_confidence", "<f4"),
+    ("best_image", "<i4"),
+    ("first_seen", "<f8"),
+    ("last_seen", "<f8"),
+])
+
+_FRAME_NAME = re.compile(r"^(?P<video>.+)_frame(?P<frame>\d+)$")
+
+
+class LocalProjection:
+    """Projeção equiretangular local: (lat, lon) em graus <-> (x, y) em metros a partir da origem."""
+
+    def __init__(self, lat0, lon0):
+        self.lat0, self.lon0 = float(lat0), float(lon0)
+        self._kx = math.radians(1) * EARTH_RADIUS * math.cos(math.radians(self.lat0))
+        self._ky = math.radians(1) * EARTH_RADIUS
+
+    def forward(self, lat, lon):
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        return (lon - self.lon0) * self._kx, (lat - self.lat0) * self._ky
+
+    def inverse(self, x, y):
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        return self.lat0 + y / self._ky, self.lon0 + x / self._kx
+
+
+# --- Metadados de posição ---
+
+def _parse_time(value):
+    """Segundos (epoch) de um número ou de uma data ISO 8601 / EXIF ("2024:05:01 10:00:00")."""
+    if value is None or value == "":
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    text = str(value).strip().replace("Z", "+00:00")
+    if re.match(r"^\d{4}:\d{2}:\d{2} ", text):
+        text = text.replace(":", "-", 2)
+    try:
+        parsed = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return math.nan
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+def read_exif_gps(path):
+    """Posição GPS e horário do EXIF de uma foto.
+
+    Returns:
+        (lat, lon, timestamp) ou None se a foto não tiver GPS. timestamp é NaN se ausente.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            exif = image.getexif()
+            gps = exif.get_ifd(0x8825)
+            details = exif.get_ifd(0x8769)
+    except Exception as e:
+        logger.warning("Não foi possível ler o EXIF de %s: %s", path, e)
+        return None
+    if 2 not in gps or 4 not in gps:
+        return None
+
+    def degrees(values, ref):
+        d, m, s = (float(v) for v in values)
+        value = d + m / 60 + s / 3600
+        return -value if ref in ("S", "W") else value
+
+    lat = degrees(gps[2], gps.get(1, "N"))
+    lon = degrees(gps[4], gps.get(3, "E"))
+    return lat, lon, _parse_time(details.get(36867) or exif.get(306))
+
+
+class GpsTrack:
+    """Trajeto GPS (série temporal de posições) para localizar frames de vídeo."""
+
+    def __init__(self, times, lat, lon):
+        order = np.argsort(times)
+        self.times = np.asarray(times, dtype=np.float64)[order]
+        self.lat = np.asarray(lat, dtype=np.float64)[order]
+        self.lon = np.asarray(lon, dtype=np.float64)[order]
+        if not len(self.times):
+            raise ValueError("Trajeto GPS vazio.")
+
+    @classmethod
+    def from_file(cls, path):
+        """Lê um GPX (trkpt com <time>) ou um CSV com colunas time, lat, lon."""
+        times, lat, lon = [], [], []
+        if path.lower().endswith(".gpx"):
+            import xml.etree.ElementTree as ET
+
+            for element in ET.parse(path).iter():
+                if element.tag.rsplit("}", 1)[-1] != "trkpt":
+                    continue
+                time = next((child.text for child in element if child.tag.rsplit("}", 1)[-1] == "time"), None)
+                times.append(_parse_time(time))
+                lat.append(float(element.get("lat")))
+                lon.append(float(element.get("lon")))
+        else:
+            import csv
+
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    times.append(_parse_time(row.get("time") or row.get("timestamp")))
+                    lat.append(float(row["lat"]))
+                    lon.append(float(row["lon"]))
+        return cls(times, lat, lon)
+
+    def position_at(self, times):
+        """Posição interpolada (lat, lon) em cada instante (segundos epoch)."""
+        times = np.asarray(times, dtype=np.float64)
+        return np.interp(times, self.times, self.lat), np.interp(times, self.times, self.lon)
+
+
+def positions_from_exif(inputs):
+    """{image_name: (lat, lon, timestamp)} das fotos com GPS no EXIF.
+
+    Args:
+        inputs: Tuplas (chave, caminho) de manifest.discover_inputs. Cada foto é registrada pelo
+                nome usado no modo avulso (nome do arquivo) e no modo em lote (manifest.batch_image_name).
+    """
+    from manifest import batch_image_name
+
+    positions = {}
+    for key, path in inputs:
+        position = read_exif_gps(path)
+        if position is None:
+            continue
+        positions[os.path.splitext(os.path.basename(key))[0]] = position
+        positions[batch_image_name(key)] = position
+    return positions
+
+
+def positions_from_csv(path):
+    """{image_name: (lat, lon, timestamp)} de um CSV com colunas image_name, lat, lon[, timestamp]."""
+    import csv
+
+    positions = {}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            positions[row["image_name"]] = (float(row["lat"]), float(row["lon"]), _parse_time(row.get("timestamp")))
+    return positions
+
+
+def positions_from_track(image_names, track, fps=30.0, start_time=None):
+    """Posições dos frames de vídeo (nomes "<vídeo>_frameNNNNNN") ao longo de um trajeto GPS.
+
+    Args:
+        start_time: Horário (segundos epoch) do frame 0; padrão: início do trajeto.
+    """
+    start_time = track.times[0] if start_time is None else start_time
+    names, seconds = [], []
+    for name in image_names:
+        match = _FRAME_NAME.match(name)
+        if match:
+            names.append(name)
+            seconds.append(start_time + int(match.group("frame")) / fps)
+    lat, lon = track.position_at(seconds)
+    return {name: (la, lo, t) for name, la, lo, t in zip(names, lat.tolist(), lon.tolist(), seconds)}
+
+
+# --- Índice espacial ---
+
+class SurveyIndex:
+    """Buracos únicos de todos os levantamentos, com índice em grade para consultas espaciais.
+
+    Args:
+        origin: (lat, lon) da projeção; padrão: o primeiro avistamento.
+        cell_size: Lado das células da grade, em metros (padrão: config.ANALYSIS_CELL_SIZE).
+        merge_radius: Distância máxima, em metros, para somar um avistamento a um buraco
+                      existente (padrão: config.ANALYSIS_MERGE_RADIUS).
+    """
+
+    def __init__(self, origin=None, cell_size=None, merge_radius=None):
+        self.merge_radius = config.ANALYSIS_MERGE_RADIUS if merge_radius is None else merge_radius
+        # Com células >= raio de fusão, os vizinhos de um ponto estão sempre nas 3x3 células ao redor
+        self.cell_size = max(cell_size or config.ANALYSIS_CELL_SIZE, self.merge_radius)
+        self.projection = LocalProjection(*origin) if origin is not None else None
+        self.images = []
+        self.runs = {}
+        self._image_ids = {}
+        self._data = np.zeros(1024, dtype=POTHOLE_DTYPE)
+        self.size = 0
+        self._cells = {}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def potholes(self):
+        """Array estruturado (POTHOLE_DTYPE) com os buracos do índice (sem cópia)."""
+        return self._data[:self.size]
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def _append(self, record):
+        if self.size == len(self._data):
+            self._data = np.concatenate([self._data, np.zeros(len(self._data), dtype=POTHOLE_DTYPE)])
+        pothole_id = self.size
+        self._data[pothole_id] = record
+        self.size += 1
+        self._cells.setdefault(self._cell(record[0], record[1]), []).append(pothole_id)
+        return pothole_id
+
+    def _move(self, pothole_id, old_cell, x, y):
+        new_cell = self._cell(x, y)
+        if new_cell != old_cell:
+            self._cells[old_cell].remove(pothole_id)
+            self._cells.setdefault(new_cell, []).append(pothole_id)
+
+    def _image_id(self, name):
+        if name not in self._image_ids:
+            self._image_ids[name] = len(self.images)
+            self.images.append(name)
+        return self._image_ids[name]
+
+    def add_sightings(self, lat, lon, confidence, timestamp, image_names, run_id):
+        """Soma avistamentos ao índice.
+
+        Args:
+            lat, lon, confidence, timestamp: Arrays paralelos (timestamp pode ter NaN).
+            image_names: Imagem de cada avistamento (avistamentos da mesma imagem não se fundem).
+            run_id: Identificador da execução (para contar em quantas passagens cada buraco apareceu).
+
+        Returns:
+            Número de buracos novos.
+        """
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        if not len(lat):
+            return 0
+        if self.projection is None:
+            self.projection = LocalProjection(lat[0], lon[0])
+        run = self.runs.setdefault(run_id, len(self.runs))
+        xs, ys = self.projection.forward(lat, lon)
+        data = self._data
+        radius_sq = self.merge_radius ** 2
+        claimed = {}
+        new = 0
+        for x, y, conf, t, name in zip(xs.tolist(), ys.tolist(), np.asarray(confidence, dtype=np.float64).tolist(),
+                                       np.asarray(timestamp, dtype=np.float64).tolist(), image_names):
+            image_id = self._image_id(name)
+            taken = claimed.setdefault(image_id, set())
+            cx, cy = self._cell(x, y)
+            best, best_dist = None, radius_sq
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for pothole_id in self._cells.get((cx + dx, cy + dy), ()):
+                        dist = (data[pothole_id]["x"] - x) ** 2 + (data[pothole_id]["y"] - y) ** 2
+                        if dist <= best_dist and pothole_id not in taken:
+                            best, best_dist = pothole_id, dist
+            if best is None:
+                taken.add(self._append((x, y, 1, 1, run, conf, conf, image_id, t, t)))
+                data = self._data
+                new += 1
+                continue
+            taken.add(best)
+            record = data[best]
+            old_cell = self._cell(record["x"], record["y"])
+            n = record["sightings"]
+            # Média das posições de todos os avistamentos (o erro do GPS tende a se cancelar)
+            record["x"] = (record["x"] * n + x) / (n + 1)
+            record["y"] = (record["y"] * n + y) / (n + 1)
+            record["sightings"] = n + 1
+            record["confidence_sum"] += conf
+            if conf > record["best_confidence"]:
+                record["best_confidence"] = conf
+                record["best_image"] = image_id
+            if record["last_run"] != run:
+                record["last_run"] = run
+                record["runs"] += 1
+            if not math.isnan(t):
+                record["first_seen"] = t if math.isnan(record["first_seen"]) else min(record["first_seen"], t)
+                record["last_seen"] = t if math.isnan(record["last_seen"]) else max(record["last_seen"], t)
+            self._move(best, old_cell, record["x"], record["y"])
+        metrics.inc("analysis_sightings_total", len(lat))
+        metrics.set_gauge("analysis_potholes", self.size)
+        return new
+
+    def query_bbox(self, lat_min, lon_min, lat_max, lon_max):
+        """Ids dos buracos dentro do retângulo (graus)."""
+        if self.projection is None or not self.size:
+            return np.zeros(0, dtype=np.int64)
+        (x1, x2), (y1, y2) = self.projection.forward([lat_min, lat_max], [lon_min, lon_max])
+        x1, x2, y1, y2 = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+        cx1, cy1 = self._cell(x1, y1)
+        cx2, cy2 = self._cell(x2, y2)
+        potholes = self.potholes
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self._cells):
+            # Retângulo maior que a parte ocupada da grade: filtro vetorizado direto
+            candidates = np.arange(self.size)
+        else:
+            ids = [self._cells.get((cx, cy), ()) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)]
+            candidates = np.fromiter((i for cell in ids for i in cell), dtype=np.int64)
+        x, y = potholes["x"][candidates], potholes["y"][candidates]
+        inside = (x >= x1) & (x <= x2) & (y >= y1) & (y <= y2)
+        return np.sort(candidates[inside])
+
+    def to_dataframe(self, ids=None):
+        """Buracos (todos ou só `ids`) como DataFrame pandas, com lat/lon."""
+        import pandas as pd
+
+        potholes = self.potholes if ids is None else self.potholes[ids]
+        lat, lon = self.projection.inverse(potholes["x"], potholes["y"]) if len(potholes) else ([], [])
+        images = np.array(self.images, dtype=object)
+        return pd.DataFrame({
+            "pothole_id": np.arange(self.size) if ids is None else np.asarray(ids),
+            "lat": lat,
+            "lon": lon,
+            "sightings": potholes["sightings"],
+            "runs": potholes["runs"],
+            "mean_confidence": potholes["confidence_sum"] / np.maximum(potholes["sightings"], 1),
+            "best_confidence": potholes["best_confidence"],
+            "best_image": images[potholes["best_image"]] if len(images) else [],
+            "first_seen": pd.to_datetime(potholes["first_seen"], unit="s", utc=True),
+            "last_seen": pd.to_datetime(potholes["last_seen"], unit="s", utc=True),
+        })
+
+    def save(self, path):
+        """Grava o índice em uma pasta (potholes.npy + index.json), trocando os arquivos atomicamente."""
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "potholes.npy.tmp"), "wb") as f:
+            np.save(f, self.potholes)
+        meta = {
+            "origin": [self.projection.lat0, self.projection.lon0] if self.projection else None,
+            "cell_size": self.cell_size,
+            "merge_radius": self.merge_radius,
+            "images": self.images,
+            "runs": self.runs,
+        }
+        with open(os.path.join(path, "index.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(path, "potholes.npy.tmp"), os.path.join(path, "potholes.npy"))
+        os.replace(os.path.join(path, "index.json.tmp"), os.path.join(path, "index.json"))
+        logger.info("Índice com %d buracos salvo em %s", self.size, path)
+
+    @classmethod
+    def load(cls, path, cell_size=None, merge_radius=None):
+        """Abre um índice salvo, ou cria um vazio se a pasta não tiver índice."""
+        meta_path = os.path.join(path, "index.json")
+        if not os.path.exists(meta_path):
+            return cls(cell_size=cell_size, merge_radius=merge_radius)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(meta["origin"], meta["cell_size"], meta["merge_radius"])
+        index.images = meta["images"]
+        index._image_ids = {name: i for i, name in enumerate(index.images)}
+        index.runs = meta["runs"]
+        potholes = np.load(os.path.join(path, "potholes.npy"))
+        index._data = np.zeros(max(1024, 2 * len(potholes)), dtype=POTHOLE_DTYPE)
+        index._data[:len(potholes)] = potholes
+        index.size = len(potholes)
+        # Grade reconstruída de forma vetorizada: ids ordenados por célula e divididos por grupo
+        cx = np.floor(potholes["x"] / index.cell_size).astype(np.int64)
+        cy = np.floor(potholes["y"] / index.cell_size).astype(np.int64)
+        order = np.lexsort((cy, cx))
+        keys = np.stack([cx[order], cy[order]], axis=1)
+        starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)]) if len(order) else []
+        for start, ids in zip(starts, np.split(order, starts[1:]) if len(order) else []):
+            index._cells[(int(keys[start, 0]), int(keys[start, 1]))] = ids.tolist()
+        return index
+
+
+class RoadNetwork:
+    """Segmentos de vias (de um GeoJSON com LineStrings) indexados em grade para consultas de proximidade.
+
+    Args:
+        projection: LocalProjection do SurveyIndex (mesmas coordenadas em metros).
+        cell_size: Lado das células, em metros.
+    """
+
+    def __init__(self, projection, cell_size=None):
+        self.projection = projection
+        self.cell_size = cell_size or config.ANALYSIS_CELL_SIZE
+        self.segments = np.zeros((0, 4), dtype=np.float64)
+        self.road_ids = []
+        self._segment_road = np.zeros(0, dtype=np.int64)
+        self._cells = {}
+
+    @classmethod
+    def from_geojson(cls, path, projection, cell_size=None, name_property="name"):
+        with open(path, "r", encoding="utf-8") as f:
+            collection = json.load(f)
+        network = cls(projection, cell_size)
+        segments, segment_road = [], []
+        for number, feature in enumerate(collection.get("features", [])):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "LineString":
+                lines = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiLineString":
+                lines = geometry["coordinates"]
+            else:
+                continue
+            properties = feature.get("properties") or {}
+            road_id = len(network.road_ids)
+            network.road_ids.append(str(properties.get(name_property) or feature.get("id") or number))
+            for line in lines:
+                coords = np.asarray(line, dtype=np.float64)
+                # GeoJSON usa (lon, lat)
+                x, y = projection.forward(coords[:, 1], coords[:, 0])
+                segments.append(np.stack([x[:-1], y[:-1], x[1:], y[1:]], axis=1))
+                segment_road.append(np.full(len(coords) - 1, road_id))
+        if segments:
+            network.segments = np.concatenate(segments)
+            network._segment_road = np.concatenate(segment_road)
+        network._build_grid()
+        logger.info("%d vias (%d segmentos) carregadas de %s", len(network.road_ids), len(network.segments), path)
+        return network
+
+    def _build_grid(self):
+        # Cada segmento entra em todas as células do seu retângulo envolvente
+        lo = np.floor(np.minimum(self.segments[:, :2], self.segments[:, 2:]) / self.cell_size).astype(np.int64)
+        hi = np.floor(np.maximum(self.segments[:, :2], self.segments[:, 2:]) / self.cell_size).astype(np.int64)
+        for segment_id, ((x1, y1), (x2, y2)) in enumerate(zip(lo.tolist(), hi.tolist())):
+            for cx in range(x1, x2 + 1):
+                for cy in range(y1, y2 + 1):
+                    self._cells.setdefault((cx, cy), []).append(segment_id)
+
+    def nearest(self, x, y, max_distance=None):
+        """Segmento mais próximo de cada ponto (metros), procurando em anéis de células.
+
+        Returns:
+            (road_index, distance): arrays com o índice da via (em road_ids) e a distância em
+            metros; -1 e inf para pontos sem via a menos de max_distance.
+        """
+        max_distance = config.ANALYSIS_ROAD_MAX_DISTANCE if max_distance is None else max_distance
+        x, y = np.atleast_1d(np.asarray(x, dtype=np.float64)), np.atleast_1d(np.asarray(y, dtype=np.float64))
+        roads = np.full(len(x), -1, dtype=np.int64)
+        distances = np.full(len(x), np.inf)
+        max_ring = int(math.ceil(max_distance / self.cell_size))
+        for i, (px, py) in enumerate(zip(x.tolist(), y.tolist())):
+            cx, cy = int(math.floor(px / self.cell_size)), int(math.floor(py / self.cell_size))
+            seen = set()
+            for ring in range(max_ring + 1):
+                found = set()
+                for dx in range(-ring, ring + 1):
+                    for dy in range(-ring, ring + 1):
+                        if max(abs(dx), abs(dy)) == ring:
+                            found.update(self._cells.get((cx + dx, cy + dy), ()))
+                found -= seen
+                if found:
+                    seen |= found
+                    candidates = np.fromiter(found, dtype=np.int64)
+                    dist = _point_segment_distance(px, py, self.segments[candidates])
+                    best = int(np.argmin(dist))
+                    if dist[best] < distances[i]:
+                        distances[i] = dist[best]
+                        roads[i] = self._segment_road[candidates[best]]
+                # Segmentos fora dos anéis já vistos estão a pelo menos ring * cell_size
+                if distances[i] <= ring * self.cell_size:
+                    break
+            if distances[i] > max_distance:
+                roads[i], distances[i] = -1, np.inf
+        return roads, distances
+
+
+def _point_segment_distance(px, py, segments):
+    """Distância de um ponto a cada segmento (N, 4)."""
+    start, end = segments[:, :2], segments[:, 2:]
+    direction = end - start
+    length_sq = np.maximum((direction ** 2).sum(axis=1), 1e-12)
+    t = np.clip(((px - start[:, 0]) * direction[:, 0] + (py - start[:, 1]) * direction[:, 1]) / length_sq, 0, 1)
+    closest = start + t[:, None] * direction
+    return np.hypot(closest[:, 0] - px, closest[:, 1] - py)
+
+
+# --- Ingestão ---
+
+def ingest_results(index, results_path, positions, variant_prefix="fused"):
+    """Soma ao índice as detecções de um dataset de resultados (result_store.py).
+
+    Só as variantes que começam com `variant_prefix` entram (por padrão, a fusão
+    original + CLAHE). Detecções de imagens sem posição são ignoradas.
+
+    Returns:
+        Número de buracos novos, ou None se o dataset já tinha sido ingerido.
+    """
+    from manifest import dataset_hash
+    from result_store import read_results
+
+    # O dataset pode ser uma pasta (parquet segmentado de main.py --input)
+    run_id = dataset_hash(results_path)
+    if run_id in index.runs:
+        logger.info("Dataset %s já ingerido; pulando.", results_path)
+        return None
+    df = read_results(results_path)
+    df = df[df["variant"].astype(str).str.startswith(variant_prefix)]
+    names = df["image_name"].astype(str).tolist()
+    located = np.array([name in positions for name in names], dtype=bool)
+    if len(names) and not located.all():
+        logger.warning("%d de %d detecções sem posição GPS foram ignoradas.", int((~located).sum()), len(names))
+    names = [name for name, ok in zip(names, located) if ok]
+    coords = np.array([positions[name] for name in names], dtype=np.float64).reshape(-1, 3)
+    return index.add_sightings(coords[:, 0], coords[:, 1], df["confidence"].to_numpy()[located], coords[:, 2],
+                               names, run_id)
+
+
+def ingest_tracks(index, tracks_path, track, fps=30.0, start_time=None):
+    """Soma ao índice as trilhas de um vídeo (<vídeo>_tracks.jsonl de tracking.py), uma por buraco."""
+    from manifest import file_hash
+
+    run_id = file_hash(tracks_path)
+    if run_id in index.runs:
+        logger.info("Trilhas %s já ingeridas; pulando.", tracks_path)
+        return None
+    with open(tracks_path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    video = os.path.basename(tracks_path)[:-len("_tracks.jsonl")]
+    names = [f"{video}_frame{record['best_frame']:06d}" for record in records]
+    positions = positions_from_track(names, track, fps, start_time)
+    coords = np.array([positions[name] for name in names], dtype=np.float64).reshape(-1, 3)
+    confidence = [record["best_confidence"] for record in records]
+    # Cada trilha já é um buraco distinto no vídeo: nomes únicos para que possam se fundir
+    # com buracos de outras passagens, mas não entre si
+    return index.add_sightings(coords[:, 0], coords[:, 1], confidence, coords[:, 2],
+                               [f"{video}#track{record['track_id']}" for record in records], run_id)
+
+
+def _parse_bbox(text):
+    values = [float(v) for v in text.split(",")]
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("Use lat_min,lon_min,lat_max,lon_max")
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice espacial dos buracos de vários levantamentos.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Soma uma execução ao índice")
+    ingest.add_argument("--index", required=True, help="Pasta do índice (criada se não existir)")
+    source = ingest.add_mutually_exclusive_group(required=True)
+    source.add_argument("--results", help="Dataset de detecções (ver result_store.py)")
+    source.add_argument("--tracks", help="Arquivo <vídeo>_tracks.jsonl de main.py --track")
+    ingest.add_argument("--images", action="append", help="Pasta ou padrão glob das fotos (posição no EXIF)")
+    ingest.add_argument("--positions", help="CSV com image_name, lat, lon[, timestamp]")
+    ingest.add_argument("--gps-track", help="Trajeto GPS (GPX ou CSV com time, lat, lon) para frames de vídeo")
+    ingest.add_argument("--fps", type=float, default=30.0, help="FPS do vídeo (para o horário de cada frame)")
+    ingest.add_argument("--start-time", type=_parse_time, default=None,
+                        help="Horário do frame 0 do vídeo (ISO 8601 ou epoch); padrão: início do trajeto")
+
+    query = subparsers.add_parser("query", help="Lista os buracos de uma região")
+    query.add_argument("--index", required=True)
+    query.add_argument("--bbox", type=_parse_bbox,
+                       help="lat_min,lon_min,lat_max,lon_max (com latitude negativa, use --bbox=-23.5,...)")
+    query.add_argument("--output", help="Grava o resultado em CSV")
+
+    roads = subparsers.add_parser("roads", help="Buracos por via (segmento mais próximo)")
+    roads.add_argument("--index", required=True)
+    roads.add_argument("--roads", required=True, help="GeoJSON com as vias (LineString/MultiLineString)")
+    roads.add_argument("--max-distance", type=float, default=config.ANALYSIS_ROAD_MAX_DISTANCE)
+
+    args = parser.parse_args()
+    metrics.setup_logging(config.LOG_LEVEL)
+    index = SurveyIndex.load(args.index)
+
+    if args.command == "ingest":
+        if args.tracks:
+            if not args.gps_track:
+                parser.error("--tracks requer --gps-track")
+            new = ingest_tracks(index, args.tracks, GpsTrack.from_file(args.gps_track), args.fps, args.start_time)
+        else:
+            from manifest import discover_inputs
+            from result_store import read_results
+
+            positions = {}
+            if args.images:
+                positions.update(positions_from_exif(discover_inputs(args.images)))
+            if args.positions:
+                positions.update(positions_from_csv(args.positions))
+            if args.gps_track:
+                names = read_results(args.results)["image_name"].astype(str).unique()
+                positions.update(positions_from_track(names, GpsTrack.from_file(args.gps_track), args.fps,
+                                                      args.start_time))
+            new = ingest_results(index, args.results, positions)
+        if new is not None:
+            index.save(args.index)
+            print(f"{new} buracos novos; {len(index)} no índice.")
+    elif args.command == "query":
+        ids = index.query_bbox(*args.bbox) if args.bbox else None
+        df = index.to_dataframe(ids)
+        if args.output:
+            df.to_csv(args.output, index=False)
+        print(df.to_string(index=False))
+    else:
+        if index.projection is None:
+            # Sem nenhum avistamento o índice não tem origem para projetar as vias
+            parser.error(f"O índice {args.index} está vazio: use 'ingest' antes de 'roads'.")
+        network = RoadNetwork.from_geojson(args.roads, index.projection)
+        road, distance = network.nearest(index.potholes["x"], index.potholes["y"], args.max_distance)
+        df = index.to_dataframe()
+        df["road"] = [network.road_ids[r] if r >= 0 else None for r in road]
+        df["road_distance"] = distance
+        summary = df.groupby("road", dropna=False).agg(potholes=("pothole_id", "size"),
+                                                       sightings=("sightings", "sum"))
+        print(summary.sort_values("potholes", ascending=False).to_string())
+
+
+if __name__ == "__main__":
+    main()
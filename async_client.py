@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""Cliente HTTP assíncrono para a API de detecção Roboflow (v0) e servidores compatíveis.
+
+Substitui a chamada síncrona do inference_sdk no RoboflowBackend (ver
+ROBOFLOW_HTTP_CLIENT) para usar a cota da API sem tomar 429:
+
+- pool de conexões persistentes (aiohttp) e no máximo ROBOFLOW_MAX_IN_FLIGHT
+  requisições em andamento;
+- token bucket (ROBOFLOW_RATE_LIMIT requisições/s, rajada ROBOFLOW_RATE_BURST)
+  que reduz a taxa pela metade a cada 429 e volta aos poucos com as respostas
+  bem-sucedidas. Configure ROBOFLOW_RATE_LIMIT com a cota da API: sem ele, os
+  429 só são tratados com retry;
+- retry com backoff exponencial e jitter ("full jitter") para 429, 5xx, timeouts
+  e erros de conexão, respeitando Retry-After;
+- circuit breaker: depois de ROBOFLOW_BREAKER_FAILURES falhas seguidas (5xx,
+  timeouts, erros de conexão; 429 não conta), as requisições falham na hora por ROBOFLOW_BREAKER_RESET segundos, e então uma
+  requisição de teste decide se o circuito fecha.
+
+Uma imagem que falha depois de todas as tentativas volta como exceção só para
+ela; as outras imagens do lote seguem normalmente.
+
+Teste contra o servidor mock com latência e erros injetados:
+
+    python async_client.py --requests 300 --latency-ms 50 --error-rate 0.1 --rate-limit 40
+"""
+import argparse
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Requisição recusada porque o circuit breaker está aberto."""
+
+
+class InferenceRequestError(RuntimeError):
+    """Resposta de erro da API que não adianta repetir (ex.: 400, 403)."""
+
+
+class TokenBucket:
+    """Limitador de taxa (token bucket) adaptativo, para uso em um único event loop.
+
+    Args:
+        rate: Requisições por segundo (0 ou None desliga o limite).
+        burst: Tamanho máximo da rajada (padrão: max(1, rate)).
+        min_rate_fraction: Menor fração de `rate` a que os 429 podem reduzir a taxa.
+    """
+
+    def __init__(self, rate, burst=None, min_rate_fraction=0.1):
+        self.max_rate = rate or 0.0
+        self.rate = self.max_rate
+        self.min_rate = self.max_rate * min_rate_fraction
+        self.capacity = burst or max(1.0, self.max_rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        if not self.max_rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttled(self):
+        """Resposta 429: reduz a taxa pela metade e esvazia a rajada."""
+        if self.max_rate:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            metrics.set_gauge("http_rate_limit", self.rate)
+
+    def succeeded(self):
+        """Resposta bem-sucedida: recupera a taxa aos poucos (aumento aditivo)."""
+        if self.max_rate and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+            metrics.set_gauge("http_rate_limit", self.rate)
+
+
+class CircuitBreaker:
+    """Circuit breaker de três estados (fechado, aberto, meio-aberto), para um único event loop.
+
+    Args:
+        failure_threshold: Falhas seguidas que abrem o circuito.
+        reset_timeout: Segundos com o circuito aberto antes de deixar passar uma requisição de teste.
+    """
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or config.ROBOFLOW_BREAKER_FAILURES
+        self.reset_timeout = config.ROBOFLOW_BREAKER_RESET if reset_timeout is None else reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_request(self):
+        """Levanta CircuitOpenError se a requisição não deve ser feita agora.
+
+        Returns:
+            True se esta é a requisição de teste do estado meio-aberto. O chamador deve
+            terminá-la com record_success, record_failure ou release_probe.
+        """
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("Circuit breaker aberto: API com falhas seguidas")
+            self.state = "half_open"
+            logger.info("Circuit breaker meio-aberto: enviando requisição de teste.")
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                raise CircuitOpenError("Circuit breaker meio-aberto: aguardando a requisição de teste")
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("Circuit breaker fechado: API respondendo novamente.")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """A requisição de teste terminou sem dizer se a API está saudável (ex.: 429, cancelamento)."""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            if self.state == "closed":
+                logger.warning("Circuit breaker aberto após %d falhas seguidas.", self.failures)
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+            metrics.inc("http_circuit_open_total")
+
+
+class AsyncInferenceClient:
+    """Cliente assíncrono da API de detecção (payloads em base64, como em prepare_upload).
+
+    Todos os argumentos têm padrão em config.py (ROBOFLOW_*). Use dentro de um único event
+    loop; para código síncrono, ver BackgroundLoop.
+    """
+
+    def __init__(self, api_url=None, api_key=None, model_id=None, max_in_flight=None, rate_limit=None,
+                 rate_burst=None, max_retries=None, timeout=None, backoff_base=None, backoff_max=None,
+                 failure_threshold=None, reset_timeout=None):
+        self.api_url = (api_url or config.ROBOFLOW_API_URL).rstrip("/")
+        self.api_key = api_key or config.ROBOFLOW_API_KEY
+        self.model_id = model_id or config.ROBOFLOW_MODEL_ID
+        self.max_in_flight = max_in_flight or config.ROBOFLOW_MAX_IN_FLIGHT
+        self.max_retries = config.ROBOFLOW_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or config.ROBOFLOW_TIMEOUT
+        self.backoff_base = backoff_base or config.ROBOFLOW_BACKOFF_BASE
+        self.backoff_max = backoff_max or config.ROBOFLOW_BACKOFF_MAX
+        self.bucket = TokenBucket(config.ROBOFLOW_RATE_LIMIT if rate_limit is None else rate_limit,
+                                  rate_burst or config.ROBOFLOW_RATE_BURST or None)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._session = None
+        self._semaphore = None
+        self._in_flight = 0
+
+    async def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _backoff(self, attempt, retry_after=None):
+        """Espera antes da próxima tentativa: Retry-After se houver, senão backoff exponencial com jitter."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def infer(self, payload):
+        """Envia uma imagem (base64) e retorna a lista de predições raw.
+
+        Levanta CircuitOpenError, InferenceRequestError ou o último erro depois das tentativas.
+        """
+        import aiohttp
+
+        session = await self._get_session()
+        url = f"{self.api_url}/{self.model_id}"
+        for attempt in range(self.max_retries + 1):
+            is_probe = self.breaker.before_request()
+            outcome_recorded = False
+            try:
+                await self.bucket.acquire()
+                retry_after = None
+                async with self._semaphore:
+                    self._in_flight += 1
+                    metrics.set_gauge("http_in_flight", self._in_flight)
+                    start = time.perf_counter()
+                    try:
+                        async with session.post(url, params={"api_key": self.api_key}, data=payload,
+                                                headers={"Content-Type": "application/x-www-form-urlencoded"}) as resp:
+                            metrics.inc("http_requests_total", status=str(resp.status))
+                            if resp.status == 200:
+                                result = await resp.json(content_type=None)
+                                self.breaker.record_success()
+                                outcome_recorded = True
+                                self.bucket.succeeded()
+                                return result.get("predictions", [])
+                            text = await resp.text()
+                            retry_after = resp.headers.get("Retry-After")
+                            if resp.status not in RETRYABLE_STATUS:
+                                # A API respondeu: erro do pedido, não da disponibilidade
+                                self.breaker.record_success()
+                                outcome_recorded = True
+                                raise InferenceRequestError(f"HTTP {resp.status}: {text[:200]}")
+                            throttled = resp.status == 429
+                            if throttled:
+                                self.bucket.throttled()
+                                metrics.inc("http_throttled_total")
+                            error = InferenceRequestError(f"HTTP {resp.status}: {text[:200]}")
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        metrics.inc("http_requests_total", status="error")
+                        error, throttled = e, False
+                    finally:
+                        self._in_flight -= 1
+                        metrics.set_gauge("http_in_flight", self._in_flight)
+                        metrics.observe("http_request_seconds", time.perf_counter() - start)
+                if throttled:
+                    # 429 é a API pedindo para ir mais devagar, não indisponibilidade: não conta para o breaker
+                    self.breaker.release_probe()
+                else:
+                    self.breaker.record_failure()
+                outcome_recorded = True
+            finally:
+                if is_probe and not outcome_recorded:
+                    # Cancelada ou com um erro inesperado (ex.: resposta que não é JSON): sem isso o
+                    # circuito ficaria meio-aberto esperando para sempre pela requisição de teste
+                    self.breaker.release_probe()
+            if attempt == self.max_retries:
+                raise error
+            metrics.inc("http_retries_total")
+            delay = self._backoff(attempt, retry_after)
+            logger.debug("Tentativa %d falhou (%s); nova tentativa em %.2fs.", attempt + 1, error, delay)
+            await asyncio.sleep(delay)
+
+    async def infer_many(self, payloads):
+        """Envia várias imagens em paralelo. Retorna, na ordem, as predições ou a exceção de cada uma."""
+        return await asyncio.gather(*(self.infer(payload) for payload in payloads), return_exceptions=True)
+
+
+class BackgroundLoop:
+    """Event loop em uma thread daemon, para usar o cliente assíncrono a partir de código síncrono.
+
+    Todas as threads que chamam run() compartilham o mesmo loop, então o limite de requisições
+    em andamento e o token bucket valem para o processo inteiro.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-http-client", daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+def main():
+    import base64
+
+    import cv2
+    import numpy as np
+
+    from mock_server import start_mock_server
+
+    parser = argparse.ArgumentParser(description="Teste do cliente assíncrono contra o servidor mock.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--latency-jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Fração de HTTP 500 no servidor")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Cota do servidor (requisições/s)")
+    parser.add_argument("--client-rate", type=float, default=config.ROBOFLOW_RATE_LIMIT,
+                        help="Taxa do token bucket do cliente (0 = sem limite)")
+    parser.add_argument("--max-in-flight", type=int, default=config.ROBOFLOW_MAX_IN_FLIGHT)
+    args = parser.parse_args()
+    metrics.setup_logging(config.LOG_LEVEL)
+
+    server, url = start_mock_server(latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms,
+                                    error_rate=args.error_rate, rate_limit=args.rate_limit)
+    rng = np.random.default_rng(0)
+    payloads = []
+    for _ in range(args.requests):
+        image = rng.integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        payloads.append(base64.b64encode(cv2.imencode(".jpg", image)[1].tobytes()).decode("ascii"))
+
+    async def run():
+        async with AsyncInferenceClient(api_url=url, max_in_flight=args.max_in_flight,
+                                        rate_limit=args.client_rate) as client:
+            start = time.perf_counter()
+            results = await client.infer_many(payloads)
+            return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(run())
+    server.shutdown()
+    failed = [r for r in results if isinstance(r, Exception)]
+    snapshot = metrics.get_registry().snapshot()
+    print(f"{len(payloads)} requisições em {elapsed:.2f}s ({len(payloads) / elapsed:.1f}/s), "
+          f"{len(failed)} falharam.")
+    for name, value in sorted({**snapshot["counters"], **snapshot["gauges"]}.items()):
+        if name.startswith("http_"):
+            print(f"  {name}: {value}")
+    latency = snapshot["histograms"].get("http_request_seconds")
+    if latency and latency["count"]:
+        print(f"  latência média por requisição: {latency['sum'] / latency['count'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
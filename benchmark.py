@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Benchmark offline do processamento, com tempos por estágio.
+
+Gera imagens sintéticas de asfalto com buracos em várias resoluções e mede
+cada estágio do processamento de main.py separadamente: decodificação,
+CLAHE, inferência, pós-processamento, desenho das caixas, codificação JPEG e
+gravação das detecções no dataset de resultados (result_store.py). O backend pode ser o servidor mock (mock_server.py, sem rede)
+ou um backend local (ultralytics/onnx).
+
+    python benchmark.py --backend mock --latency-ms 40 --images 20 --output bench.json
+    python benchmark.py --backend onnx --resolutions 1280x720,3840x2160 --compare bench.json
+
+O resultado é salvo em JSON (p50/p95/p99 por estágio, imagens por segundo,
+pico de memória e bytes escritos) para comparar execuções entre commits.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+import config
+from detections import Detections
+from inference_backends import RoboflowBackend, create_backend
+from input_handler import load_image
+from mock_server import start_mock_server
+from output_handler import save_image
+from result_store import ResultStore
+from yolo_processor import draw_predictions
+
+DEFAULT_RESOLUTIONS = "640x480,1280x720,1920x1080,3840x2160"
+STAGES = ("decode", "clahe", "inference", "postprocess", "draw", "encode", "results")
+
+
+def make_synthetic_road(width, height, num_potholes=3, seed=0):
+    """Gera uma imagem BGR sintética de asfalto com alguns buracos escuros."""
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(110, 18, (height, width)).astype(np.float32)
+    asphalt = cv2.GaussianBlur(noise, (0, 0), 1.5)
+    image = cv2.cvtColor(np.clip(asphalt, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    # Faixa central da pista
+    cv2.line(image, (width // 2, 0), (width // 2, height), (200, 200, 200), max(2, width // 200))
+    for _ in range(num_potholes):
+        center = (int(rng.uniform(0.1, 0.9) * width), int(rng.uniform(0.4, 0.95) * height))
+        axes = (int(rng.uniform(0.02, 0.08) * width), int(rng.uniform(0.01, 0.04) * height))
+        cv2.ellipse(image, center, axes, float(rng.uniform(0, 180)), 0, 360, (35, 35, 40), -1)
+    return image
+
+
+def percentiles(samples):
+    """p50/p95/p99, média e total (em milissegundos) de uma lista de tempos em segundos."""
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    if values.size == 0:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(values.size),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "total_ms": float(values.sum()),
+    }
+
+
+def reset_peak_rss():
+    """Zera o pico de memória residente (VmHWM) do processo. Só no Linux; retorna se conseguiu."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo (desde o último reset_peak_rss), em MB."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss é o pico desde o início do processo e não pode ser zerado
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_resolution(backend, width, height, num_images, work_dir, confidence_threshold):
+    """Executa o benchmark para uma resolução e retorna as métricas agregadas."""
+    # Importado aqui para não carregar matplotlib/pandas antes de medir o pico de memória base
+    from main import build_variants
+
+    input_dir = os.path.join(work_dir, f"{width}x{height}", "input")
+    output_dir = os.path.join(work_dir, f"{width}x{height}", "output")
+    os.makedirs(input_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i in range(num_images):
+        path = os.path.join(input_dir, f"road_{i:04d}.jpg")
+        cv2.imwrite(path, make_synthetic_road(width, height, seed=i))
+        paths.append(path)
+
+    store = ResultStore(os.path.join(output_dir, "detections"))
+    timings = defaultdict(list)
+    bytes_written = 0
+    num_detections = 0
+    failed_inferences = 0
+    # Pico só desta resolução; sem o reset (fora do Linux) o pico é o do processo e vale o aumento
+    peak_is_per_resolution = reset_peak_rss()
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+
+    for i, path in enumerate(paths):
+        t = time.perf_counter()
+        image = load_image(path)
+        timings["decode"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        variants = build_variants(image)
+        timings["clahe"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        raw_batch = backend.infer_batch(list(variants.values()))
+        timings["inference"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        # None: a inferência da imagem falhou (ex.: requisição esgotou as tentativas)
+        failed_inferences += sum(raw is None for raw in raw_batch)
+        detections = {
+            name: (Detections.empty() if raw is None
+                   else Detections.from_predictions(raw).filter_by_confidence(confidence_threshold))
+            for name, raw in zip(variants, raw_batch)
+        }
+        timings["postprocess"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        annotated = {name: draw_predictions(variants[name], detections[name]) for name in variants}
+        timings["draw"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        written = []
+        for name in variants:
+            written.append(os.path.join(output_dir, f"{i:04d}_{name}.jpg"))
+            save_image(variants[name], written[-1])
+            written.append(os.path.join(output_dir, f"{i:04d}_{name}_annotated.jpg"))
+            save_image(annotated[name], written[-1])
+        timings["encode"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        for name in variants:
+            store.append(detections[name], f"road_{i:04d}", name)
+        timings["results"].append(time.perf_counter() - t)
+
+        bytes_written += sum(os.path.getsize(p) for p in written if os.path.exists(p))
+        num_detections += sum(len(d) for d in detections.values())
+
+    store.close()
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb()
+    bytes_written += os.path.getsize(store.path) if os.path.exists(store.path) else 0
+    return {
+        "resolution": f"{width}x{height}",
+        "images": num_images,
+        "elapsed_s": elapsed,
+        "images_per_second": num_images / elapsed if elapsed else 0.0,
+        "bytes_written": bytes_written,
+        "detections": num_detections,
+        "failed_inferences": failed_inferences,
+        "peak_rss_mb": peak,
+        "peak_rss_per_resolution": peak_is_per_resolution,
+        "peak_rss_increase_mb": peak - peak_before,
+        "stages": {stage: percentiles(timings[stage]) for stage in STAGES},
+    }
+
+
+def compare(report, baseline_path):
+    """Imprime a variação do p50 de cada estágio em relação a um relatório anterior."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    baseline_by_res = {r["resolution"]: r for r in baseline.get("results", [])}
+    print(f"\nComparação com {baseline_path} (commit {baseline.get('commit')}):")
+    for result in report["results"]:
+        base = baseline_by_res.get(result["resolution"])
+        if base is None:
+            continue
+        print(f"  {result['resolution']}: {base['images_per_second']:.2f} -> {result['images_per_second']:.2f} img/s")
+        for stage in STAGES:
+            new_p50 = result["stages"][stage].get("p50_ms")
+            old_p50 = base["stages"].get(stage, {}).get("p50_ms")
+            if new_p50 is None or not old_p50:
+                continue
+            change = (new_p50 - old_p50) / old_p50
+            flag = "  <-- regressão" if change > 0.10 else ""
+            print(f"    {stage:<12} p50 {old_p50:8.2f} -> {new_p50:8.2f} ms ({change:+.1%}){flag}")
+
+
+def parse_resolutions(text):
+    resolutions = []
+    for item in text.split(","):
+        width, height = item.lower().split("x")
+        resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline por estágio do processamento de imagens.")
+    parser.add_argument("--backend", default="mock", help="'mock' (servidor local), 'roboflow', 'ultralytics' ou 'onnx'")
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS, help="Lista LARGURAxALTURA separada por vírgulas")
+    parser.add_argument("--images", type=int, default=10, help="Imagens sintéticas por resolução")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latência artificial do servidor mock")
+    parser.add_argument("--confidence", type=float, default=0.25)
+    parser.add_argument("--output", default="benchmark_results.json", help="Arquivo JSON de saída")
+    parser.add_argument("--compare", help="Relatório JSON anterior para comparar")
+    parser.add_argument("--work-dir", help="Diretório para as imagens e saídas (padrão: temporário)")
+    args = parser.parse_args()
+
+    server = None
+    if args.backend == "mock":
+        server, url = start_mock_server(latency_ms=args.latency_ms)
+        backend = RoboflowBackend(api_url=url)
+    else:
+        backend = create_backend(args.backend)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "backend": args.backend,
+        "mock_latency_ms": args.latency_ms if args.backend == "mock" else None,
+        "inference_batch_size": config.INFERENCE_BATCH_SIZE,
+        "results": [],
+    }
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            work_dir = args.work_dir or tmp_dir
+            for width, height in parse_resolutions(args.resolutions):
+                print(f"\nBenchmark {width}x{height} ({args.images} imagens)...")
+                result = run_resolution(backend, width, height, args.images, work_dir, args.confidence)
+                report["results"].append(result)
+                print(f"  {result['images_per_second']:.2f} img/s, pico de memória {result['peak_rss_mb']:.0f} MB "
+                      f"(+{result['peak_rss_increase_mb']:.0f} MB nesta resolução)")
+                if result["failed_inferences"]:
+                    print(f"  {result['failed_inferences']} inferências falharam (contadas como sem detecções)")
+                for stage in STAGES:
+                    s = result["stages"][stage]
+                    print(f"  {stage:<12} p50 {s['p50_ms']:8.2f} ms  p95 {s['p95_ms']:8.2f} ms  p99 {s['p99_ms']:8.2f} ms")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResultados salvos em {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Cache persistente das predições raw retornadas pelos backends de inferência.
+
+A chave é o hash do conteúdo da imagem (pixels, shape e dtype) combinado com a
+identificação do modelo e a variante de pré-processamento, então reprocessar o
+mesmo conjunto de imagens não chama o backend de novo. Como o filtro por
+confidence_threshold é aplicado depois do cache, varrer limiares também sai
+praticamente de graça.
+
+Há dois níveis: um LRU em memória e um diretório em disco (um arquivo JSON por
+entrada) limitado em bytes, com remoção das entradas usadas há mais tempo.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(image, model_key, variant=None):
+    """Calcula a chave do cache para uma imagem BGR, um modelo e uma variante de pré-processamento."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{model_key}|{variant or ''}|{image.shape}|{image.dtype}|".encode("utf-8"))
+    if image.flags["C_CONTIGUOUS"]:
+        h.update(memoryview(image).cast("B"))
+    else:
+        # Views (ex.: tiles) são hasheadas linha a linha para não copiar a imagem inteira
+        for row in image:
+            h.update(memoryview(np.ascontiguousarray(row)).cast("B"))
+    return h.hexdigest()
+
+
+class InferenceCache:
+    """Cache de predições em dois níveis (memória + disco) com remoção LRU.
+
+    Args:
+        cache_dir: Diretório do nível em disco. None desativa o nível em disco.
+        max_bytes: Tamanho máximo do nível em disco.
+        max_memory_entries: Número máximo de entradas no nível em memória.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 * 1024, max_memory_entries=1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_memory_entries = max_memory_entries
+
+        self._memory = OrderedDict()
+        # key -> (tamanho em bytes, último acesso) das entradas em disco
+        self._disk_index = {}
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_disk_index(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for file_name in files:
+                if not file_name.endswith(".json"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, file_name))
+                except OSError:
+                    continue
+                self._disk_index[file_name[:-5]] = (st.st_size, st.st_mtime)
+                self._disk_bytes += st.st_size
+
+    def _remember(self, key, predictions):
+        self._memory[key] = predictions
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Retorna uma cópia das predições raw guardadas para a chave, ou None."""
+        with self._lock:
+            predictions = self._memory.get(key)
+            if predictions is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return [dict(p) for p in predictions]
+            in_disk = key in self._disk_index
+
+        if in_disk:
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    predictions = json.load(f)
+                now = time.time()
+                # mtime marca o último uso (atime costuma estar desativado)
+                os.utime(path, (now, now))
+            except (OSError, ValueError):
+                predictions = None
+            with self._lock:
+                if predictions is not None:
+                    self._disk_index[key] = (self._disk_index.get(key, (0, 0))[0], now)
+                    self._remember(key, predictions)
+                    self._stats["disk_hits"] += 1
+                    return [dict(p) for p in predictions]
+                self._forget_disk(key)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key, predictions):
+        """Guarda as predições raw da chave nos dois níveis."""
+        predictions = [dict(p) for p in predictions]
+        with self._lock:
+            self._remember(key, predictions)
+            self._stats["writes"] += 1
+        if not self.cache_dir:
+            return
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = json.dumps(predictions).encode("utf-8")
+            # Escreve em arquivo temporário e renomeia para nunca deixar uma entrada pela metade
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error("Erro ao gravar entrada do cache de inferência em %s: %s", path, e)
+            return
+
+        with self._lock:
+            self._forget_disk(key)
+            self._disk_index[key] = (len(data), time.time())
+            self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _forget_disk(self, key):
+        size, _ = self._disk_index.pop(key, (0, 0))
+        self._disk_bytes -= size
+
+    def _evict(self):
+        # Remove as entradas usadas há mais tempo até ficar 10% abaixo do limite
+        target = self.max_bytes * 0.9
+        for key, _ in sorted(self._disk_index.items(), key=lambda item: item[1][1]):
+            if self._disk_bytes <= target:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._forget_disk(key)
+            self._stats["evictions"] += 1
+
+    def stats(self):
+        """Retorna contadores de acertos/faltas, taxa de acerto e ocupação do cache."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = len(self._disk_index)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """Remove todas as entradas dos dois níveis."""
+        with self._lock:
+            keys = list(self._disk_index)
+            self._memory.clear()
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_index.clear()
+            self._disk_bytes = 0
+
+
+# Cache padrão, criado sob demanda por get_cache()
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Retorna o cache padrão (config.INFERENCE_CACHE_*), ou None se o cache estiver desativado."""
+    global _default_cache
+    if not config.INFERENCE_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = InferenceCache(
+                cache_dir=config.INFERENCE_CACHE_DIR,
+                max_bytes=config.INFERENCE_CACHE_MAX_BYTES,
+                max_memory_entries=config.INFERENCE_CACHE_MEMORY_ENTRIES,
+            )
+    return _default_cache
@@ -1,3 +1,6 @@
+import functools
+import threading
+
 import cv2
 import numpy as np
 
@@ -11,6 +14,24 @@ def apply_gaussian_blur(image, kernel_size=(5, 5)):
     """Aplica um filtro Gaussiano na imagem."""
     return cv2.GaussianBlur(image, kernel_size, 0)
 
+_clahe_local = threading.local()
+
+def _get_clahe(clip_limit, tile_grid_size):
+    """Objeto CLAHE em cache, um por thread e por combinação de parâmetros."""
+    cache = getattr(_clahe_local, "objects", None)
+    if cache is None:
+        cache = _clahe_local.objects = {}
+    key = (float(clip_limit), tuple(tile_grid_size))
+    clahe = cache.get(key)
+    if clahe is None:
+        clahe = cache[key] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid_size))
+    return clahe
+
+def apply_clahe(image, clip_limit=2.0, tile_grid_size=(8, 8)):
+    """Aplica CLAHE (Contrast Limited Adaptive Histogram Equalization) na imagem."""
+    gray_image = convert_to_grayscale(image)
+    return _get_clahe(clip_limit, tile_grid_size).apply(gray_image)
+
 def detect_edges_canny(image, low_threshold=50, high_threshold=150):
     """Detecta bordas usando o algoritmo Canny."""
     # Canny funciona melhor em escala de cinza
@@ -24,17 +45,176 @@ def apply_thresholding(image, threshold_value=127, max_value=255, threshold_type
     _, thresh_image = cv2.threshold(gray_image, threshold_value, max_value, threshold_type)
     return thresh_image
 
+@functools.lru_cache(maxsize=32)
+def _morph_kernel(kernel_size):
+    kernel = np.ones(kernel_size, np.uint8)
+    kernel.flags.writeable = False
+    return kernel
+
+@functools.lru_cache(maxsize=32)
+def _gamma_lut(gamma):
+    """Tabela de 256 valores para a correção gama (saída = 255 * (entrada / 255) ** gamma)."""
+    lut = np.clip(255.0 * (np.arange(256) / 255.0) ** gamma + 0.5, 0, 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+def apply_gamma(image, gamma=1.0):
+    """Aplica correção gama (gamma < 1 clareia as sombras, gamma > 1 escurece)."""
+    return cv2.LUT(image, _gamma_lut(float(gamma)))
+
 # Funções de morfologia podem ser adicionadas aqui (erosão, dilatação, etc.)
 def apply_erosion(image, kernel_size=(5,5), iterations=1):
     """Aplica erosão morfológica."""
-    kernel = np.ones(kernel_size, np.uint8)
-    return cv2.erode(image, kernel, iterations=iterations)
+    return cv2.erode(image, _morph_kernel(tuple(kernel_size)), iterations=iterations)
 
 def apply_dilation(image, kernel_size=(5,5), iterations=1):
     """Aplica dilatação morfológica."""
-    kernel = np.ones(kernel_size, np.uint8)
-    return cv2.dilate(image, kernel, iterations=iterations)
+    return cv2.dilate(image, _morph_kernel(tuple(kernel_size)), iterations=iterations)
 
 # Outras técnicas como segmentação por cor, textura, subtração de fundo seriam mais complexas
 # e podem ser adicionadas conforme a necessidade específica da aplicação.
 
+
+class PreprocessingPipeline:
+    """Cadeia pré-compilada de operações de pré-processamento.
+
+    As operações são montadas uma vez (objetos CLAHE e kernels de morfologia ficam
+    em cache) e cada etapa escreve em um buffer pré-alocado via argumento `dst` do
+    OpenCV. Os buffers e os objetos CLAHE são guardados por thread, então a mesma
+    instância pode ser usada pelas várias threads de um estágio do pipeline sem
+    alocar memória por frame (só a saída, se copy_output=True).
+
+    Etapas (nome ou tupla (nome, parâmetros)):
+        "grayscale", ("blur", {"kernel_size": (5, 5)}), ("gamma", {"gamma": 1.0}),
+        ("clahe", {"clip_limit": 2.0, "tile_grid_size": (8, 8)}),
+        ("canny", {"low_threshold": 50, "high_threshold": 150}),
+        ("threshold", {"threshold_value": 127, "max_value": 255, "threshold_type": cv2.THRESH_BINARY}),
+        ("erode", {"kernel_size": (5, 5), "iterations": 1}), ("dilate", {...}),
+        "bgr" (escala de cinza -> BGR).
+
+    Exemplo:
+        clahe_bgr = PreprocessingPipeline(["grayscale", ("clahe", {"clip_limit": 2.0}), "bgr"])
+        variant = clahe_bgr.apply(frame)
+    """
+
+    OPERATIONS = ("grayscale", "blur", "gamma", "clahe", "canny", "threshold", "erode", "dilate", "bgr")
+
+    def __init__(self, steps):
+        self.steps = []
+        for step in steps:
+            name, params = (step, {}) if isinstance(step, str) else (step[0], dict(step[1]))
+            if name not in self.OPERATIONS:
+                raise ValueError(f"Operação de pré-processamento desconhecida: {name}. "
+                                 f"Opções: {', '.join(self.OPERATIONS)}")
+            self.steps.append((name, params))
+        self._compiled = [self._compile(index, name, params) for index, (name, params) in enumerate(self.steps)]
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f"PreprocessingPipeline({self.steps})"
+
+    def _buffer(self, index, shape, dtype=np.uint8):
+        """Buffer de saída da etapa `index` nesta thread (realocado só se o tamanho mudar)."""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get(index)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = buffers[index] = np.empty(shape, dtype)
+        return buffer
+
+    def _compile(self, index, name, params):
+        """Retorna uma função fn(src, dst) -> imagem para a etapa. dst pode ser None."""
+        if name == "grayscale":
+            def fn(src, dst):
+                if src.ndim == 2:
+                    return src
+                dst = self._out(index, src.shape[:2], dst)
+                return cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=dst)
+        elif name == "bgr":
+            def fn(src, dst):
+                if src.ndim == 3:
+                    return src
+                dst = self._out(index, src.shape + (3,), dst)
+                return cv2.cvtColor(src, cv2.COLOR_GRAY2BGR, dst=dst)
+        elif name == "blur":
+            kernel_size = tuple(params.get("kernel_size", (5, 5)))
+
+            def fn(src, dst):
+                return cv2.GaussianBlur(src, kernel_size, 0, dst=self._out(index, src.shape, dst))
+        elif name == "gamma":
+            lut = _gamma_lut(float(params.get("gamma", 1.0)))
+
+            def fn(src, dst):
+                return cv2.LUT(src, lut, dst=self._out(index, src.shape, dst))
+        elif name == "clahe":
+            clip_limit = params.get("clip_limit", 2.0)
+            tile_grid_size = tuple(params.get("tile_grid_size", (8, 8)))
+
+            def fn(src, dst):
+                clahe = _get_clahe(clip_limit, tile_grid_size)
+                return clahe.apply(src, dst=self._out(index, src.shape, dst))
+        elif name == "canny":
+            low, high = params.get("low_threshold", 50), params.get("high_threshold", 150)
+
+            def fn(src, dst):
+                return cv2.Canny(src, low, high, edges=self._out(index, src.shape[:2], dst))
+        elif name == "threshold":
+            value = params.get("threshold_value", 127)
+            max_value = params.get("max_value", 255)
+            threshold_type = params.get("threshold_type", cv2.THRESH_BINARY)
+
+            def fn(src, dst):
+                return cv2.threshold(src, value, max_value, threshold_type, dst=self._out(index, src.shape, dst))[1]
+        else:
+            kernel = _morph_kernel(tuple(params.get("kernel_size", (5, 5))))
+            iterations = params.get("iterations", 1)
+            morph = cv2.erode if name == "erode" else cv2.dilate
+
+            def fn(src, dst):
+                return morph(src, kernel, dst=self._out(index, src.shape, dst), iterations=iterations)
+        return fn
+
+    def _out(self, index, shape, dst):
+        if dst is _NEW:
+            return np.empty(shape, np.uint8)
+        if dst is not None:
+            return dst
+        return self._buffer(index, shape)
+
+    def apply(self, image, out=None, copy_output=True):
+        """Aplica a cadeia de operações à imagem.
+
+        Args:
+            image: Imagem de entrada (BGR ou escala de cinza). Não é modificada.
+            out: Array de saída pré-alocado para a última etapa (opcional).
+            copy_output: Se True (padrão) e `out` não for informado, a saída é um array novo,
+                         que pode seguir para outros estágios do pipeline. Se False, a saída é
+                         o buffer interno da thread, válido só até a próxima chamada nela.
+
+        Returns:
+            Imagem processada.
+        """
+        result = image
+        last = len(self._compiled) - 1
+        for index, fn in enumerate(self._compiled):
+            dst = None
+            if index == last:
+                dst = out if out is not None else (_NEW if copy_output else None)
+            result = fn(result, dst)
+        # A última etapa pode não ter feito nada (ex.: "bgr" em imagem já colorida) e devolvido
+        # a entrada ou o buffer de uma etapa anterior
+        if out is not None and result is not out:
+            np.copyto(out, result)
+            result = out
+        elif copy_output and out is None and (result is image or self._is_internal(result)):
+            result = result.copy()
+        return result
+
+    def _is_internal(self, array):
+        buffers = getattr(self._local, "buffers", {})
+        return any(array is buffer for buffer in buffers.values())
+
+
+# Marcador para "alocar a saída" na última etapa
+_NEW = object()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Configurações compartilhadas pelos módulos do projeto.
+
+Os valores podem ser sobrescritos por variáveis de ambiente, o que permite
+trocar o backend de inferência sem editar o código.
+"""
+import os
+
+# --- Configuração Roboflow ---
+ROBOFLOW_API_KEY = os.environ.get("ROBOFLOW_API_KEY", "d3nDPMwWE1xqV74ma2MN")
+ROBOFLOW_MODEL_ID = os.environ.get("ROBOFLOW_MODEL_ID", "pothole-detection-yolov8/1")
+ROBOFLOW_API_URL = os.environ.get("ROBOFLOW_API_URL", "https://detect.roboflow.com")
+# Requisições simultâneas feitas pelo inference_sdk quando recebe uma lista de imagens
+ROBOFLOW_MAX_CONCURRENT_REQUESTS = int(os.environ.get("ROBOFLOW_MAX_CONCURRENT_REQUESTS", "4"))
+# Maior lado (px) das imagens enviadas à API; o servidor reduz para a entrada do modelo de qualquer
+# forma, então enviar a resolução original só gasta banda (0 envia a imagem inteira)
+ROBOFLOW_UPLOAD_MAX_SIZE = int(os.environ.get("ROBOFLOW_UPLOAD_MAX_SIZE", "640"))
+# Qualidade JPEG inicial e tamanho alvo por imagem enviada (0 desliga a qualidade adaptativa)
+ROBOFLOW_JPEG_QUALITY = int(os.environ.get("ROBOFLOW_JPEG_QUALITY", "90"))
+ROBOFLOW_UPLOAD_MAX_BYTES = int(os.environ.get("ROBOFLOW_UPLOAD_MAX_BYTES", "120000"))
+# Cliente HTTP: "async" (async_client.py: pool, limite de taxa, retry e circuit breaker) ou "sdk" (inference_sdk)
+ROBOFLOW_HTTP_CLIENT = os.environ.get("ROBOFLOW_HTTP_CLIENT", "async")
+# Cliente assíncrono: requisições simultâneas, cota (requisições/s, 0 = sem limite) e rajada
+ROBOFLOW_MAX_IN_FLIGHT = int(os.environ.get("ROBOFLOW_MAX_IN_FLIGHT", "8"))
+ROBOFLOW_RATE_LIMIT = float(os.environ.get("ROBOFLOW_RATE_LIMIT", "0"))
+ROBOFLOW_RATE_BURST = float(os.environ.get("ROBOFLOW_RATE_BURST", "0"))
+# Tentativas extras, timeout (s) por requisição e backoff exponencial com jitter (s)
+ROBOFLOW_MAX_RETRIES = int(os.environ.get("ROBOFLOW_MAX_RETRIES", "4"))
+ROBOFLOW_TIMEOUT = float(os.environ.get("ROBOFLOW_TIMEOUT", "30"))
+ROBOFLOW_BACKOFF_BASE = float(os.environ.get("ROBOFLOW_BACKOFF_BASE", "0.25"))
+ROBOFLOW_BACKOFF_MAX = float(os.environ.get("ROBOFLOW_BACKOFF_MAX", "8"))
+# Circuit breaker: falhas seguidas que abrem o circuito e segundos até a requisição de teste
+ROBOFLOW_BREAKER_FAILURES = int(os.environ.get("ROBOFLOW_BREAKER_FAILURES", "10"))
+ROBOFLOW_BREAKER_RESET = float(os.environ.get("ROBOFLOW_BREAKER_RESET", "15"))
+
+# --- Backend de inferência ---
+# "roboflow"    -> API HTTP hospedada (ou o servidor local de mock_server.py)
+# "ultralytics" -> modelo YOLOv8 local (.pt) executado na CPU
+# "onnx"        -> modelo YOLOv8 exportado em ONNX (onnxruntime ou OpenCV DNN)
+# "service"     -> serviço residente de service.py (qualquer um dos anteriores, já aquecido)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "roboflow")
+# Número máximo de imagens por chamada ao backend em detect_objects_yolo_batch
+INFERENCE_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", "8"))
+
+LOCAL_MODEL_PATH = os.environ.get("LOCAL_MODEL_PATH", "./modelos/pothole_yolov8.pt")
+LOCAL_ONNX_PATH = os.environ.get("LOCAL_ONNX_PATH", "./modelos/pothole_yolov8.onnx")
+LOCAL_INPUT_SIZE = int(os.environ.get("LOCAL_INPUT_SIZE", "640"))
+LOCAL_IOU_THRESHOLD = float(os.environ.get("LOCAL_IOU_THRESHOLD", "0.45"))
+# Confiança mínima usada dentro do backend local; o filtro final continua
+# sendo o confidence_threshold de detect_objects_yolo.
+LOCAL_MIN_CONFIDENCE = float(os.environ.get("LOCAL_MIN_CONFIDENCE", "0.05"))
+# "onnxruntime" ou "opencv" (cv2.dnn)
+ONNX_ENGINE = os.environ.get("ONNX_ENGINE", "onnxruntime")
+# Nomes das classes do modelo local, na ordem dos class ids
+LOCAL_CLASS_NAMES = os.environ.get("LOCAL_CLASS_NAMES", "Potholes").split(",")
+
+# --- Inferência em tiles (tiling.py) ---
+# 0 desativa; com valor > 0 cada imagem é dividida em tiles TILE_SIZE x TILE_SIZE
+TILE_SIZE = int(os.environ.get("TILE_SIZE", "0"))
+TILE_OVERLAP = float(os.environ.get("TILE_OVERLAP", "0.2"))
+# Sobreposição (interseção sobre a menor caixa) a partir da qual caixas de tiles vizinhos são unidas
+TILE_MERGE_THRESHOLD = float(os.environ.get("TILE_MERGE_THRESHOLD", "0.6"))
+
+# --- Fusão de detecções (fusion.py) ---
+# "wbf" (weighted box fusion), "soft_nms" ou "nms"
+FUSION_STRATEGY = os.environ.get("FUSION_STRATEGY", "wbf")
+FUSION_IOU_THRESHOLD = float(os.environ.get("FUSION_IOU_THRESHOLD", "0.55"))
+SOFT_NMS_SIGMA = float(os.environ.get("SOFT_NMS_SIGMA", "0.5"))
+# Confiança abaixo da qual a soft-NMS descarta as caixas que teve a confiança reduzida
+SOFT_NMS_MIN_SCORE = float(os.environ.get("SOFT_NMS_MIN_SCORE", "0.05"))
+
+# --- Cache de inferência (cache.py) ---
+INFERENCE_CACHE_ENABLED = os.environ.get("INFERENCE_CACHE_ENABLED", "1") not in ("0", "false", "False")
+INFERENCE_CACHE_DIR = os.environ.get("INFERENCE_CACHE_DIR", "./.inference_cache")
+INFERENCE_CACHE_MAX_BYTES = int(os.environ.get("INFERENCE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+INFERENCE_CACHE_MEMORY_ENTRIES = int(os.environ.get("INFERENCE_CACHE_MEMORY_ENTRIES", "1024"))
+
+# --- Pipeline (pipeline.py) ---
+# Threads por estágio; OpenCV e as chamadas HTTP liberam o GIL
+PIPELINE_DECODE_WORKERS = int(os.environ.get("PIPELINE_DECODE_WORKERS", "4"))
+PIPELINE_PREPROCESS_WORKERS = int(os.environ.get("PIPELINE_PREPROCESS_WORKERS", "2"))
+PIPELINE_INFER_WORKERS = int(os.environ.get("PIPELINE_INFER_WORKERS", "2"))
+PIPELINE_WRITE_WORKERS = int(os.environ.get("PIPELINE_WRITE_WORKERS", "4"))
+# Tamanho máximo de cada fila entre estágios (limita a memória em uso)
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "16"))
+# Imagens agrupadas por lote no estágio de inferência (cada imagem gera duas entradas: original e CLAHE)
+PIPELINE_INFER_BATCH_IMAGES = int(os.environ.get("PIPELINE_INFER_BATCH_IMAGES", "4"))
+
+# --- Métricas e logging (metrics.py) ---
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") not in ("0", "false", "False")
+# "none", "prometheus" (HTTP em /metrics) ou "jsonl"
+METRICS_EXPORTER = os.environ.get("METRICS_EXPORTER", "none")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+METRICS_JSONL_PATH = os.environ.get("METRICS_JSONL_PATH", "./metrics.jsonl")
+METRICS_JSONL_INTERVAL = float(os.environ.get("METRICS_JSONL_INTERVAL", "10"))
+# DEBUG, INFO, WARNING (modo silencioso), ERROR
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+
+# --- Armazenamento dos resultados (result_store.py) ---
+# "auto" (parquet se pyarrow estiver instalado, senão binary), "parquet", "binary" ou "jsonl"
+RESULT_STORE_FORMAT = os.environ.get("RESULT_STORE_FORMAT", "auto")
+# Detecções acumuladas em memória antes de gravar um bloco (row group)
+RESULT_STORE_FLUSH_ROWS = int(os.environ.get("RESULT_STORE_FLUSH_ROWS", "4096"))
+
+# --- Pré-filtro clássico (prefilter.py) ---
+# Com o pré-filtro ligado, frames/tiles com score abaixo do limiar não vão para o detector
+PREFILTER_ENABLED = os.environ.get("PREFILTER_ENABLED", "0") not in ("0", "false", "False")
+PREFILTER_THRESHOLD = float(os.environ.get("PREFILTER_THRESHOLD", "0.2"))
+# Largura (px) da imagem reduzida em que as features são calculadas
+PREFILTER_WORK_WIDTH = int(os.environ.get("PREFILTER_WORK_WIDTH", "320"))
+# Pixels abaixo de mediana * PREFILTER_DARK_RATIO contam como mancha escura
+PREFILTER_DARK_RATIO = float(os.environ.get("PREFILTER_DARK_RATIO", "0.6"))
+# Valores de referência (em que cada feature satura em 1) e pesos de
+# densidade de bordas, fração de manchas escuras e textura
+PREFILTER_REFERENCES = (0.08, 0.02, 20.0)
+PREFILTER_WEIGHTS = (0.4, 0.4, 0.2)
+
+# --- Rastreamento em vídeo (tracking.py) ---
+# Com --track, o detector roda só em keyframes e as caixas são propagadas entre eles
+# Keyframe a cada N frames (no modo adaptativo, o máximo de frames entre keyframes)
+TRACK_KEYFRAME_STRIDE = int(os.environ.get("TRACK_KEYFRAME_STRIDE", "10"))
+# Modo adaptativo: também gera um keyframe quando a cena se desloca mais que
+# TRACK_MOTION_THRESHOLD (fração da largura do frame) desde o último keyframe
+TRACK_ADAPTIVE_KEYFRAMES = os.environ.get("TRACK_ADAPTIVE_KEYFRAMES", "1") not in ("0", "false", "False")
+TRACK_MOTION_THRESHOLD = float(os.environ.get("TRACK_MOTION_THRESHOLD", "0.15"))
+# IoU mínimo entre a caixa propagada e a detecção para continuar a mesma trilha
+TRACK_IOU_THRESHOLD = float(os.environ.get("TRACK_IOU_THRESHOLD", "0.3"))
+# Keyframes seguidos sem detecção antes de encerrar a trilha
+TRACK_MAX_MISSES = int(os.environ.get("TRACK_MAX_MISSES", "2"))
+# Detecções mínimas para uma trilha entrar no resultado
+TRACK_MIN_HITS = int(os.environ.get("TRACK_MIN_HITS", "1"))
+# Largura (px) do frame reduzido usado no fluxo óptico
+TRACK_WORK_WIDTH = int(os.environ.get("TRACK_WORK_WIDTH", "640"))
+
+# --- Análise espacial (analysis.py) ---
+# Lado (m) das células da grade do índice espacial
+ANALYSIS_CELL_SIZE = float(os.environ.get("ANALYSIS_CELL_SIZE", "25"))
+# Avistamentos a menos de ANALYSIS_MERGE_RADIUS metros são o mesmo buraco (erro típico do GPS)
+ANALYSIS_MERGE_RADIUS = float(os.environ.get("ANALYSIS_MERGE_RADIUS", "8"))
+# Distância máxima (m) de um buraco até a via mais próxima
+ANALYSIS_ROAD_MAX_DISTANCE = float(os.environ.get("ANALYSIS_ROAD_MAX_DISTANCE", "30"))
+
+# --- Serviço de inferência residente (service.py) ---
+# Endereço do serviço: "unix:///caminho.sock" ou "http://127.0.0.1:porta"
+INFERENCE_SERVICE_ADDRESS = os.environ.get("INFERENCE_SERVICE_ADDRESS", "unix:///tmp/detectar_buracos.sock")
+# Quanto o serviço espera (ms) por outros pedidos antes de enviar um lote ao backend
+SERVICE_BATCH_DEADLINE_MS = float(os.environ.get("SERVICE_BATCH_DEADLINE_MS", "10"))
+
+# --- Avaliação com labels (evaluation.py) ---
+# Processos que aplicam as configurações de pré-processamento e chamam o backend em paralelo
+EVALUATION_WORKERS = int(os.environ.get("EVALUATION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Imagens por tarefa enviada a cada processo
+EVALUATION_CHUNK_SIZE = int(os.environ.get("EVALUATION_CHUNK_SIZE", "16"))
+# IoU mínimo para uma detecção contar como acerto na precisão/recall (o mAP50-95 usa 0.5 a 0.95)
+EVALUATION_IOU_THRESHOLD = float(os.environ.get("EVALUATION_IOU_THRESHOLD", "0.5"))
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Representação colunar (NumPy) de um conjunto de detecções.
+
+Em vez de um dicionário por predição, as detecções ficam em arrays:
+caixas xyxy float32 Nx4, confiança float32, class id int32 e image/frame id
+int64. Filtros, recortes, IoU e NMS são operações vetorizadas sobre esses
+arrays, e a exportação para pandas/Arrow reaproveita a memória dos arrays.
+"""
+import logging
+
+import numpy as np
+
+from utils import box_iou_matrix, nms
+
+logger = logging.getLogger(__name__)
+
+
+class Detections:
+    """Conjunto de detecções em arrays NumPy.
+
+    Args:
+        xyxy: Caixas [x1, y1, x2, y2], array Nx4. Guardado em ordem de colunas (Fortran),
+              para que cada coordenada seja um array contíguo na exportação.
+        confidence: Confiança de cada detecção (N).
+        class_id: Id da classe de cada detecção (N).
+        image_id: Id da imagem/frame de cada detecção (N), ou um inteiro para todas.
+        class_names: Dicionário {class_id: nome}.
+    """
+
+    __slots__ = ("xyxy", "confidence", "class_id", "image_id", "class_names")
+
+    def __init__(self, xyxy=None, confidence=None, class_id=None, image_id=0, class_names=None):
+        self.xyxy = np.asfortranarray(
+            np.zeros((0, 4), np.float32) if xyxy is None else np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        )
+        n = len(self.xyxy)
+        self.confidence = np.zeros(n, np.float32) if confidence is None else np.asarray(confidence, dtype=np.float32).reshape(-1)
+        self.class_id = np.zeros(n, np.int32) if class_id is None else np.asarray(class_id, dtype=np.int32).reshape(-1)
+        if np.isscalar(image_id):
+            self.image_id = np.full(n, image_id, dtype=np.int64)
+        else:
+            self.image_id = np.asarray(image_id, dtype=np.int64).reshape(-1)
+        self.class_names = dict(class_names or {})
+
+    @classmethod
+    def empty(cls, class_names=None):
+        return cls(class_names=class_names)
+
+    @classmethod
+    def from_xywh(cls, xywh, confidence, class_id=None, image_id=0, class_names=None):
+        """Cria a partir de caixas no formato centro/tamanho (x, y, width, height)."""
+        xywh = np.asarray(xywh, dtype=np.float32).reshape(-1, 4)
+        half = xywh[:, 2:] / 2
+        xyxy = np.concatenate([xywh[:, :2] - half, xywh[:, :2] + half], axis=1)
+        return cls(xyxy, confidence, class_id, image_id, class_names)
+
+    @classmethod
+    def from_predictions(cls, predictions, image_id=0):
+        """Cria a partir das predições raw (formato Roboflow) retornadas pelos backends.
+
+        Predições sem 'x', 'y', 'width', 'height' ou 'confidence' são ignoradas.
+        """
+        required = ("x", "y", "width", "height", "confidence")
+        valid = [p for p in predictions if all(k in p for k in required)]
+        skipped = len(predictions) - len(valid)
+        if skipped:
+            logger.warning("%d predições raw sem as chaves esperadas %s foram ignoradas.", skipped, required)
+        if not valid:
+            return cls.empty()
+
+        values = np.array([[p["x"], p["y"], p["width"], p["height"], p["confidence"]] for p in valid],
+                          dtype=np.float32)
+        class_ids = np.array([p.get("class_id", 0) for p in valid], dtype=np.int32)
+        class_names = {int(c): p["class"] for c, p in zip(class_ids, valid) if "class" in p}
+        return cls.from_xywh(values[:, :4], values[:, 4], class_ids, image_id, class_names)
+
+    @classmethod
+    def concatenate(cls, detections_list):
+        """Junta vários conjuntos de detecções em um só."""
+        detections_list = [d for d in detections_list if d is not None]
+        if not detections_list:
+            return cls.empty()
+        class_names = {}
+        for d in detections_list:
+            class_names.update(d.class_names)
+        return cls(
+            np.concatenate([d.xyxy for d in detections_list]),
+            np.concatenate([d.confidence for d in detections_list]),
+            np.concatenate([d.class_id for d in detections_list]),
+            np.concatenate([d.image_id for d in detections_list]),
+            class_names,
+        )
+
+    def __len__(self):
+        return len(self.confidence)
+
+    def __getitem__(self, index):
+        """Seleciona detecções por máscara booleana, índices ou fatia."""
+        if isinstance(index, (int, np.integer)):
+            index = [index]
+        return Detections(self.xyxy[index], self.confidence[index], self.class_id[index],
+                          self.image_id[index], self.class_names)
+
+    def __repr__(self):
+        return f"Detections(n={len(self)}, classes={self.class_names})"
+
+    @property
+    def xywh(self):
+        """Caixas no formato centro/tamanho (x, y, width, height)."""
+        wh = self.xyxy[:, 2:] - self.xyxy[:, :2]
+        return np.concatenate([self.xyxy[:, :2] + wh / 2, wh], axis=1)
+
+    @property
+    def area(self):
+        return (self.xyxy[:, 2] - self.xyxy[:, 0]) * (self.xyxy[:, 3] - self.xyxy[:, 1])
+
+    def filter_by_confidence(self, threshold):
+        return self[self.confidence >= threshold]
+
+    def clip(self, width, height):
+        """Limita as caixas às dimensões da imagem."""
+        xyxy = self.xyxy.copy(order="F")
+        xyxy[:, 0] = np.clip(xyxy[:, 0], 0, width)
+        xyxy[:, 2] = np.clip(xyxy[:, 2], 0, width)
+        xyxy[:, 1] = np.clip(xyxy[:, 1], 0, height)
+        xyxy[:, 3] = np.clip(xyxy[:, 3], 0, height)
+        return Detections(xyxy, self.confidence, self.class_id, self.image_id, self.class_names)
+
+    def offset(self, dx, dy):
+        """Desloca as caixas (ex.: de coordenadas de um tile para a imagem inteira)."""
+        return Detections(self.xyxy + np.array([dx, dy, dx, dy], dtype=np.float32),
+                          self.confidence, self.class_id, self.image_id, self.class_names)
+
+    def with_image_id(self, image_id):
+        return Detections(self.xyxy, self.confidence, self.class_id, image_id, self.class_names)
+
+    def iou(self, other, metric="iou"):
+        """Matriz len(self) x len(other) de IoU (ou "ios") entre as caixas."""
+        return box_iou_matrix(self.xyxy, other.xyxy, metric=metric)
+
+    def nms(self, iou_threshold=0.5, class_aware=True, metric="iou"):
+        """Aplica NMS e retorna as detecções mantidas, em ordem decrescente de confiança.
+
+        A supressão é feita separadamente por imagem e, se class_aware, por classe.
+        """
+        if len(self) < 2:
+            return self
+        groups = self.image_id.astype(np.int64)
+        if class_aware:
+            groups = groups * (int(self.class_id.max()) + 1) + self.class_id
+        # nms() separa grupos diferentes deslocando as caixas; ids compactos evitam deslocamentos enormes
+        _, group_index = np.unique(groups, return_inverse=True)
+        keep = nms(self.xyxy, self.confidence, iou_threshold, class_ids=group_index, metric=metric)
+        return self[keep]
+
+    def class_name_array(self):
+        """Nome da classe de cada detecção."""
+        return np.array([self.class_names.get(int(c), str(int(c))) for c in self.class_id], dtype=object)
+
+    def to_dataframe(self):
+        """Exporta para um DataFrame pandas (as colunas numéricas reaproveitam os arrays)."""
+        import pandas as pd
+
+        return pd.DataFrame({
+            "image_id": self.image_id,
+            "class_id": self.class_id,
+            "class_name": self.class_name_array(),
+            "confidence": self.confidence,
+            "x1": self.xyxy[:, 0],
+            "y1": self.xyxy[:, 1],
+            "x2": self.xyxy[:, 2],
+            "y2": self.xyxy[:, 3],
+        }, copy=False)
+
+    def to_arrow(self):
+        """Exporta para uma tabela pyarrow (sem cópia das colunas numéricas)."""
+        import pyarrow as pa
+
+        names = [self.class_names.get(int(c), str(int(c))) for c in self.class_id]
+        return pa.table({
+            "image_id": pa.array(self.image_id),
+            "class_id": pa.array(self.class_id),
+            "class_name": pa.array(names, type=pa.string()).dictionary_encode(),
+            "confidence": pa.array(self.confidence),
+            "x1": pa.array(self.xyxy[:, 0]),
+            "y1": pa.array(self.xyxy[:, 1]),
+            "x2": pa.array(self.xyxy[:, 2]),
+            "y2": pa.array(self.xyxy[:, 3]),
+        })
+
+    def to_predictions(self):
+        """Converte para a lista de dicionários usada por draw_predictions e extract_detection_data."""
+        predictions = []
+        for (x1, y1, x2, y2), (x, y, w, h), conf, cls in zip(
+            self.xyxy.tolist(), self.xywh.tolist(), self.confidence.tolist(), self.class_id.tolist()
+        ):
+            predictions.append({
+                "x": x, "y": y, "width": w, "height": h,
+                "confidence": conf,
+                "class": self.class_names.get(cls, str(cls)),
+                "class_id": cls,
+                "box": [x1, y1, x2, y2],
+            })
+        return predictions
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+"""Avaliação de configurações de pré-processamento contra labels de referência.
+
+Responde a pergunta "o CLAHE melhora a detecção?" com precisão, recall e mAP
+em vez de comparar a confiança média. Recebe um conjunto de imagens com
+labels no formato YOLO (um .txt por imagem, linhas "classe cx cy w h"
+normalizadas) e uma grade de configurações (CLAHE com vários clip_limit e
+tile_grid_size, blur e correção gama), e para cada configuração:
+
+- aplica o pré-processamento (PreprocessingPipeline) e chama o backend de
+  inferência, medindo o tempo de cada etapa por imagem;
+- casa predições e labels com uma matriz de IoU por imagem, para todos os
+  limiares de IoU de uma vez;
+- calcula precisão e recall no limiar de confiança, mAP50 e mAP50-95.
+
+As imagens são decodificadas uma única vez para um bloco de memória
+compartilhada; um pool de processos (EVALUATION_WORKERS) lê esse bloco
+sem copiar nem decodificar de novo, e cada tarefa é uma configuração
+aplicada a um pedaço das imagens. O resultado é uma tabela ordenada pela
+métrica escolhida e a configuração mais rápida que atinge o piso:
+
+    python evaluation.py --images dataset/images/ --labels dataset/labels/ \\
+        --clip-limits 0,1,2,4 --tile-grids 4,8,16 --blur 0,5 --gamma 1.0,0.8 \\
+        --metric map50 --floor 0.5 --output avaliacao.csv
+
+Sem --labels, o label de "<...>/images/<nome>.jpg" é "<...>/labels/<nome>.txt".
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from classic_processing import PreprocessingPipeline
+from detections import Detections
+from utils import box_iou_matrix
+
+logger = logging.getLogger(__name__)
+
+# Limiares de IoU do mAP50-95 (como no COCO)
+MAP_IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+METRICS = ("map50", "map50_95", "precision", "recall", "f1")
+
+
+# --- Labels de referência ---
+
+def label_path_for(key, image_path, labels_dir=None):
+    """Caminho do label YOLO de uma imagem.
+
+    Com labels_dir, o label tem o mesmo caminho relativo da imagem (como em prefilter.py);
+    sem ele, segue o layout YOLO: a pasta "images" é trocada por "labels".
+    """
+    if labels_dir:
+        return os.path.join(labels_dir, os.path.splitext(key)[0] + ".txt")
+    head, name = os.path.split(os.path.splitext(image_path)[0])
+    parts = head.split(os.sep)
+    if "images" in parts:
+        index = len(parts) - 1 - parts[::-1].index("images")
+        parts[index] = "labels"
+    return os.path.join(os.sep.join(parts), name + ".txt")
+
+
+def load_yolo_labels(path, width, height):
+    """Lê um label YOLO (caixas ou polígonos normalizados) como Detections em pixels.
+
+    Um arquivo ausente ou vazio é uma imagem sem buracos. Linhas de segmentação
+    ("classe x1 y1 x2 y2 ...") viram a caixa que envolve o polígono.
+    """
+    if not os.path.exists(path):
+        return Detections.empty()
+    boxes, class_ids = [], []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            values = line.split()
+            if not values:
+                continue
+            if len(values) < 5:
+                logger.warning("Linha %d de %s ignorada: esperado 'classe cx cy w h'.", line_number, path)
+                continue
+            coords = np.asarray(values[1:], dtype=np.float32)
+            if len(coords) == 4:
+                cx, cy, w, h = coords
+                box = (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+            else:
+                xs, ys = coords[0::2], coords[1::2]
+                box = (xs.min(), ys.min(), xs.max(), ys.max())
+            boxes.append(box)
+            class_ids.append(int(float(values[0])))
+    if not boxes:
+        return Detections.empty()
+    xyxy = np.asarray(boxes, dtype=np.float32) * np.array([width, height, width, height], dtype=np.float32)
+    return Detections(xyxy, np.ones(len(boxes), np.float32), class_ids)
+
+
+# --- Grade de configurações ---
+
+def config_name(cfg):
+    """Descrição da configuração, também usada como variante na chave do cache de inferência.
+
+    Só CLAHE usa o mesmo nome da variante de main.py, então o cache é compartilhado.
+    """
+    parts = []
+    if cfg.get("gamma", 1.0) != 1.0:
+        parts.append(f"gamma({cfg['gamma']})")
+    if cfg.get("blur"):
+        parts.append(f"blur({cfg['blur']})")
+    if cfg.get("clip_limit"):
+        parts.append(f"clahe(clip_limit={cfg['clip_limit']}, tile_grid_size={tuple(cfg['tile_grid_size'])})")
+    return "+".join(parts) or "original"
+
+
+def config_steps(cfg):
+    """Etapas da PreprocessingPipeline: gama, blur e CLAHE (em cinza, de volta para BGR)."""
+    steps = []
+    if cfg.get("gamma", 1.0) != 1.0:
+        steps.append(("gamma", {"gamma": cfg["gamma"]}))
+    if cfg.get("blur"):
+        steps.append(("blur", {"kernel_size": (cfg["blur"], cfg["blur"])}))
+    if cfg.get("clip_limit"):
+        steps += ["grayscale",
+                  ("clahe", {"clip_limit": cfg["clip_limit"], "tile_grid_size": tuple(cfg["tile_grid_size"])}),
+                  "bgr"]
+    return steps
+
+
+def build_grid(clip_limits=(0, 2.0), tile_grid_sizes=(8,), blur_sizes=(0,), gammas=(1.0,)):
+    """Produto cartesiano das opções de pré-processamento.
+
+    Args:
+        clip_limits: Valores de clip_limit do CLAHE; 0 é "sem CLAHE".
+        tile_grid_sizes: Lados da grade do CLAHE (8 -> (8, 8)).
+        blur_sizes: Tamanhos (ímpares) do kernel do blur Gaussiano; 0 é "sem blur".
+        gammas: Valores da correção gama; 1.0 é "sem correção".
+
+    Returns:
+        Lista de dicionários {name, clip_limit, tile_grid_size, blur, gamma}, sem repetições
+        (sem CLAHE, a grade não importa).
+    """
+    grid, seen = [], set()
+    for clip_limit, tile, blur, gamma in itertools.product(clip_limits, tile_grid_sizes, blur_sizes, gammas):
+        cfg = {
+            "clip_limit": float(clip_limit) or None,
+            "tile_grid_size": (int(tile), int(tile)) if clip_limit else None,
+            "blur": int(blur),
+            "gamma": float(gamma),
+        }
+        if cfg["blur"] and cfg["blur"] % 2 == 0:
+            raise ValueError(f"O kernel do blur precisa ser ímpar: {cfg['blur']}")
+        cfg["name"] = config_name(cfg)
+        if cfg["name"] not in seen:
+            seen.add(cfg["name"])
+            grid.append(cfg)
+    return grid
+
+
+# --- Casamento e métricas ---
+
+def match_predictions(predictions, ground_truth, iou_thresholds, class_agnostic=False):
+    """Marca as predições corretas de uma imagem em cada limiar de IoU.
+
+    A matriz de IoU é calculada uma vez; em cada limiar os pares candidatos são
+    percorridos em ordem decrescente de IoU e cada predição e cada label entram
+    em no máximo um par.
+
+    Returns:
+        Matriz booleana (predições x limiares).
+    """
+    iou_thresholds = np.asarray(iou_thresholds, dtype=np.float32)
+    tp = np.zeros((len(predictions), len(iou_thresholds)), dtype=bool)
+    if not len(predictions) or not len(ground_truth):
+        return tp
+    iou = box_iou_matrix(predictions.xyxy, ground_truth.xyxy)
+    if not class_agnostic:
+        iou = np.where(predictions.class_id[:, None] == ground_truth.class_id[None, :], iou, 0.0)
+    pred_index, gt_index = np.nonzero(iou >= iou_thresholds.min())
+    if not len(pred_index):
+        return tp
+    pair_iou = iou[pred_index, gt_index]
+    order = np.argsort(-pair_iou, kind="stable")
+    pred_index, gt_index, pair_iou = pred_index[order], gt_index[order], pair_iou[order]
+    for j, threshold in enumerate(iou_thresholds.tolist()):
+        valid = pair_iou >= threshold
+        p, g = pred_index[valid], gt_index[valid]
+        # Primeiro par de cada predição (o de maior IoU), mantendo a ordem por IoU
+        keep = np.sort(np.unique(p, return_index=True)[1])
+        p, g = p[keep], g[keep]
+        # Depois, o primeiro par de cada label
+        keep = np.unique(g, return_index=True)[1]
+        tp[p[keep], j] = True
+    return tp
+
+
+def average_precision(recall, precision):
+    """AP com interpolação de 101 pontos (COCO), para cada coluna (limiar de IoU).
+
+    Args:
+        recall, precision: Arrays (predições em ordem de confiança x limiares).
+    """
+    # Envelope: a precisão em cada ponto é a maior precisão com recall maior ou igual
+    envelope = np.maximum.accumulate(precision[::-1], axis=0)[::-1]
+    points = np.linspace(0, 1, 101)
+    ap = np.zeros(recall.shape[1])
+    for j in range(recall.shape[1]):
+        index = np.searchsorted(recall[:, j], points, side="left")
+        found = index < len(recall)
+        ap[j] = np.where(found, envelope[np.minimum(index, len(recall) - 1), j], 0.0).mean()
+    return ap
+
+
+def evaluate_predictions(predictions, ground_truth, confidence_threshold=0.25, iou_threshold=None,
+                         class_agnostic=False):
+    """Precisão, recall e mAP de um conjunto de imagens.
+
+    Args:
+        predictions: Lista de Detections por imagem (sem filtro de confiança, para o mAP).
+                     Imagens cuja inferência falhou (None) contam como sem detecções.
+        ground_truth: Lista de Detections dos labels, na mesma ordem.
+        confidence_threshold: Limiar de confiança da precisão/recall (o mesmo de main.py).
+        iou_threshold: IoU mínimo de um acerto na precisão/recall (padrão: config.EVALUATION_IOU_THRESHOLD).
+        class_agnostic: Se True, ignora o class id ao casar predições e labels.
+
+    Returns:
+        Dicionário {precision, recall, f1, map50, map50_95, predictions, ground_truth}.
+    """
+    iou_threshold = iou_threshold if iou_threshold is not None else config.EVALUATION_IOU_THRESHOLD
+    # Coluna 0: limiar da precisão/recall; demais: limiares do mAP50-95
+    thresholds = np.concatenate([[iou_threshold], MAP_IOU_THRESHOLDS])
+    tp_parts, confidences, classes = [], [], []
+    for pred, gt in zip(predictions, ground_truth):
+        pred = pred if pred is not None else Detections.empty()
+        tp_parts.append(match_predictions(pred, gt, thresholds, class_agnostic))
+        confidences.append(pred.confidence)
+        classes.append(pred.class_id)
+    tp = np.concatenate(tp_parts) if tp_parts else np.zeros((0, len(thresholds)), bool)
+    confidence = np.concatenate(confidences) if confidences else np.zeros(0, np.float32)
+    pred_classes = np.concatenate(classes) if classes else np.zeros(0, np.int32)
+    gt_classes = (np.concatenate([gt.class_id for gt in ground_truth]) if ground_truth
+                  else np.zeros(0, np.int32))
+    if class_agnostic:
+        pred_classes = np.zeros_like(pred_classes)
+        gt_classes = np.zeros_like(gt_classes)
+
+    selected = confidence >= confidence_threshold
+    num_selected = int(selected.sum())
+    hits = int(tp[selected, 0].sum())
+    precision = hits / num_selected if num_selected else 0.0
+    recall = hits / len(gt_classes) if len(gt_classes) else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    # mAP: média do AP das classes presentes nos labels
+    order = np.argsort(-confidence, kind="stable")
+    tp, pred_classes = tp[order, 1:], pred_classes[order]
+    ap_per_class = []
+    for class_id in np.unique(gt_classes).tolist():
+        tp_class = tp[pred_classes == class_id]
+        num_gt = int((gt_classes == class_id).sum())
+        if not len(tp_class):
+            ap_per_class.append(np.zeros(len(MAP_IOU_THRESHOLDS)))
+            continue
+        true_positives = np.cumsum(tp_class, axis=0)
+        false_positives = np.cumsum(~tp_class, axis=0)
+        ap_per_class.append(average_precision(true_positives / num_gt,
+                                              true_positives / (true_positives + false_positives)))
+    ap = np.mean(ap_per_class, axis=0) if ap_per_class else np.zeros(len(MAP_IOU_THRESHOLDS))
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "map50": float(ap[0]),
+        "map50_95": float(ap.mean()),
+        "predictions": num_selected,
+        "ground_truth": int(len(gt_classes)),
+    }
+
+
+# --- Imagens em memória compartilhada ---
+
+class SharedImageSet:
+    """Imagens decodificadas uma vez e copiadas para um único bloco de memória compartilhada.
+
+    Os processos do pool recebem só o nome do bloco e o layout (offset, shape) de cada
+    imagem, e leem as imagens como views, sem cópia nem nova decodificação.
+    """
+
+    def __init__(self, images):
+        from multiprocessing import shared_memory
+
+        self.layout = []
+        offset = 0
+        for image in images:
+            self.layout.append((offset, image.shape))
+            offset += image.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (offset, shape), image in zip(self.layout, images):
+            np.ndarray(shape, np.uint8, buffer=self.shm.buf, offset=offset)[...] = image
+
+    @property
+    def spec(self):
+        return {"name": self.shm.name, "layout": self.layout}
+
+    @staticmethod
+    def attach(spec):
+        """Abre o bloco em outro processo. Retorna (bloco, lista de imagens somente leitura)."""
+        from multiprocessing import shared_memory
+
+        # Os processos do pool usam o resource_tracker do processo principal, que apaga o bloco
+        shm = shared_memory.SharedMemory(name=spec["name"])
+        images = []
+        for offset, shape in spec["layout"]:
+            image = np.ndarray(tuple(shape), np.uint8, buffer=shm.buf, offset=offset)
+            image.flags.writeable = False
+            images.append(image)
+        return shm, images
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Execução (processo principal e processos do pool) ---
+
+# Estado de cada processo do pool, criado por _init_worker
+_worker = {}
+
+
+def _init_worker(image_spec, backend_spec, use_cache, batch_size):
+    from cache import get_cache
+    from inference_backends import create_backend
+
+    logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    shm, images = SharedImageSet.attach(image_spec)
+    name, kwargs = backend_spec
+    backend = create_backend(name, **kwargs)
+    if images:
+        # Aquecimento (conexões, modelo) fora dos tempos medidos: uma chamada por processo
+        backend.infer_batch([images[0]])
+    _worker.update(shm=shm, images=images, backend=backend,
+                   cache=get_cache() if use_cache else None, batch_size=batch_size, pipelines={})
+
+
+def _run_task(cfg, indices):
+    """Aplica uma configuração a algumas imagens e faz a inferência.
+
+    Returns:
+        (indices, lista de Detections ou None, segundos de pré-processamento, segundos de inferência).
+    """
+    from yolo_processor import _infer_raw_batch
+
+    pipeline = _worker["pipelines"].get(cfg["name"])
+    if pipeline is None:
+        steps = config_steps(cfg)
+        pipeline = _worker["pipelines"][cfg["name"]] = PreprocessingPipeline(steps) if steps else None
+
+    start = time.perf_counter()
+    variants = []
+    for i in indices:
+        image = _worker["images"][i]
+        variants.append(pipeline.apply(image) if pipeline is not None else image)
+    preprocess_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw = _infer_raw_batch(_worker["backend"], variants, _worker["batch_size"], [cfg["name"]] * len(variants),
+                           _worker["cache"])
+    inference_seconds = time.perf_counter() - start
+    predictions = [None if r is None else Detections.from_predictions(r) for r in raw]
+    return indices, predictions, preprocess_seconds, inference_seconds
+
+
+def run_sweep(images, ground_truth, configs, backend_spec=None, workers=None, chunk_size=None, batch_size=None,
+              use_cache=False, confidence_threshold=0.25, class_agnostic=False):
+    """Avalia cada configuração da grade em todas as imagens.
+
+    Args:
+        images: Imagens BGR já decodificadas.
+        ground_truth: Detections dos labels de cada imagem.
+        configs: Configurações de build_grid.
+        backend_spec: (nome, kwargs) do backend criado em cada processo (padrão: config.INFERENCE_BACKEND).
+        workers: Processos do pool (padrão: config.EVALUATION_WORKERS). 0 roda tudo neste processo.
+        chunk_size: Imagens por tarefa (padrão: config.EVALUATION_CHUNK_SIZE).
+        batch_size: Imagens por chamada ao backend (padrão: config.INFERENCE_BATCH_SIZE).
+        use_cache: Se True, usa o cache de inferência (os tempos de inferência deixam de valer).
+        confidence_threshold, class_agnostic: Ver evaluate_predictions.
+
+    Returns:
+        Lista de linhas (dicionários com as métricas e os tempos por imagem), na ordem de `configs`.
+    """
+    backend_spec = backend_spec or (config.INFERENCE_BACKEND, {})
+    workers = config.EVALUATION_WORKERS if workers is None else workers
+    chunk_size = max(1, chunk_size or config.EVALUATION_CHUNK_SIZE)
+    batch_size = batch_size or config.INFERENCE_BATCH_SIZE
+    chunks = [list(range(start, min(start + chunk_size, len(images)))) for start in range(0, len(images), chunk_size)]
+    tasks = [(c, indices) for c in range(len(configs)) for indices in chunks]
+
+    predictions = [[None] * len(images) for _ in configs]
+    timings = np.zeros((len(configs), 2))
+    start = time.perf_counter()
+    with SharedImageSet(images) as shared:
+        initargs = (shared.spec, backend_spec, use_cache, batch_size)
+        if workers:
+            # spawn: os processos não herdam threads (pool HTTP, exportador de métricas) deste processo
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=initargs) as pool:
+                futures = {pool.submit(_run_task, configs[c], indices): c for c, indices in tasks}
+                results = ((futures[future], future.result()) for future in futures)
+                _collect(results, predictions, timings, len(tasks))
+        else:
+            _init_worker(*initargs)
+            try:
+                _collect(((c, _run_task(configs[c], indices)) for c, indices in tasks),
+                         predictions, timings, len(tasks))
+            finally:
+                _worker.pop("images", None)
+                _worker.pop("shm").close()
+    logger.info("%d configurações x %d imagens avaliadas em %.1f s.", len(configs), len(images),
+                time.perf_counter() - start)
+
+    rows = []
+    num_images = max(len(images), 1)
+    for cfg, preds, (preprocess_seconds, inference_seconds) in zip(configs, predictions, timings):
+        row = {"config": cfg["name"], "clip_limit": cfg["clip_limit"],
+               "tile_grid_size": cfg["tile_grid_size"], "blur": cfg["blur"], "gamma": cfg["gamma"]}
+        row.update(evaluate_predictions(preds, ground_truth, confidence_threshold, class_agnostic=class_agnostic))
+        row["failed_images"] = sum(p is None for p in preds)
+        row["preprocess_ms"] = 1000 * preprocess_seconds / num_images
+        row["inference_ms"] = 1000 * inference_seconds / num_images
+        row["total_ms"] = row["preprocess_ms"] + row["inference_ms"]
+        rows.append(row)
+    return rows
+
+
+def _collect(results, predictions, timings, num_tasks):
+    for done, (c, (indices, preds, preprocess_seconds, inference_seconds)) in enumerate(results, 1):
+        for i, pred in zip(indices, preds):
+            predictions[c][i] = pred
+        timings[c] += (preprocess_seconds, inference_seconds)
+        logger.debug("Tarefa %d/%d concluída.", done, num_tasks)
+
+
+def rank_configs(rows, metric="map50"):
+    """Linhas em ordem decrescente da métrica (empates: a mais rápida primeiro)."""
+    return sorted(rows, key=lambda row: (-row[metric], row["total_ms"]))
+
+
+def choose_config(rows, floor, metric="map50"):
+    """Configuração mais rápida com a métrica maior ou igual ao piso, ou None se nenhuma atingir."""
+    candidates = [row for row in rows if row[metric] >= floor]
+    return min(candidates, key=lambda row: row["total_ms"]) if candidates else None
+
+
+def _parse_list(text, cast=float):
+    return [cast(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    from input_handler import load_image
+    from manifest import discover_inputs
+
+    parser = argparse.ArgumentParser(description="Avalia uma grade de pré-processamentos contra labels YOLO.")
+    parser.add_argument("--images", action="append", required=True, help="Pasta ou padrão glob das imagens")
+    parser.add_argument("--labels", help="Pasta com labels YOLO (.txt) no mesmo layout das imagens")
+    parser.add_argument("--clip-limits", default="0,1,2,3,4", help="clip_limit do CLAHE (0 = sem CLAHE)")
+    parser.add_argument("--tile-grids", default="4,8,16", help="Lado da grade do CLAHE")
+    parser.add_argument("--blur", default="0", help="Kernel do blur Gaussiano (ímpar; 0 = sem blur)")
+    parser.add_argument("--gamma", default="1.0", help="Correção gama (1.0 = sem correção)")
+    parser.add_argument("--backend", default=config.INFERENCE_BACKEND,
+                        help="'mock' (servidor local), 'roboflow', 'ultralytics', 'onnx' ou 'service'")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latência artificial do servidor mock")
+    parser.add_argument("--workers", type=int, default=config.EVALUATION_WORKERS)
+    parser.add_argument("--confidence", type=float, default=0.25, help="Limiar de confiança da precisão/recall")
+    parser.add_argument("--class-agnostic", action="store_true", help="Ignora o class id ao casar as caixas")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="Usa o cache de inferência (mais rápido, mas sem tempos de inferência reais)")
+    parser.add_argument("--metric", choices=METRICS, default="map50", help="Métrica da ordenação e do piso")
+    parser.add_argument("--floor", type=float, help="Valor mínimo da métrica para escolher a mais rápida")
+    parser.add_argument("--output", help="Tabela de saída (.csv ou .json)")
+    parser.add_argument("--log-level", default=config.LOG_LEVEL)
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    images, ground_truth = [], []
+    for key, path in discover_inputs(args.images):
+        image = load_image(path)
+        if image is None:
+            continue
+        height, width = image.shape[:2]
+        images.append(image)
+        ground_truth.append(load_yolo_labels(label_path_for(key, path, args.labels), width, height))
+    if not images:
+        parser.error("Nenhuma imagem encontrada.")
+    configs = build_grid(_parse_list(args.clip_limits), _parse_list(args.tile_grids, int),
+                         _parse_list(args.blur, int), _parse_list(args.gamma))
+    print(f"{len(images)} imagens, {sum(len(gt) for gt in ground_truth)} buracos nos labels, "
+          f"{len(configs)} configurações.")
+
+    server = None
+    backend_spec = (args.backend, {})
+    if args.backend == "mock":
+        from mock_server import start_mock_server
+
+        server, url = start_mock_server(latency_ms=args.latency_ms)
+        backend_spec = ("roboflow", {"api_url": url})
+    try:
+        rows = run_sweep(images, ground_truth, configs, backend_spec, workers=args.workers,
+                         use_cache=args.use_cache, confidence_threshold=args.confidence,
+                         class_agnostic=args.class_agnostic)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    rows = rank_configs(rows, args.metric)
+    width = max(len("configuração"), *(len(row["config"]) for row in rows))
+    print(f"\n{'configuração':<{width}} {'P':>6} {'R':>6} {'mAP50':>6} {'50-95':>6} {'pré ms':>7} {'inf ms':>7}")
+    for row in rows:
+        print(f"{row['config']:<{width}} {row['precision']:6.3f} {row['recall']:6.3f} {row['map50']:6.3f} "
+              f"{row['map50_95']:6.3f} {row['preprocess_ms']:7.2f} {row['inference_ms']:7.1f}")
+    if args.floor is not None:
+        best = choose_config(rows, args.floor, args.metric)
+        if best is None:
+            print(f"\nNenhuma configuração atinge {args.metric} >= {args.floor}.")
+        else:
+            print(f"\nMais rápida com {args.metric} >= {args.floor}: {best['config']} "
+                  f"({args.metric} {best[args.metric]:.3f}, {best['total_ms']:.1f} ms/imagem)")
+
+    if args.output:
+        if args.output.endswith(".json"):
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(rows, f, indent=2)
+        else:
+            import pandas as pd
+
+            pd.DataFrame(rows).to_csv(args.output, index=False)
+        print(f"Tabela salva em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
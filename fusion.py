@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Fusão de conjuntos de detecções (variantes de pré-processamento, tiles, modelos).
+
+Recebe N objetos Detections da mesma imagem (por exemplo, original e CLAHE)
+e produz um único conjunto com uma das estratégias:
+
+- "wbf": weighted box fusion; caixas sobrepostas viram uma caixa média
+  ponderada pela confiança, e a confiança é penalizada quando só parte das
+  fontes encontrou o objeto;
+- "soft_nms": soft-NMS gaussiana; em vez de remover as caixas sobrepostas,
+  reduz a confiança delas;
+- "nms": NMS comum sobre a união das detecções.
+
+Para aguentar milhares de caixas por frame, as caixas são processadas em
+ordem de confiança e a busca por caixas sobrepostas usa uma grade espacial
+(só compara com caixas das células vizinhas), com o IoU calculado de forma
+vetorizada sobre os candidatos.
+"""
+from collections import defaultdict
+
+import numpy as np
+
+import config
+from detections import Detections
+from utils import box_iou_matrix
+
+FUSION_STRATEGIES = ("wbf", "soft_nms", "nms")
+
+
+class _SpatialGrid:
+    """Índice espacial simples: cada id é registrado nas células da grade que a caixa cobre."""
+
+    def __init__(self, cell_size):
+        self.cell_size = max(float(cell_size), 1.0)
+        self._cells = defaultdict(list)
+
+    def _cell_range(self, box):
+        x1, y1, x2, y2 = (np.asarray(box, dtype=np.float64) // self.cell_size).astype(np.int64)
+        return range(x1, x2 + 1), range(y1, y2 + 1)
+
+    def insert(self, item_id, box):
+        xs, ys = self._cell_range(box)
+        for cx in xs:
+            for cy in ys:
+                cell = self._cells[(cx, cy)]
+                if not cell or cell[-1] != item_id:
+                    cell.append(item_id)
+
+    def query(self, box):
+        """Ids registrados em qualquer célula coberta pela caixa (sem repetição)."""
+        xs, ys = self._cell_range(box)
+        found = set()
+        for cx in xs:
+            for cy in ys:
+                found.update(self._cells.get((cx, cy), ()))
+        return found
+
+
+def _grid_cell_size(boxes):
+    sizes = np.concatenate([boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+    return float(np.median(sizes)) * 2 if len(sizes) else 1.0
+
+
+def _wbf_group(boxes, scores, iou_threshold, num_sources):
+    """Weighted box fusion de um grupo (mesma imagem e classe). Caixas já ordenadas por confiança."""
+    n = len(boxes)
+    weighted_sum = np.zeros((n, 4), dtype=np.float64)
+    score_sum = np.zeros(n, dtype=np.float64)
+    counts = np.zeros(n, dtype=np.int64)
+    fused = np.zeros((n, 4), dtype=np.float32)
+    num_clusters = 0
+    grid = _SpatialGrid(_grid_cell_size(boxes))
+
+    for i in range(n):
+        box, score = boxes[i], scores[i]
+        candidates = grid.query(box)
+        best, best_iou = -1, iou_threshold
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64)
+            ious = box_iou_matrix(box, fused[candidates])[0]
+            j = int(ious.argmax())
+            if ious[j] > best_iou:
+                best = int(candidates[j])
+
+        if best < 0:
+            best = num_clusters
+            num_clusters += 1
+        weighted_sum[best] += box * score
+        score_sum[best] += score
+        counts[best] += 1
+        fused[best] = weighted_sum[best] / score_sum[best]
+        grid.insert(best, fused[best])
+
+    fused = fused[:num_clusters]
+    confidences = score_sum[:num_clusters] / counts[:num_clusters]
+    # Objetos vistos por poucas fontes têm a confiança reduzida proporcionalmente
+    confidences *= np.minimum(counts[:num_clusters], num_sources) / num_sources
+    return fused, confidences.astype(np.float32)
+
+
+def _soft_nms_group(boxes, scores, iou_threshold, sigma, score_threshold):
+    """Soft-NMS gaussiana de um grupo. Retorna (índices mantidos, confianças ajustadas)."""
+    scores = scores.astype(np.float64).copy()
+    grid = _SpatialGrid(_grid_cell_size(boxes))
+    for i, box in enumerate(boxes):
+        grid.insert(i, box)
+
+    active = np.ones(len(boxes), dtype=bool)
+    keep, kept_scores = [], []
+    while True:
+        masked = np.where(active, scores, -1.0)
+        i = int(masked.argmax())
+        if masked[i] < score_threshold:
+            break
+        keep.append(i)
+        kept_scores.append(scores[i])
+        active[i] = False
+
+        # Só as caixas nas células vizinhas podem se sobrepor à caixa escolhida
+        neighbors = np.fromiter(grid.query(boxes[i]), dtype=np.int64)
+        neighbors = neighbors[active[neighbors]]
+        if len(neighbors):
+            ious = box_iou_matrix(boxes[i], boxes[neighbors])[0]
+            overlapping = ious > iou_threshold
+            scores[neighbors[overlapping]] *= np.exp(-(ious[overlapping] ** 2) / sigma)
+    return np.asarray(keep, dtype=np.int64), np.asarray(kept_scores, dtype=np.float32)
+
+
+def fuse_detections(detection_sets, strategy=None, iou_threshold=None, weights=None,
+                    skip_threshold=0.0, sigma=None):
+    """Funde vários conjuntos de detecções da mesma imagem (ou das mesmas imagens) em um só.
+
+    Args:
+        detection_sets: Lista de Detections (ex.: [original, clahe] ou um por tile/variante).
+        strategy: "wbf", "soft_nms" ou "nms" (padrão: config.FUSION_STRATEGY).
+        iou_threshold: IoU a partir do qual duas caixas são consideradas o mesmo objeto
+                       (padrão: config.FUSION_IOU_THRESHOLD).
+        weights: Peso de cada conjunto, multiplicado pelas confianças (padrão: 1 para todos).
+        skip_threshold: Detecções com confiança (já ponderada) abaixo disso são ignoradas.
+        sigma: Parâmetro da soft-NMS gaussiana (padrão: config.SOFT_NMS_SIGMA).
+
+    Returns:
+        Detections fundidas, agrupadas por imagem e classe.
+    """
+    strategy = strategy or config.FUSION_STRATEGY
+    if strategy not in FUSION_STRATEGIES:
+        raise ValueError(f"Estratégia de fusão desconhecida: {strategy}. Opções: {', '.join(FUSION_STRATEGIES)}")
+    iou_threshold = config.FUSION_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+    sigma = config.SOFT_NMS_SIGMA if sigma is None else sigma
+
+    detection_sets = [d for d in detection_sets if d is not None]
+    if weights is None:
+        weights = [1.0] * len(detection_sets)
+    weighted = [
+        Detections(d.xyxy, d.confidence * w, d.class_id, d.image_id, d.class_names)
+        for d, w in zip(detection_sets, weights)
+    ]
+    merged = Detections.concatenate(weighted)
+    merged = merged[merged.confidence >= skip_threshold]
+    if len(merged) == 0:
+        return merged
+
+    if strategy == "nms":
+        return merged.nms(iou_threshold)
+
+    # Processa cada par (imagem, classe) separadamente, sempre em ordem decrescente de confiança
+    order = np.lexsort((-merged.confidence, merged.class_id, merged.image_id))
+    merged = merged[order]
+    group_keys = np.stack([merged.image_id, merged.class_id.astype(np.int64)], axis=1)
+    boundaries = np.flatnonzero(np.any(np.diff(group_keys, axis=0) != 0, axis=1)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(merged)]])
+
+    parts = []
+    for start, end in zip(starts, ends):
+        group = merged[start:end]
+        if strategy == "wbf":
+            boxes, confidences = _wbf_group(group.xyxy, group.confidence, iou_threshold, len(detection_sets))
+            parts.append(Detections(boxes, confidences, group.class_id[:len(boxes)],
+                                    group.image_id[:len(boxes)], group.class_names))
+        else:
+            keep, confidences = _soft_nms_group(group.xyxy, group.confidence, iou_threshold, sigma,
+                                                max(skip_threshold, config.SOFT_NMS_MIN_SCORE))
+            kept = group[keep]
+            parts.append(Detections(kept.xyxy, confidences, kept.class_id, kept.image_id, kept.class_names))
+
+    fused = Detections.concatenate(parts)
+    fused.class_names = merged.class_names
+    return fused[np.argsort(-fused.confidence, kind="stable")]
@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+"""Backends de inferência usados por yolo_processor.
+
+Todos os backends devolvem predições no mesmo formato da API Roboflow
+(dicionários com 'x', 'y', 'width', 'height', 'confidence', 'class' e
+'class_id', com x/y sendo o centro da caixa), que é o formato consumido por
+detect_objects_yolo, draw_predictions e extract_detection_data.
+"""
+import atexit
+import base64
+import importlib.util
+import logging
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBackend:
+    """Interface comum dos backends de inferência."""
+
+    name = "base"
+
+    @property
+    def model_key(self):
+        """Identifica o modelo (e parâmetros que mudam as predições) nas chaves do cache."""
+        return self.name
+
+    def infer(self, image):
+        """Executa a inferência em uma imagem BGR e retorna a lista de predições raw."""
+        return self.infer_batch([image])[0]
+
+    def infer_batch(self, images):
+        """Executa a inferência em uma lista de imagens BGR.
+
+        Returns:
+            Lista com uma lista de predições raw por imagem, na mesma ordem da entrada, ou None
+            para uma imagem que falhou sozinha (o lote inteiro falhando levanta uma exceção).
+        """
+        return [self.infer(image) for image in images]
+
+
+class RoboflowBackend(InferenceBackend):
+    """Backend remoto: API HTTP Roboflow (ou qualquer servidor compatível, como mock_server.py).
+
+    As imagens são preparadas no cliente antes do envio (ver prepare_upload): reduzidas
+    ao tamanho de entrada do modelo e codificadas em JPEG com qualidade adaptativa. As
+    predições voltam para as coordenadas da imagem original.
+    """
+
+    name = "roboflow"
+
+    def __init__(self, api_url=None, api_key=None, model_id=None, upload_max_size=None,
+                 jpeg_quality=None, upload_max_bytes=None, http_client=None):
+        self.api_url = api_url or config.ROBOFLOW_API_URL
+        self.api_key = api_key or config.ROBOFLOW_API_KEY
+        self.model_id = model_id or config.ROBOFLOW_MODEL_ID
+        self.upload_max_size = config.ROBOFLOW_UPLOAD_MAX_SIZE if upload_max_size is None else upload_max_size
+        self.jpeg_quality = jpeg_quality or config.ROBOFLOW_JPEG_QUALITY
+        self.upload_max_bytes = config.ROBOFLOW_UPLOAD_MAX_BYTES if upload_max_bytes is None else upload_max_bytes
+        self.http_client = http_client or config.ROBOFLOW_HTTP_CLIENT
+        if self.http_client == "async" and importlib.util.find_spec("aiohttp") is None:
+            # Falha aqui, e não na primeira requisição: sem aiohttp, usa o cliente do inference_sdk
+            logger.warning("aiohttp não está instalado; usando o cliente HTTP do inference_sdk.")
+            self.http_client = "sdk"
+
+        logger.info("Inicializando cliente HTTP de inferência Roboflow para o modelo: %s (%s)", self.model_id, self.api_url)
+        if self.http_client == "async":
+            from async_client import AsyncInferenceClient, BackgroundLoop
+
+            # Um event loop compartilhado pelas threads do pipeline: os limites valem para o processo todo
+            self._loop = BackgroundLoop()
+            self.client = AsyncInferenceClient(self.api_url, self.api_key, self.model_id)
+            atexit.register(self.close)
+            logger.info("Cliente Roboflow (assíncrono) inicializado com sucesso.")
+            return
+
+        # Import local para que os backends locais funcionem sem o inference_sdk instalado
+        from inference_sdk import InferenceConfiguration, InferenceHTTPClient
+
+        self.client = InferenceHTTPClient(api_url=self.api_url, api_key=self.api_key)
+        self.client.select_api_v0()
+        # Uma lista de imagens vira um conjunto de requisições feitas em paralelo
+        self.client.configure(InferenceConfiguration(
+            max_concurrent_requests=config.ROBOFLOW_MAX_CONCURRENT_REQUESTS,
+        ))
+        logger.info("Cliente Roboflow inicializado com sucesso.")
+
+    def close(self):
+        """Fecha o pool de conexões do cliente assíncrono."""
+        if self.http_client == "async":
+            self._loop.run(self.client.close())
+
+    @property
+    def model_key(self):
+        # O redimensionamento e a qualidade do JPEG mudam as predições
+        return (f"{self.name}:{self.model_id}:upload{self.upload_max_size}"
+                f"q{self.jpeg_quality}b{self.upload_max_bytes}")
+
+    def infer(self, image):
+        return self.infer_batch([image])[0]
+
+    def infer_batch(self, images):
+        if not images:
+            return []
+        uploads = []
+        with metrics.timer("upload_prep_seconds", backend=self.name):
+            for image in images:
+                payload, scale = prepare_upload(image, self.upload_max_size, self.jpeg_quality,
+                                                self.upload_max_bytes)
+                uploads.append((payload, scale))
+                metrics.observe("inference_request_bytes", len(payload), backend=self.name)
+                # Estimativa do que seria enviado sem reduzir a imagem (mesma taxa de compressão)
+                metrics.inc("inference_upload_bytes_saved_total", int(len(payload) / (scale * scale)) - len(payload),
+                            backend=self.name)
+
+        if self.http_client == "async":
+            results = self._loop.run(self.client.infer_many([payload for payload, _ in uploads]))
+            outputs = []
+            for result, (_, scale) in zip(results, uploads):
+                if isinstance(result, Exception):
+                    # Só esta imagem falhou (depois das tentativas); o resto do lote segue
+                    logger.error("Falha na inferência de uma imagem do lote: %s", result)
+                    outputs.append(None)
+                else:
+                    outputs.append(rescale_predictions(result, scale))
+            return outputs
+
+        # O inference_sdk aceita uma lista de imagens (base64) e retorna uma lista de respostas
+        results = self.client.infer([payload for payload, _ in uploads], model_id=self.model_id)
+        if isinstance(results, dict):
+            results = [results]
+        return [
+            rescale_predictions(r.get("predictions", []), scale)
+            for r, (_, scale) in zip(results, uploads)
+        ]
+
+
+def _is_grayscale(image, step=16):
+    """True se a imagem BGR tem os três canais iguais (ex.: variante CLAHE), checando uma amostra."""
+    if image.ndim == 2:
+        return True
+    sample = image[::step, ::step]
+    return bool(np.array_equal(sample[..., 0], sample[..., 1]) and np.array_equal(sample[..., 1], sample[..., 2]))
+
+
+def prepare_upload(image, max_size, quality=85, max_bytes=0, min_quality=50):
+    """Prepara uma imagem BGR para envio à API: redução e codificação JPEG em base64.
+
+    A imagem é reduzida (mantendo a proporção) para que o maior lado tenha max_size
+    pixels, já que o servidor redimensiona para a entrada do modelo de qualquer forma.
+    As bordas do letterbox ficam a cargo do servidor, para não gastar bytes com elas.
+    Imagens em tons de cinza são codificadas com um canal só. Se o JPEG passar de
+    max_bytes, a qualidade é reduzida em passos até min_quality.
+
+    Args:
+        image: Imagem BGR (ou em tons de cinza).
+        max_size: Maior lado enviado, em pixels (0 envia na resolução original).
+        quality: Qualidade JPEG inicial.
+        max_bytes: Tamanho alvo do JPEG em bytes (0 desliga a qualidade adaptativa).
+        min_quality: Menor qualidade usada pela qualidade adaptativa.
+
+    Returns:
+        payload: JPEG codificado em base64 (str).
+        scale: Fator aplicado às coordenadas (tamanho enviado / tamanho original).
+    """
+    height, width = image.shape[:2]
+    scale = 1.0
+    if max_size and max(height, width) > max_size:
+        scale = max_size / max(height, width)
+        image = cv2.resize(image, (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+                           interpolation=cv2.INTER_AREA)
+    if image.ndim == 3 and _is_grayscale(image):
+        image = image[..., 0]
+
+    while True:
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        if not ok:
+            raise ValueError("Falha ao codificar a imagem em JPEG para envio")
+        if not max_bytes or encoded.nbytes <= max_bytes or quality <= min_quality:
+            break
+        quality = max(min_quality, quality - 10)
+    return base64.b64encode(encoded.tobytes()).decode("ascii"), scale
+
+
+def rescale_predictions(predictions, scale):
+    """Converte x/y/width/height das predições da imagem enviada para a imagem original."""
+    if scale == 1.0:
+        return predictions
+    for p in predictions:
+        for key in ("x", "y", "width", "height"):
+            if key in p:
+                p[key] = p[key] / scale
+    return predictions
+
+
+def letterbox(image, new_size, color=(114, 114, 114)):
+    """Redimensiona mantendo a proporção e completa com bordas até new_size x new_size.
+
+    Returns:
+        padded: Imagem redimensionada com bordas.
+        ratio: Fator de escala aplicado à imagem original.
+        (pad_x, pad_y): Deslocamento da imagem dentro do quadro com bordas.
+    """
+    height, width = image.shape[:2]
+    ratio = min(new_size / height, new_size / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    pad_x = (new_size - new_w) / 2
+    pad_y = (new_size - new_h) / 2
+
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return padded, ratio, (left, top)
+
+
+def _predictions_from_arrays(xywh, confidences, class_ids, class_names):
+    """Monta a lista de predições raw (formato Roboflow) a partir de arrays NumPy."""
+    predictions = []
+    for (x, y, w, h), conf, cls in zip(xywh.tolist(), confidences.tolist(), class_ids.tolist()):
+        cls = int(cls)
+        predictions.append({
+            "x": float(x),
+            "y": float(y),
+            "width": float(w),
+            "height": float(h),
+            "confidence": float(conf),
+            "class": class_names[cls] if cls < len(class_names) else str(cls),
+            "class_id": cls,
+        })
+    return predictions
+
+
+class UltralyticsBackend(InferenceBackend):
+    """Backend local: modelo YOLOv8 (.pt) executado na CPU via ultralytics."""
+
+    name = "ultralytics"
+
+    def __init__(self, model_path=None, input_size=None, iou_threshold=None, min_confidence=None):
+        from ultralytics import YOLO
+
+        self.model_path = model_path or config.LOCAL_MODEL_PATH
+        self.input_size = input_size or config.LOCAL_INPUT_SIZE
+        self.iou_threshold = iou_threshold if iou_threshold is not None else config.LOCAL_IOU_THRESHOLD
+        self.min_confidence = min_confidence if min_confidence is not None else config.LOCAL_MIN_CONFIDENCE
+
+        logger.info("Carregando modelo YOLOv8 local: %s", self.model_path)
+        self.model = YOLO(self.model_path)
+
+    @property
+    def model_key(self):
+        return f"{self.name}:{os.path.abspath(self.model_path)}:{self.input_size}:{self.iou_threshold}:{self.min_confidence}"
+
+    def infer_batch(self, images):
+        if not images:
+            return []
+        results = self.model.predict(
+            list(images),
+            imgsz=self.input_size,
+            conf=self.min_confidence,
+            iou=self.iou_threshold,
+            device="cpu",
+            verbose=False,
+        )
+        batch_predictions = []
+        for r in results:
+            names = [r.names[i] for i in sorted(r.names)]
+            boxes = r.boxes
+            batch_predictions.append(_predictions_from_arrays(
+                boxes.xywh.cpu().numpy(),
+                boxes.conf.cpu().numpy(),
+                boxes.cls.cpu().numpy().astype(int),
+                names,
+            ))
+        return batch_predictions
+
+
+class OnnxBackend(InferenceBackend):
+    """Backend local: modelo YOLOv8 exportado em ONNX, via onnxruntime ou OpenCV DNN."""
+
+    name = "onnx"
+
+    def __init__(self, model_path=None, input_size=None, iou_threshold=None, min_confidence=None,
+                 engine=None, class_names=None):
+        self.model_path = model_path or config.LOCAL_ONNX_PATH
+        self.input_size = input_size or config.LOCAL_INPUT_SIZE
+        self.iou_threshold = iou_threshold if iou_threshold is not None else config.LOCAL_IOU_THRESHOLD
+        self.min_confidence = min_confidence if min_confidence is not None else config.LOCAL_MIN_CONFIDENCE
+        self.engine = engine or config.ONNX_ENGINE
+        self.class_names = class_names or config.LOCAL_CLASS_NAMES
+
+        logger.info("Carregando modelo ONNX local (%s): %s", self.engine, self.model_path)
+        if self.engine == "onnxruntime":
+            import onnxruntime as ort
+
+            self.session = ort.InferenceSession(self.model_path, providers=["CPUExecutionProvider"])
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            # Modelos exportados sem eixo de batch dinâmico só aceitam batch 1
+            self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        elif self.engine == "opencv":
+            self.net = cv2.dnn.readNetFromONNX(self.model_path)
+            self.dynamic_batch = False
+        else:
+            raise ValueError(f"Engine ONNX desconhecida: {self.engine}")
+
+    @property
+    def model_key(self):
+        return f"{self.name}:{os.path.abspath(self.model_path)}:{self.input_size}:{self.iou_threshold}:{self.min_confidence}"
+
+    def _forward(self, blob):
+        if self.engine == "onnxruntime":
+            return self.session.run(None, {self.input_name: blob})[0]
+        self.net.setInput(blob)
+        return self.net.forward()
+
+    def _decode(self, output, ratio, pad):
+        """Converte a saída (4 + nc, N) do YOLOv8 em predições no espaço da imagem original."""
+        preds = output.T
+        scores = preds[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences >= self.min_confidence
+        preds, class_ids, confidences = preds[keep], class_ids[keep], confidences[keep]
+        if len(preds) == 0:
+            return []
+
+        xywh = preds[:, :4].astype(np.float32)
+        top_left = xywh.copy()
+        top_left[:, 0] -= xywh[:, 2] / 2
+        top_left[:, 1] -= xywh[:, 3] / 2
+        indices = cv2.dnn.NMSBoxes(top_left.tolist(), confidences.tolist(), self.min_confidence, self.iou_threshold)
+        indices = np.asarray(indices, dtype=int).reshape(-1)
+        xywh, confidences, class_ids = xywh[indices], confidences[indices], class_ids[indices]
+
+        # Desfaz o letterbox: remove o deslocamento das bordas e volta à escala original
+        xywh[:, 0] = (xywh[:, 0] - pad[0]) / ratio
+        xywh[:, 1] = (xywh[:, 1] - pad[1]) / ratio
+        xywh[:, 2:] /= ratio
+        return _predictions_from_arrays(xywh, confidences, class_ids, self.class_names)
+
+    def infer_batch(self, images):
+        if not images:
+            return []
+        letterboxed = [letterbox(image, self.input_size) for image in images]
+        frames = [padded for padded, _, _ in letterboxed]
+        blob = cv2.dnn.blobFromImages(frames, 1 / 255.0, (self.input_size, self.input_size), swapRB=True, crop=False)
+
+        if self.dynamic_batch:
+            outputs = self._forward(blob)
+        else:
+            outputs = np.concatenate([self._forward(blob[i:i + 1]) for i in range(len(frames))])
+
+        return [self._decode(outputs[i], ratio, pad) for i, (_, ratio, pad) in enumerate(letterboxed)]
+
+
+class ServiceBackend(InferenceBackend):
+    """Cliente do serviço de inferência residente (service.py), que mantém o backend real aquecido.
+
+    As imagens vão para o serviço em memória compartilhada (mesma máquina), sem codificação,
+    e o serviço junta em lotes os pedidos de todos os clientes. O model_key é o do backend
+    do serviço, então o cache de inferência continua válido ao alternar entre os dois modos.
+    """
+
+    name = "service"
+
+    def __init__(self, address=None):
+        from service import ServiceClient
+
+        self.client = ServiceClient(address)
+        health = self.client.health()
+        self._model_key = health["model_key"]
+        logger.info("Usando o serviço de inferência em %s (%s)", address or config.INFERENCE_SERVICE_ADDRESS,
+                    self._model_key)
+
+    @property
+    def model_key(self):
+        return self._model_key
+
+    def infer_batch(self, images):
+        from multiprocessing import shared_memory
+
+        if not images:
+            return []
+        blocks, jobs = [], []
+        try:
+            for image in images:
+                image = np.ascontiguousarray(image)
+                shm = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+                blocks.append(shm)
+                np.ndarray(image.shape, image.dtype, buffer=shm.buf)[...] = image
+                jobs.append({"shm": {"name": shm.name, "shape": list(image.shape), "dtype": image.dtype.str,
+                                     "pid": os.getpid()}})
+            results = self.client.detect(jobs, fmt="columnar")
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+        outputs = []
+        for result in results:
+            if "error" in result:
+                logger.error("Erro no serviço de inferência: %s", result["error"])
+                outputs.append(None)
+                continue
+            outputs.append([
+                {"x": x, "y": y, "width": w, "height": h, "confidence": conf, "class_id": cls,
+                 "class": result["class_names"].get(str(cls), str(cls))}
+                for (x, y, w, h), conf, cls in zip(result["xywh"], result["confidence"], result["class_id"])
+            ])
+        return outputs
+
+
+BACKENDS = {
+    RoboflowBackend.name: RoboflowBackend,
+    UltralyticsBackend.name: UltralyticsBackend,
+    OnnxBackend.name: OnnxBackend,
+    ServiceBackend.name: ServiceBackend,
+}
+
+# Backend padrão, criado sob demanda por get_backend()
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def create_backend(name=None, **kwargs):
+    """Cria um backend de inferência pelo nome ('roboflow', 'ultralytics', 'onnx' ou 'service')."""
+    name = name or config.INFERENCE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de inferência desconhecido: {name}. Opções: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+def get_backend():
+    """Retorna o backend padrão (config.INFERENCE_BACKEND), criando-o na primeira chamada."""
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = create_backend()
+    return _default_backend
+
+
+def set_backend(backend):
+    """Define o backend padrão usado por detect_objects_yolo (instância ou nome)."""
+    global _default_backend
+    _default_backend = create_backend(backend) if isinstance(backend, str) else backend
+    return _default_backend
@@ -1,17 +1,179 @@
 import cv2
+import logging
 import os
+import threading
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
 
 def load_image(image_path):
     """Carrega uma imagem de um arquivo."""
     if not os.path.exists(image_path):
-        print(f"Erro: Arquivo de imagem não encontrado em {image_path}")
+        logger.error("Erro: Arquivo de imagem não encontrado em %s", image_path)
         return None
-    image = cv2.imread(image_path)
+    with metrics.timer("image_decode_seconds"):
+        image = cv2.imread(image_path)
     if image is None:
-        print(f"Erro: Não foi possível carregar a imagem de {image_path}")
+        logger.error("Erro: Não foi possível carregar a imagem de %s", image_path)
     return image
 
-# Funções para carregar vídeo podem ser adicionadas aqui
-# def load_video(video_path):
-#     ...
+class FrameSource:
+    """Fonte de frames de vídeo, câmera (RTSP/V4L2) ou pasta com sequência de imagens.
+
+    Os frames são decodificados em uma thread de fundo e guardados em um buffer
+    circular limitado, então o vídeo nunca é carregado inteiro na memória.
+    Iterar sobre a fonte gera tuplas (frame_index, timestamp_s, frame).
+
+    Args:
+        source: Caminho do vídeo, pasta de imagens, URL (rtsp://, http://) ou índice/dispositivo
+                da câmera (0, "0", "/dev/video0").
+        stride: Mantém um a cada `stride` frames (os demais são só avançados com grab()).
+        sample_interval: Se definido, amostra por tempo: no máximo um frame a cada
+                         `sample_interval` segundos (aplicado depois do stride).
+        buffer_size: Capacidade do buffer circular entre a decodificação e o consumidor.
+        drop_frames: Se True, quando o buffer está cheio o frame mais antigo é descartado
+                     (útil para câmeras ao vivo quando a inferência fica para trás).
+                     Se False, a decodificação espera o consumidor.
+        sequence_fps: FPS assumido para calcular timestamps de uma sequência de imagens.
+    """
+
+    def __init__(self, source, stride=1, sample_interval=None, buffer_size=8, drop_frames=False, sequence_fps=30.0):
+        self.source = source
+        self.stride = max(1, int(stride))
+        self.sample_interval = sample_interval
+        self.buffer_size = max(1, int(buffer_size))
+        self.drop_frames = drop_frames
+        self.sequence_fps = sequence_fps
+        self.dropped_frames = 0
+
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._finished = False
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def name(self):
+        """Nome base da fonte, usado para nomear as saídas."""
+        if isinstance(self.source, int) or str(self.source).isdigit():
+            return f"camera{self.source}"
+        return os.path.splitext(os.path.basename(os.path.normpath(str(self.source))))[0]
+
+    def _iter_sequence(self):
+        files = sorted(
+            f for f in os.listdir(self.source)
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        for frame_index, file_name in enumerate(files):
+            if frame_index % self.stride:
+                continue
+            frame = cv2.imread(os.path.join(self.source, file_name))
+            if frame is None:
+                logger.error("Erro: Não foi possível carregar o frame %s da sequência %s", file_name, self.source)
+                continue
+            yield frame_index, frame_index / self.sequence_fps, frame
+
+    def _iter_capture(self):
+        source = self.source
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            logger.error("Erro: Não foi possível abrir a fonte de vídeo %s", self.source)
+            return
+        fps = capture.get(cv2.CAP_PROP_FPS) or self.sequence_fps
+        frame_index = -1
+        try:
+            while not self._stopped:
+                # grab() só avança o stream; o frame só é decodificado por retrieve()
+                if not capture.grab():
+                    break
+                frame_index += 1
+                if frame_index % self.stride:
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 or frame_index / fps
+                yield frame_index, timestamp, frame
+        finally:
+            capture.release()
+
+    def _frames(self):
+        if isinstance(self.source, str) and os.path.isdir(self.source):
+            return self._iter_sequence()
+        return self._iter_capture()
+
+    def _decode_loop(self):
+        next_sample_time = None
+        try:
+            for frame_index, timestamp, frame in self._frames():
+                if self._stopped:
+                    break
+                if self.sample_interval:
+                    if next_sample_time is not None and timestamp < next_sample_time:
+                        continue
+                    next_sample_time = timestamp + self.sample_interval
+                with self._condition:
+                    if self.drop_frames:
+                        if len(self._buffer) >= self.buffer_size:
+                            self._buffer.popleft()
+                            self.dropped_frames += 1
+                            metrics.inc("frames_dropped_total")
+                    else:
+                        while len(self._buffer) >= self.buffer_size and not self._stopped:
+                            self._condition.wait()
+                    self._buffer.append((frame_index, timestamp, frame))
+                    metrics.inc("frames_decoded_total")
+                    self._condition.notify_all()
+        except Exception as e:
+            logger.error("Erro ao decodificar frames de %s: %s", self.source, e)
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __iter__(self):
+        self.start()
+        try:
+            while True:
+                with self._condition:
+                    while not self._buffer and not self._finished:
+                        self._condition.wait()
+                    if not self._buffer:
+                        break
+                    item = self._buffer.popleft()
+                    self._condition.notify_all()
+                yield item
+        finally:
+            self.close()
+            if self.dropped_frames:
+                logger.warning("%d frames descartados de %s (inferência mais lenta que a fonte).",
+                               self.dropped_frames, self.source)
+
+def load_video(video_path, stride=1, sample_interval=None, buffer_size=8, drop_frames=False):
+    """Abre um vídeo, câmera ou pasta de imagens como um gerador de frames.
+
+    Returns:
+        FrameSource iterável que gera (frame_index, timestamp_s, frame); ver FrameSource.
+    """
+    return FrameSource(video_path, stride=stride, sample_interval=sample_interval,
+                       buffer_size=buffer_size, drop_frames=drop_frames)
 
@@ -1,102 +1,26 @@
+import argparse
 import cv2
+import logging
 import os
+import time
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import csv
 
+import config
+import metrics
+from cache import get_cache
+from classic_processing import PreprocessingPipeline
+from input_handler import load_image, load_video
+from manifest import RunManifest, batch_image_name, content_hash, discover_inputs, parse_shard, shard_of
+from output_handler import save_image
+from pipeline import Pipeline, Stage
+from result_store import RESULT_STORE_FORMATS, ResultStore
 # Importar funções do yolo_processor.py
-from yolo_processor import detect_objects_yolo, extract_detection_data
-
-# --- Funções de input_handler.py ---
-def load_image(image_path):
-    """Carrega uma imagem de um arquivo."""
-    if not os.path.exists(image_path):
-        print(f"Erro: Arquivo de imagem não encontrado em {image_path}")
-        return None
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"Erro: Não foi possível carregar a imagem de {image_path}")
-    return image
-
-# --- Funções de classic_processing.py ---
-def convert_to_grayscale(image):
-    """Converte uma imagem para escala de cinza."""
-    if len(image.shape) == 3:
-        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    return image
-
-def apply_gaussian_blur(image, kernel_size=(5, 5)):
-    """Aplica um filtro Gaussiano na imagem."""
-    return cv2.GaussianBlur(image, kernel_size, 0)
-
-def apply_clahe(image, clip_limit=2.0, tile_grid_size=(8, 8)):
-    """Aplica CLAHE (Contrast Limited Adaptive Histogram Equalization) na imagem."""
-    gray_image = convert_to_grayscale(image)
-    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
-    return clahe.apply(gray_image)
-
-# --- Funções de output_handler.py ---
-def save_image(image, output_path):
-    """Salva uma imagem em um arquivo."""
-    try:
-        output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        cv2.imwrite(output_path, image)
-        print(f"Imagem salva com sucesso em: {output_path}")
-        return True
-    except Exception as e:
-        print(f"Erro ao salvar a imagem em {output_path}: {e}")
-        return False
-
-def save_image_plot(image, title, output_path):
-    """Salva a visualização de uma imagem como um plot Matplotlib."""
-    try:
-        output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        plt.figure(figsize=(10, 8))
-        
-        if len(image.shape) == 3:
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            plt.imshow(image_rgb)
-        else:
-            plt.imshow(image, cmap="gray")
-            
-        plt.title(title, fontsize=14)
-        plt.axis("off")
-        plt.savefig(output_path, bbox_inches="tight", dpi=150)
-        plt.close()
-        print(f"Plot da imagem salvo com sucesso em: {output_path}")
-        return True
-    except Exception as e:
-        print(f"Erro ao salvar o plot da imagem em {output_path}: {e}")
-        return False
-
-def save_detections_to_csv(detections, output_path):
-    """Salva os dados de detecção em um arquivo CSV."""
-    if not detections:
-        print("Nenhuma detecção para salvar.")
-        return False
-    
-    try:
-        output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            
-        header = detections[0].keys()
-        
-        with open(output_path, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=header)
-            writer.writeheader()
-            writer.writerows(detections)
-        print(f"Dados de detecção salvos com sucesso em: {output_path}")
-        return True
-    except Exception as e:
-        print(f"Erro ao salvar os dados de detecção em {output_path}: {e}")
-        return False
+from detections import Detections
+from inference_backends import ServiceBackend, get_backend, set_backend
+from fusion import fuse_detections
+from prefilter import should_infer
+from tracking import BoxTracker, KeyframeScheduler, save_tracks
+from yolo_processor import detect_objects_yolo_batch, draw_predictions
 
 # --- Configuração e Execução Principal ---
 image_paths = [
@@ -108,92 +32,479 @@ image_paths = [
 
 output_base_dir = "./output_processed"
 confidence_threshold_yolo = 0.25
+clahe_clip_limit = 2.0
+clahe_tile_grid_size = (8, 8)
+# Descrição de cada variante de pré-processamento (entra na chave do cache de inferência)
+variant_descriptions = {
+    "original": "original",
+    "clahe": f"clahe(clip_limit={clahe_clip_limit}, tile_grid_size={clahe_tile_grid_size})",
+}
+# Opções repassadas a detect_objects_yolo_batch (ex.: inferência em tiles)
+detection_options = {
+    "tile_size": config.TILE_SIZE or None,
+    "tile_overlap": config.TILE_OVERLAP,
+    # Limiar do pré-filtro clássico (prefilter.py); None envia tudo ao detector
+    "prefilter_threshold": config.PREFILTER_THRESHOLD if config.PREFILTER_ENABLED else None,
+}
+# Estratégia de fusão das detecções original + CLAHE ("wbf", "soft_nms" ou "nms"; ver fusion.py)
+fusion_strategy = config.FUSION_STRATEGY
+# BGR -> cinza -> CLAHE -> BGR, com buffers reaproveitados entre frames (ver classic_processing.py)
+clahe_preprocessing = PreprocessingPipeline([
+    "grayscale",
+    ("clahe", {"clip_limit": clahe_clip_limit, "tile_grid_size": clahe_tile_grid_size}),
+    "bgr",
+])
+
+logger = logging.getLogger(__name__)
+
+def build_variants(original_image):
+    """Gera as variantes de pré-processamento da imagem: original e CLAHE (em BGR)."""
+    return {"original": original_image, "clahe": clahe_preprocessing.apply(original_image)}
+
+def save_variant_outputs(image_name, variants, detections, output_base_dir, store=None):
+    """Salva as imagens de cada variante e da fusão das variantes, e registra as detecções no
+    dataset de resultados da execução.
 
-def process_single_image(image_path, output_base_dir, confidence_threshold_yolo):
-    image_name = os.path.splitext(os.path.basename(image_path))[0]
-    print(f"\nIniciando processamento para a imagem: {image_name}")
+    Args:
+        image_name: Nome base da imagem (sem extensão).
+        variants: Dicionário {"original": imagem, "clahe": imagem} de build_variants.
+        detections: Dicionário {variante: (Detections, annotated_image)}.
+        output_base_dir: Diretório base de saída.
+        store: ResultStore da execução (ver result_store.py). Se None, só as imagens são salvas.
 
+    Returns:
+        results_original, results_clahe, results_fused: Detections de cada variante e da fusão
+        (None para a variante cujo lote de inferência falhou).
+    """
     output_dir_original = os.path.join(output_base_dir, image_name, "original")
     output_dir_clahe = os.path.join(output_base_dir, image_name, "clahe")
-    os.makedirs(output_dir_original, exist_ok=True)
-    os.makedirs(output_dir_clahe, exist_ok=True)
+    output_dir_fused = os.path.join(output_base_dir, image_name, "fused")
 
-    original_image = load_image(image_path)
-    if original_image is None:
-        print(f"Erro: Não foi possível carregar a imagem em {image_path}")
-        return None, None, None
+    save_image(variants["original"], os.path.join(output_dir_original, f"{image_name}_original.jpg"))
+    save_image(variants["clahe"], os.path.join(output_dir_clahe, f"{image_name}_clahe_processed.jpg"))
 
-    save_image(original_image, os.path.join(output_dir_original, f"{image_name}_original.jpg"))
+    yolo_results_original, yolo_annotated_original_image = detections["original"]
+    yolo_results_clahe, yolo_annotated_clahe_image = detections["clahe"]
+    save_image(yolo_annotated_original_image, os.path.join(output_dir_original, f"{image_name}_yolo_annotated_original.jpg"))
+    save_image(yolo_annotated_clahe_image, os.path.join(output_dir_clahe, f"{image_name}_yolo_annotated_clahe.jpg"))
 
-    print("Aplicando CLAHE na imagem...")
-    clahe_processed_image = convert_to_grayscale(original_image)
-    clahe_processed_image = apply_clahe(clahe_processed_image)
-    clahe_processed_image_bgr = cv2.cvtColor(clahe_processed_image, cv2.COLOR_GRAY2BGR)
-    save_image(clahe_processed_image_bgr, os.path.join(output_dir_clahe, f"{image_name}_clahe_processed.jpg"))
-    print(f"Imagem processada com CLAHE salva em: {os.path.join(output_dir_clahe, f'{image_name}_clahe_processed.jpg')}")
+    # Combina as detecções das duas variantes em um único resultado
+    yolo_results_fused = fuse_detections([yolo_results_original, yolo_results_clahe], strategy=fusion_strategy)
+    save_image(draw_predictions(variants["original"], yolo_results_fused),
+               os.path.join(output_dir_fused, f"{image_name}_yolo_annotated_fused.jpg"))
 
-    print("Aplicando detecção YOLO na imagem original...")
-    yolo_results_original, yolo_annotated_original_image = detect_objects_yolo(original_image, confidence_threshold_yolo)
-    save_image(yolo_annotated_original_image, os.path.join(output_dir_original, f"{image_name}_yolo_annotated_original.jpg"))
-    print("Detecção YOLO na imagem original concluída.")
+    if store is not None:
+        store.append(yolo_results_original, image_name, "original")
+        store.append(yolo_results_clahe, image_name, "clahe")
+        store.append(yolo_results_fused, image_name, f"fused_{fusion_strategy}")
+    logger.debug("Detecções de %s: %d (original), %d (CLAHE), %d (fusão %s).", image_name,
+                 len(yolo_results_original or ()), len(yolo_results_clahe or ()), len(yolo_results_fused),
+                 fusion_strategy)
+    metrics.inc("images_processed_total")
 
-    print("Aplicando detecção YOLO na imagem processada com CLAHE...")
-    yolo_results_clahe, yolo_annotated_clahe_image = detect_objects_yolo(clahe_processed_image_bgr, confidence_threshold_yolo)
-    save_image(yolo_annotated_clahe_image, os.path.join(output_dir_clahe, f"{image_name}_yolo_annotated_clahe.jpg"))
-    print("Detecção YOLO na imagem CLAHE concluída.")
+    return yolo_results_original, yolo_results_clahe, yolo_results_fused
+
+def process_image_batch(image_paths, output_base_dir, confidence_threshold_yolo, store=None):
+    """Processa um grupo de imagens com uma única chamada de inferência em lote.
+
+    As variantes original e CLAHE de todas as imagens vão no mesmo lote e os
+    resultados são mapeados de volta por (índice da imagem, variante).
+
+    Returns:
+        Lista de tuplas (results_original, results_clahe, results_fused, image_name), uma por imagem na ordem
+        de entrada; (None, None, None, None) para imagens que não puderam ser carregadas.
+    """
+    loaded = {}
+    for index, image_path in enumerate(image_paths):
+        image_name = os.path.splitext(os.path.basename(image_path))[0]
+        logger.info("Iniciando processamento para a imagem: %s", image_name)
+        original_image = load_image(image_path)
+        if original_image is None:
+            logger.error("Erro: Não foi possível carregar a imagem em %s", image_path)
+            continue
+        logger.debug("Aplicando CLAHE na imagem...")
+        loaded[index] = (image_name, build_variants(original_image))
+
+    batch_inputs = {
+        (index, variant_name): variant_image
+        for index, (_, variants) in loaded.items()
+        for variant_name, variant_image in variants.items()
+    }
+    logger.debug("Aplicando detecção YOLO em lote nas variantes original e CLAHE de %d imagens...", len(loaded))
+    batch_variants = {key: variant_descriptions[key[1]] for key in batch_inputs}
+    batch_outputs = detect_objects_yolo_batch(batch_inputs, confidence_threshold_yolo, variants=batch_variants,
+                                              as_detections=True, **detection_options)
+
+    results = []
+    for index in range(len(image_paths)):
+        if index not in loaded:
+            results.append((None, None, None, None))
+            continue
+        image_name, variants = loaded[index]
+        detections = {variant_name: batch_outputs[(index, variant_name)] for variant_name in variants}
+        results.append((*save_variant_outputs(image_name, variants, detections, output_base_dir, store), image_name))
+    return results
+
+def process_single_image(image_path, output_base_dir, confidence_threshold_yolo, store=None):
+    return process_image_batch([image_path], output_base_dir, confidence_threshold_yolo, store)[0]
+
+def _build_pipeline(output_base_dir, confidence_threshold_yolo, decode=None, store=None):
+    """Monta o pipeline pré-processamento -> inferência -> escrita, com um estágio de
+    decodificação opcional na frente (ver pipeline.py).
+
+    Os itens que entram no estágio de pré-processamento são (índice, nome, imagem BGR);
+    a saída são tuplas (índice, results_original, results_clahe, results_fused, nome).
+    """
+    prefilter_threshold = detection_options["prefilter_threshold"]
+
+    def preprocess(item):
+        index, image_name, original_image = item
+        # Frames que o pré-filtro considera asfalto limpo não vão ao detector. Com tiles, o
+        # filtro é aplicado por tile em detect_objects_yolo_batch.
+        forward = (prefilter_threshold is None or detection_options["tile_size"]
+                   or should_infer(original_image, prefilter_threshold))
+        with metrics.timer("preprocess_seconds"):
+            return index, image_name, build_variants(original_image), forward
+
+    def infer(items):
+        batch_inputs = {
+            (position, variant_name): variant_image
+            for position, (_, _, variants, forward) in enumerate(items) if forward
+            for variant_name, variant_image in variants.items()
+        }
+        batch_variants = {key: variant_descriptions[key[1]] for key in batch_inputs}
+        batch_outputs = {}
+        if batch_inputs:
+            batch_outputs = detect_objects_yolo_batch(batch_inputs, confidence_threshold_yolo,
+                                                      variants=batch_variants, as_detections=True,
+                                                      **detection_options)
+        return [
+            (index, image_name, variants,
+             {variant_name: batch_outputs.get((position, variant_name), (Detections.empty(), variant_image))
+              for variant_name, variant_image in variants.items()})
+            for position, (index, image_name, variants, _) in enumerate(items)
+        ]
+
+    def write(item):
+        index, image_name, variants, detections = item
+        return (index, *save_variant_outputs(image_name, variants, detections, output_base_dir, store), image_name)
+
+    stages = [
+        Stage("pre_processamento", preprocess, workers=config.PIPELINE_PREPROCESS_WORKERS),
+        Stage("inferencia", infer, workers=config.PIPELINE_INFER_WORKERS,
+              batch_size=config.PIPELINE_INFER_BATCH_IMAGES),
+        Stage("escrita", write, workers=config.PIPELINE_WRITE_WORKERS),
+    ]
+    if decode is not None:
+        stages.insert(0, Stage("decodificacao", decode, workers=config.PIPELINE_DECODE_WORKERS))
+    return Pipeline(stages, queue_size=config.PIPELINE_QUEUE_SIZE)
+
+def process_images_pipelined(image_paths, output_base_dir, confidence_threshold_yolo, store=None):
+    """Processa as imagens em pipeline: decodificação, pré-processamento, inferência e escrita
+    rodam em estágios concorrentes ligados por filas limitadas (ver pipeline.py).
 
-    df_original = pd.DataFrame(extract_detection_data(yolo_results_original)) if yolo_results_original else pd.DataFrame()
-    df_clahe = pd.DataFrame(extract_detection_data(yolo_results_clahe)) if yolo_results_clahe else pd.DataFrame()
+    Gera tuplas (índice, results_original, results_clahe, results_fused, image_name) conforme cada imagem termina;
+    a ordem não é garantida.
+    """
+    def decode(task):
+        index, image_path = task
+        image_name = os.path.splitext(os.path.basename(image_path))[0]
+        logger.info("Iniciando processamento para a imagem: %s", image_name)
+        original_image = load_image(image_path)
+        if original_image is None:
+            logger.error("Erro: Não foi possível carregar a imagem em %s", image_path)
+            return None
+        return index, image_name, original_image
 
-    csv_path_original = os.path.join(output_dir_original, f"{image_name}_detections_original.csv")
-    csv_path_clahe = os.path.join(output_dir_clahe, f"{image_name}_detections_clahe.csv")
+    pipeline = _build_pipeline(output_base_dir, confidence_threshold_yolo, decode=decode, store=store)
+    yield from pipeline.run(enumerate(image_paths))
 
-    if not df_original.empty:
-        df_original.to_csv(csv_path_original, index=False)
-        print(f"{len(df_original)} detecções YOLO (original) salvas em CSV.")
+def _batch_params():
+    """Parâmetros que mudam as saídas; entradas processadas com outros valores são refeitas."""
+    return {
+        "model": get_backend().model_key,
+        "confidence": confidence_threshold_yolo,
+        "variants": variant_descriptions,
+        "fusion": fusion_strategy,
+        "detection_options": detection_options,
+    }
+
+def process_directory(patterns, output_base_dir, confidence_threshold_yolo, shard=(0, 1), results_format=None,
+                      force=False):
+    """Processa pastas inteiras ou padrões glob de forma incremental e retomável (ver manifest.py).
+
+    Entradas já processadas com os mesmos parâmetros e sem alteração são puladas, e cada
+    entrada só é registrada no manifesto depois que suas detecções estão em disco (entradas
+    cuja inferência falhou ficam pendentes e são refeitas na próxima execução). Com
+    shard=(i, n), só as entradas do shard i de n são processadas.
+
+    Gera tuplas (índice, results_original, results_clahe, results_fused, image_name)
+    conforme cada imagem termina.
+    """
+    shard_index, num_shards = shard
+    suffix = f".shard{shard_index}of{num_shards}" if num_shards > 1 else ""
+    manifest = RunManifest(os.path.join(output_base_dir, f"manifest{suffix}.jsonl"), _batch_params())
+
+    inputs = [(key, path) for key, path in discover_inputs(patterns) if shard_of(key, num_shards) == shard_index]
+    pending = [(key, path) for key, path in inputs if force or not manifest.is_done(key, path)]
+    logger.info("%d entradas no shard %d/%d: %d já processadas, %d a processar.", len(inputs), shard_index,
+                num_shards, len(inputs) - len(pending), len(pending))
+    metrics.inc("batch_inputs_skipped_total", len(inputs) - len(pending))
+    if not pending:
+        manifest.close()
+        return
+
+    # Um dataset de resultados por execução; o manifesto aponta qual vale para cada entrada
+    run_id = time.strftime("%Y%m%dT%H%M%S") + suffix
+    # Parquet segmentado: cada bloco gravado já libera o registro das entradas no manifesto,
+    # então uma execução interrompida não perde o que já foi processado
+    store = ResultStore(os.path.join(output_base_dir, "detections", run_id), fmt=results_format, segmented=True)
+    sources = {}
+
+    def decode(task):
+        index, (key, path) = task
+        image_name = batch_image_name(key)
+        try:
+            stat = os.stat(path)
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            logger.error("Erro: Não foi possível ler a imagem em %s: %s", path, e)
+            return None
+        # Lê o arquivo uma vez só: os mesmos bytes geram o hash e a imagem
+        with metrics.timer("image_decode_seconds"):
+            original_image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if original_image is None:
+            logger.error("Erro: Não foi possível decodificar a imagem em %s", path)
+            return None
+        sources[index] = (key, path, content_hash(data), stat)
+        return index, image_name, original_image
+
+    pipeline = _build_pipeline(output_base_dir, confidence_threshold_yolo, decode=decode, store=store)
+    try:
+        for result in pipeline.run(enumerate(pending)):
+            index, image_name = result[0], result[-1]
+            key, path, digest, stat = sources.pop(index)
+            if result[1] is None or result[2] is None:
+                # Fica pendente no manifesto: a próxima execução tenta de novo
+                logger.error("Erro: Inferência falhou para %s; a entrada não foi registrada no manifesto.", path)
+                metrics.inc("batch_inputs_failed_total")
+                yield result
+                continue
+            outputs = {"image_name": image_name, "images": os.path.join(output_base_dir, image_name),
+                       "results": store.path}
+            store.when_durable(lambda key=key, path=path, digest=digest, outputs=outputs, stat=stat:
+                               manifest.record(key, path, digest, outputs, stat=stat))
+            yield result
+    finally:
+        store.close()
+        manifest.close()
+
+def process_video(video_source, output_base_dir, confidence_threshold_yolo, stride=1,
+                  sample_interval=None, drop_frames=False, store=None):
+    """Processa um vídeo, câmera ou sequência de imagens frame a frame, sem carregá-lo inteiro.
+
+    Os frames vêm de input_handler.FrameSource (decodificação em thread de fundo) e seguem
+    pelo mesmo pipeline das imagens. As saídas ficam em output_base_dir/<vídeo>/<vídeo>_frameNNNNNN.
+
+    Gera tuplas (frame_index, results_original, results_clahe, results_fused, frame_name) conforme os
+    frames terminam.
+    """
+    source = load_video(video_source, stride=stride, sample_interval=sample_interval,
+                        buffer_size=config.PIPELINE_QUEUE_SIZE, drop_frames=drop_frames)
+    video_output_dir = os.path.join(output_base_dir, source.name)
+    frames = (
+        (frame_index, f"{source.name}_frame{frame_index:06d}", frame)
+        for frame_index, _, frame in source
+    )
+    pipeline = _build_pipeline(video_output_dir, confidence_threshold_yolo, store=store)
+    yield from pipeline.run(frames)
+
+def track_video(video_source, output_base_dir, confidence_threshold_yolo, stride=1, sample_interval=None,
+                keyframe_stride=None, adaptive=None, store=None):
+    """Processa um vídeo chamando o detector só em keyframes e rastreando os buracos entre eles.
+
+    Os frames precisam ser vistos em ordem, então aqui não há o pipeline concorrente de
+    process_video: cada frame passa pelo fluxo óptico (barato) e só os keyframes vão para a
+    detecção (original + CLAHE, fundidas). Cada buraco vira uma trilha com id persistente;
+    as trilhas ficam em output_base_dir/<vídeo>/<vídeo>_tracks.jsonl, com o melhor crop de
+    cada uma em output_base_dir/<vídeo>/tracks/.
+
+    Returns:
+        Lista de tracking.Track, em ordem de id.
+    """
+    source = load_video(video_source, stride=stride, sample_interval=sample_interval,
+                        buffer_size=config.PIPELINE_QUEUE_SIZE)
+    video_output_dir = os.path.join(output_base_dir, source.name)
+    scheduler = KeyframeScheduler(stride=keyframe_stride, adaptive=adaptive)
+    tracker = BoxTracker()
+    frames = keyframes = 0
+    for frame_index, _, frame in source:
+        frames += 1
+        motion = tracker.propagate(frame_index, frame)
+        if not scheduler.is_keyframe(motion):
+            continue
+        keyframes += 1
+        if detection_options["prefilter_threshold"] is not None and not detection_options["tile_size"] \
+                and not should_infer(frame, detection_options["prefilter_threshold"]):
+            tracker.update(frame_index, frame, Detections.empty())
+            continue
+        variants = build_variants(frame)
+        outputs = detect_objects_yolo_batch(variants, confidence_threshold_yolo, variants=variant_descriptions,
+                                            as_detections=True, **detection_options)
+        if outputs["original"][0] is None or outputs["clahe"][0] is None:
+            # Falha na inferência: o keyframe não conta como "buraco não visto"
+            logger.warning("Inferência falhou no frame %d; mantendo as trilhas propagadas.", frame_index)
+            continue
+        detections = fuse_detections([outputs["original"][0], outputs["clahe"][0]], strategy=fusion_strategy)
+        if store is not None:
+            store.append(detections, f"{source.name}_frame{frame_index:06d}", f"fused_{fusion_strategy}")
+        tracker.update(frame_index, frame, detections)
+    tracks = tracker.finish()
+    save_tracks(tracks, video_output_dir, source.name)
+    metrics.inc("frames_tracked_total", frames)
+    logger.info("%d frames, %d keyframes enviados ao detector (%.1f%% de economia), %d trilhas.",
+                frames, keyframes, 100 * (1 - keyframes / max(frames, 1)), len(tracks))
+    return tracks
+
+def report_result(result, header=False):
+    """Imprime a confiança média das variantes e da fusão de uma imagem (ou frame)."""
+    _, results_orig, results_clahe, results_fused, img_name = result
+    if header:
+        print("\n--- Comparação de Confiabilidade ---")
+    print(f"\nImagem: {img_name}")
+    if results_orig:
+        print(f"  Confiança média (Original): {results_orig.confidence.mean():.4f}")
+    else:
+        print("  Nenhuma detecção na imagem original.")
+
+    if results_clahe:
+        print(f"  Confiança média (CLAHE): {results_clahe.confidence.mean():.4f}")
     else:
-        print("Nenhuma detecção YOLO encontrada para a imagem original.")
+        print("  Nenhuma detecção na imagem CLAHE.")
 
-    if not df_clahe.empty:
-        df_clahe.to_csv(csv_path_clahe, index=False)
-        print(f"{len(df_clahe)} detecções YOLO (CLAHE) salvas em CSV.")
+    if results_fused:
+        print(f"  Confiança média (Fusão {fusion_strategy}): {results_fused.confidence.mean():.4f} "
+              f"em {len(results_fused)} detecções")
     else:
-        print("Nenhuma detecção YOLO encontrada para a imagem CLAHE.")
+        print("  Nenhuma detecção após a fusão.")
 
-    return df_original, df_clahe, image_name
+def parse_args():
+    parser = argparse.ArgumentParser(description="Detecção de buracos com YOLO em imagens originais e com CLAHE.")
+    parser.add_argument("--input", action="append",
+                        help="Pasta ou padrão glob (ex.: 'fotos/**/*.jpg') para processar em lote; pode ser "
+                             "repetido. Entradas já processadas são puladas (ver manifest.py)")
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1),
+                        help="Processa só o shard I de N das entradas (ex.: 0/4), para dividir entre máquinas")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocessa todas as entradas do --input, mesmo as que não mudaram")
+    parser.add_argument("--video", help="Vídeo, pasta de frames, URL RTSP ou câmera (ex.: 0) para processar frame a frame")
+    parser.add_argument("--stride", type=int, default=1, help="Processa um a cada N frames do vídeo")
+    parser.add_argument("--sample-interval", type=float, default=None,
+                        help="Amostra no máximo um frame a cada N segundos do vídeo")
+    parser.add_argument("--drop-frames", action="store_true",
+                        help="Descarta frames antigos quando a inferência fica para trás (câmeras ao vivo)")
+    parser.add_argument("--track", action="store_true",
+                        help="Com --video, roda o detector só em keyframes e rastreia os buracos entre eles, "
+                             "gerando um registro por buraco (ver tracking.py)")
+    parser.add_argument("--keyframe-stride", type=int, default=config.TRACK_KEYFRAME_STRIDE,
+                        help="Com --track, keyframe a cada N frames (no modo adaptativo, o máximo entre keyframes)")
+    parser.add_argument("--fixed-keyframes", action="store_true", default=not config.TRACK_ADAPTIVE_KEYFRAMES,
+                        help="Com --track, usa só o stride fixo, sem keyframes extras quando a cena se move rápido")
+    parser.add_argument("--fusion", choices=["wbf", "soft_nms", "nms"], default=fusion_strategy,
+                        help="Estratégia de fusão das detecções original + CLAHE")
+    parser.add_argument("--tile-size", type=int, default=detection_options["tile_size"],
+                        help="Faz a inferência em tiles de N x N pixels (imagens de alta resolução)")
+    parser.add_argument("--tile-overlap", type=float, default=detection_options["tile_overlap"],
+                        help="Fração de sobreposição entre tiles vizinhos")
+    parser.add_argument("--prefilter", action="store_true", default=config.PREFILTER_ENABLED,
+                        help="Só envia ao detector frames/tiles que o pré-filtro clássico marca como suspeitos")
+    parser.add_argument("--prefilter-threshold", type=float, default=config.PREFILTER_THRESHOLD,
+                        help="Score mínimo do pré-filtro (ver 'python prefilter.py' para escolher)")
+    parser.add_argument("--service", nargs="?", const=config.INFERENCE_SERVICE_ADDRESS, default=None,
+                        help="Usa o serviço de inferência residente (service.py) em vez de criar o backend; "
+                             "endereço opcional (padrão: INFERENCE_SERVICE_ADDRESS)")
+    parser.add_argument("--log-level", default=config.LOG_LEVEL,
+                        help="Nível de log: DEBUG, INFO, WARNING ou ERROR")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Modo silencioso: só avisos e erros (equivale a --log-level WARNING)")
+    parser.add_argument("--metrics", choices=["none", "prometheus", "jsonl"], default=config.METRICS_EXPORTER,
+                        help="Exporta as métricas em /metrics (Prometheus) ou em JSON lines")
+    parser.add_argument("--results-format", choices=list(RESULT_STORE_FORMATS), default=config.RESULT_STORE_FORMAT,
+                        help="Formato do dataset de detecções da execução (ver result_store.py)")
+    return parser.parse_args()
 
 def main():
-    all_results = []
-    for img_path in image_paths:
-        df_orig, df_clahe, img_name = process_single_image(img_path, output_base_dir, confidence_threshold_yolo)
-        if df_orig is not None and df_clahe is not None:
-            all_results.append({
-                'image_name': img_name,
-                'original_detections': df_orig,
-                'clahe_detections': df_clahe
-            })
-
-    print("\n--- Comparação de Confiabilidade ---")
-    for result in all_results:
-        img_name = result['image_name']
-        df_orig = result['original_detections']
-        df_clahe = result['clahe_detections']
-
-        print(f"\nImagem: {img_name}")
-        if not df_orig.empty:
-            avg_conf_orig = df_orig['confidence'].mean()
-            print(f"  Confiança média (Original): {avg_conf_orig:.4f}")
-        else:
-            print("  Nenhuma detecção na imagem original.")
-
-        if not df_clahe.empty:
-            avg_conf_clahe = df_clahe['confidence'].mean()
-            print(f"  Confiança média (CLAHE): {avg_conf_clahe:.4f}")
-        else:
-            print("  Nenhuma detecção na imagem CLAHE.")
+    args = parse_args()
+    metrics.setup_logging("WARNING" if args.quiet else args.log_level)
+    exporter = metrics.start_exporter(args.metrics)
+    try:
+        run(args)
+    finally:
+        # Também em erro ou Ctrl-C: para o servidor HTTP e grava o último snapshot JSONL
+        if exporter is not None:
+            exporter.close()
+
+def run(args):
+    """Executa o modo escolhido na linha de comando (lote, vídeo ou a lista de imagens) e imprime o resumo."""
+    global fusion_strategy
+    fusion_strategy = args.fusion
+    if args.service:
+        # Cliente leve: o modelo e o cliente HTTP ficam aquecidos no processo do serviço
+        set_backend(ServiceBackend(args.service))
+    detection_options.update(tile_size=args.tile_size or None, tile_overlap=args.tile_overlap,
+                             prefilter_threshold=args.prefilter_threshold if args.prefilter else None)
+    tracks = None
+    reported = False
+    if args.input:
+        # Modo em lote: o dataset de resultados e o manifesto ficam a cargo de process_directory,
+        # e os resultados não são acumulados em memória (podem ser centenas de milhares de imagens)
+        store = None
+        processed = sum(1 for _ in process_directory(args.input, output_base_dir, confidence_threshold_yolo,
+                                                     shard=args.shard, results_format=args.results_format,
+                                                     force=args.force))
+        print(f"\n{processed} imagens processadas em lote; manifesto e detecções em {output_base_dir}.")
+    else:
+        # Todas as detecções da execução vão para um único dataset (ver result_store.py)
+        store = ResultStore(os.path.join(output_base_dir, "detections"), fmt=args.results_format)
+        try:
+            if args.video and args.track:
+                tracks = track_video(args.video, output_base_dir, confidence_threshold_yolo, stride=args.stride,
+                                     sample_interval=args.sample_interval, keyframe_stride=args.keyframe_stride,
+                                     adaptive=not args.fixed_keyframes, store=store)
+            elif args.video:
+                # Vídeo ou câmera pode não ter fim: cada frame é reportado assim que termina,
+                # sem acumular os resultados
+                for result in process_video(args.video, output_base_dir, confidence_threshold_yolo,
+                                            stride=args.stride, sample_interval=args.sample_interval,
+                                            drop_frames=args.drop_frames, store=store):
+                    report_result(result, header=not reported)
+                    reported = True
+            else:
+                # Lista fixa de imagens: os resultados (só as detecções) são ordenados antes do relatório
+                results = process_images_pipelined(image_paths, output_base_dir, confidence_threshold_yolo,
+                                                   store=store)
+                for result in sorted(results, key=lambda result: result[0]):
+                    report_result(result, header=not reported)
+                    reported = True
+        finally:
+            store.close()
+
+    if tracks is not None:
+        print(f"\n{len(tracks)} buracos distintos rastreados no vídeo.")
+        for track in tracks:
+            print(f"  Trilha {track.track_id}: frames {track.first_frame}-{track.last_frame}, "
+                  f"melhor confiança {track.best_confidence:.4f} (frame {track.best_frame})")
+    if store is not None:
+        print(f"\nDetecções salvas em {store.path} ({store.rows_written} linhas).")
+
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"\nCache de inferência: {stats['memory_hits'] + stats['disk_hits']} acertos, "
+              f"{stats['misses']} faltas (taxa de acerto {stats['hit_rate']:.1%}).")
 
     print("Processamento de todas as imagens concluído.")
-    plt.close("all")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""Manifesto de execuções em lote: processamento incremental e retomável de pastas inteiras.
+
+Para cada entrada processada, o manifesto guarda o tamanho, o mtime e o hash
+do conteúdo do arquivo, a chave dos parâmetros de processamento (modelo,
+limiar, variantes, fusão, tiles) e onde ficaram as saídas. Em uma nova
+execução:
+
+- arquivos com o mesmo tamanho/mtime e os mesmos parâmetros são pulados sem
+  ler o conteúdo;
+- se só o mtime mudou (ex.: cópia), o hash decide;
+- o manifesto é um log JSON lines com uma linha por entrada concluída, gravada
+  só depois que as detecções estão em disco (ResultStore.when_durable), então
+  uma execução interrompida é retomada de onde parou.
+
+O trabalho pode ser dividido entre N processos ou máquinas com shard_of():
+cada entrada pertence a um shard pelo hash do seu caminho relativo, e cada
+shard usa seu próprio arquivo de manifesto.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from input_handler import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def content_hash(data):
+    """Hash (blake2b, 128 bits) de bytes já lidos."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_hash(path):
+    """Hash do conteúdo de um arquivo, lido em blocos."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dataset_hash(path):
+    """Hash de um dataset de resultados: um arquivo, ou uma pasta de segmentos (parquet segmentado).
+
+    Para uma pasta, combina os nomes dos arquivos (em ordem) com o hash de cada um; os
+    temporários ocultos de um segmento ainda sendo gravado são ignorados.
+    """
+    if not os.path.isdir(path):
+        return file_hash(path)
+    h = hashlib.blake2b(digest_size=16)
+    for name in sorted(os.listdir(path)):
+        part = os.path.join(path, name)
+        if name.startswith(".") or not os.path.isfile(part):
+            continue
+        h.update(f"{name}:{file_hash(part)}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def batch_image_name(key):
+    """Nome das saídas de uma entrada em lote (pastas, imagens e image_name nos resultados).
+
+    Mantém a extensão e escapa "/" como "%2F" (e "%" como "%25"), então chaves diferentes
+    nunca geram o mesmo nome e a chave pode ser recuperada com urllib.parse.unquote.
+    Ex.: "a/b.jpg" -> "a%2Fb.jpg", diferente de "a/b.png" e de "a__b.jpg".
+    """
+    return key.replace("%", "%25").replace("/", "%2F")
+
+
+def params_key(params):
+    """Chave estável para um dicionário de parâmetros de processamento."""
+    encoded = json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def shard_of(key, num_shards):
+    """Shard (0..num_shards-1) de uma entrada, pelo hash do seu caminho relativo."""
+    if num_shards <= 1:
+        return 0
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+
+def parse_shard(text):
+    """Converte "I/N" (ex.: "0/4") em (I, N)."""
+    index, count = (int(part) for part in text.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard inválido: {text} (use I/N com 0 <= I < N)")
+    return index, count
+
+
+def _glob_root(pattern):
+    """Parte inicial do padrão sem curingas (usada como raiz dos caminhos relativos)."""
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+
+def discover_inputs(patterns):
+    """Lista as imagens de pastas (recursivamente) e padrões glob.
+
+    Returns:
+        Lista ordenada de tuplas (chave, caminho), onde a chave é o caminho relativo à
+        pasta (ou à parte fixa do padrão glob), com "/" como separador.
+    """
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root = pattern
+            paths = (
+                os.path.join(dirpath, name)
+                for dirpath, _, names in os.walk(pattern)
+                for name in names
+            )
+        else:
+            root = _glob_root(pattern)
+            paths = glob.iglob(pattern, recursive=True)
+        for path in paths:
+            if os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS or not os.path.isfile(path):
+                continue
+            key = os.path.relpath(path, root).replace(os.sep, "/")
+            found.setdefault(key, path)
+    return sorted(found.items())
+
+
+class RunManifest:
+    """Registro das entradas já processadas (um arquivo JSON lines, só com appends).
+
+    Args:
+        path: Arquivo do manifesto.
+        params: Dicionário com os parâmetros de processamento da execução; entradas
+                processadas com outros parâmetros são refeitas.
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.params_key = params_key(params)
+        self.entries = {}
+        self._lock = threading.Lock()
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        lines = self._load()
+        # O log cresce a cada execução; reescreve quando há muitas linhas substituídas
+        if lines > 2 * len(self.entries) + 1000:
+            self.compact()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        lines = 0
+        if not os.path.exists(self.path):
+            return lines
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última linha pela metade de uma execução interrompida
+                    logger.warning("Linha inválida ignorada no manifesto %s", self.path)
+                    continue
+                self.entries[entry["key"]] = entry
+        logger.info("Manifesto %s: %d entradas já processadas.", self.path, len(self.entries))
+        return lines
+
+    def compact(self):
+        """Reescreve o manifesto com uma linha por entrada."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def is_done(self, key, path):
+        """True se a entrada já foi processada com os parâmetros atuais e não mudou desde então."""
+        entry = self.entries.get(key)
+        if entry is None or entry["params"] != self.params_key:
+            return False
+        st = os.stat(path)
+        if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return True
+        if entry["size"] != st.st_size:
+            return False
+        # Mesmo tamanho e mtime diferente (ex.: arquivo copiado): confere o conteúdo
+        if file_hash(path) != entry["hash"]:
+            return False
+        self.record(key, path, entry["hash"], entry["outputs"], stat=st)
+        return True
+
+    def record(self, key, path, digest, outputs, stat=None):
+        """Marca a entrada como concluída (chamar só depois que as saídas estão em disco)."""
+        st = stat or os.stat(path)
+        entry = {
+            "key": key,
+            "path": path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "hash": digest,
+            "params": self.params_key,
+            "outputs": outputs,
+        }
+        with self._lock:
+            self.entries[key] = entry
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def read_results(self):
+        """Detecções atuais de todas as entradas do manifesto, como DataFrame pandas.
+
+        Uma entrada reprocessada tem linhas em mais de um dataset de resultados; só as
+        do dataset registrado no manifesto são mantidas.
+        """
+        import pandas as pd
+
+        from result_store import read_results
+
+        names_by_dataset = {}
+        for entry in self.entries.values():
+            outputs = entry["outputs"]
+            names_by_dataset.setdefault(outputs["results"], set()).add(outputs["image_name"])
+        frames = []
+        for dataset, names in sorted(names_by_dataset.items()):
+            if not os.path.exists(dataset):
+                logger.warning("Dataset de resultados %s não encontrado.", dataset)
+                continue
+            df = read_results(dataset)
+            frames.append(df[df["image_name"].astype(str).isin(names)])
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""Instrumentação leve: contadores, gauges, histogramas e timers, com exportadores.
+
+Uso nos pontos quentes:
+
+    import metrics
+    with metrics.timer("inference_latency_seconds", backend="roboflow"):
+        ...
+    metrics.inc("inference_images_total", len(images))
+    metrics.observe("detections_per_image", len(detections))
+
+Com config.METRICS_ENABLED desligado, todas as funções viram no-ops (o timer
+retorna sempre o mesmo context manager vazio), então a instrumentação pode
+ficar no código de produção sem custo. Os valores podem ser expostos em
+formato texto do Prometheus (servidor HTTP em /metrics) ou gravados
+periodicamente em JSON lines.
+
+Também configura o logging do projeto (setup_logging): as mensagens de
+progresso usam logging em vez de print, e o modo silencioso (WARNING) não
+formata nem escreve nada por imagem.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# Buckets padrão (segundos) para histogramas de latência
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets para tamanhos em bytes
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 5e7)
+# Buckets para contagens (ex.: detecções por imagem)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+
+def _buckets_for(name):
+    if name.endswith("_seconds"):
+        return LATENCY_BUCKETS
+    if name.endswith("_bytes"):
+        return SIZE_BUCKETS
+    return COUNT_BUCKETS
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Timer:
+    """Context manager que registra a duração do bloco em um histograma."""
+
+    __slots__ = ("registry", "name", "labels", "start", "elapsed")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.registry.observe(self.name, self.elapsed, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+    elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    """Guarda contadores, gauges e histogramas em memória (thread-safe)."""
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(_buckets_for(name))
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        return _Timer(self, name, labels)
+
+    def snapshot(self):
+        """Retorna um dicionário serializável com o valor atual de todas as métricas."""
+        def name_str(name, labels):
+            return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "counters": {name_str(n, l): v for (n, l), v in self._counters.items()},
+                "gauges": {name_str(n, l): v for (n, l), v in self._gauges.items()},
+                "histograms": {
+                    name_str(n, l): {
+                        "count": h.count,
+                        "sum": h.sum,
+                        "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.counts)),
+                    }
+                    for (n, l), h in self._histograms.items()
+                },
+            }
+
+    def prometheus_text(self):
+        """Formata as métricas no formato texto de exposição do Prometheus."""
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            # Uma linha "# TYPE" por família, antes da primeira amostra (as chaves vêm ordenadas por nome)
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                declare(name, "counter")
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), value in sorted(self._gauges.items()):
+                declare(name, "gauge")
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items(), key=lambda item: item[0]):
+                declare(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {h.sum}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+class NullRegistry:
+    """Registro desligado: todas as operações são no-ops."""
+
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def set_gauge(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _NULL_TIMER
+
+    def snapshot(self):
+        return {"timestamp": time.time(), "counters": {}, "gauges": {}, "histograms": {}}
+
+    def prometheus_text(self):
+        return ""
+
+
+_registry = MetricsRegistry() if config.METRICS_ENABLED else NullRegistry()
+
+
+def get_registry():
+    return _registry
+
+
+def set_enabled(enabled):
+    """Liga ou desliga a coleta de métricas (desligada, a instrumentação não custa nada)."""
+    global _registry
+    if enabled and not _registry.enabled:
+        _registry = MetricsRegistry()
+    elif not enabled:
+        _registry = NullRegistry()
+    return _registry
+
+
+def inc(name, value=1, **labels):
+    _registry.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    _registry.set_gauge(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    _registry.observe(name, value, **labels)
+
+
+def timer(name, **labels):
+    return _registry.timer(name, **labels)
+
+
+class PrometheusExporter:
+    """Servidor HTTP que expõe as métricas em /metrics no formato texto do Prometheus."""
+
+    def __init__(self, host="127.0.0.1", port=9464):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = _registry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}/metrics"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logging.getLogger(__name__).info("Métricas Prometheus disponíveis em %s", self.url)
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JsonLinesExporter:
+    """Grava um snapshot das métricas em JSON lines a cada `interval` segundos (e ao fechar)."""
+
+    def __init__(self, path, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _write(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(_registry.snapshot()) + "\n")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+        self._write()
+
+
+def start_exporter(kind=None):
+    """Inicia o exportador configurado ("prometheus", "jsonl" ou "none"). Retorna o exportador ou None."""
+    kind = kind or config.METRICS_EXPORTER
+    if kind == "prometheus":
+        return PrometheusExporter(port=config.METRICS_PORT).start()
+    if kind == "jsonl":
+        return JsonLinesExporter(config.METRICS_JSONL_PATH, config.METRICS_JSONL_INTERVAL).start()
+    return None
+
+
+def setup_logging(level=None):
+    """Configura o logging do projeto (nível padrão: config.LOG_LEVEL)."""
+    level = level or config.LOG_LEVEL
+    logging.basicConfig(
+        level=getattr(logging, str(level).upper(), logging.INFO),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Servidor HTTP local que imita a API de detecção Roboflow (v0).
+
+Permite testar o caminho remoto (RoboflowBackend) sem rede:
+
+    python mock_server.py --port 9001 --latency-ms 80
+    python mock_server.py --port 9001 --latency-ms 50 --latency-jitter-ms 100 --error-rate 0.05 --rate-limit 20
+    ROBOFLOW_API_URL=http://127.0.0.1:9001 python main.py
+
+As predições são geradas de forma determinística a partir do hash da imagem,
+então a mesma imagem sempre recebe as mesmas caixas.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote_plus
+
+import cv2
+import numpy as np
+
+MOCK_CLASS_NAME = "Potholes"
+
+
+def fake_predictions(image_bytes, width, height, max_predictions=4):
+    """Gera predições determinísticas (formato Roboflow) a partir dos bytes da imagem."""
+    seed = int.from_bytes(hashlib.sha256(image_bytes).digest()[:8], "big")
+    rng = random.Random(seed)
+    predictions = []
+    for i in range(rng.randint(0, max_predictions)):
+        w = rng.uniform(0.05, 0.3) * width
+        h = rng.uniform(0.05, 0.3) * height
+        predictions.append({
+            "x": round(rng.uniform(w / 2, width - w / 2), 1),
+            "y": round(rng.uniform(h / 2, height - h / 2), 1),
+            "width": round(w, 1),
+            "height": round(h, 1),
+            "confidence": round(rng.uniform(0.1, 0.95), 4),
+            "class": MOCK_CLASS_NAME,
+            "class_id": 0,
+            "detection_id": f"{seed:016x}-{i}",
+        })
+    return predictions
+
+
+class MockRoboflowHandler(BaseHTTPRequestHandler):
+    """Atende POST /<projeto>/<versão>?api_key=... com a imagem em base64 no corpo."""
+
+    # Sobrescritos em make_server()
+    latency_ms = 0
+    latency_jitter_ms = 0
+    error_rate = 0.0
+    quota = None
+
+    def do_POST(self):
+        start = time.perf_counter()
+        # Falhas injetadas para testar retry, limite de taxa e circuit breaker dos clientes
+        if self.quota is not None and not self.quota.take():
+            self._send_json(429, {"message": "Rate limit exceeded"}, {"Retry-After": "1"})
+            return
+        if self.error_rate and random.random() < self.error_rate:
+            self._send_json(500, {"message": "Injected error"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        try:
+            payload = body.decode("ascii").strip()
+            if payload.startswith("image="):
+                # Corpo em formato de formulário (image=<base64>)
+                payload = unquote_plus(payload[len("image="):])
+            image_bytes = base64.b64decode(payload)
+            image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise ValueError("Não foi possível decodificar a imagem enviada")
+        except Exception as e:
+            self._send_json(400, {"message": f"Imagem inválida: {e}"})
+            return
+
+        if self.latency_ms or self.latency_jitter_ms:
+            time.sleep((self.latency_ms + random.uniform(0, self.latency_jitter_ms)) / 1000.0)
+
+        height, width = image.shape[:2]
+        self._send_json(200, {
+            "time": time.perf_counter() - start,
+            "image": {"width": width, "height": height},
+            "predictions": fake_predictions(image_bytes, width, height),
+        })
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Silencia o log por requisição do http.server
+        pass
+
+
+class _Quota:
+    """Cota de requisições por segundo (token bucket), compartilhada pelas threads do servidor."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def make_server(host="127.0.0.1", port=0, latency_ms=0, latency_jitter_ms=0, error_rate=0.0, rate_limit=None):
+    """Cria o servidor mock (port=0 escolhe uma porta livre).
+
+    Args:
+        latency_ms, latency_jitter_ms: Latência fixa mais uma parte aleatória (0 a jitter) por requisição.
+        error_rate: Fração das requisições respondidas com HTTP 500.
+        rate_limit: Cota de requisições por segundo; acima dela, HTTP 429 com Retry-After.
+    """
+    handler = type("ConfiguredMockHandler", (MockRoboflowHandler,), {
+        "latency_ms": latency_ms,
+        "latency_jitter_ms": latency_jitter_ms,
+        "error_rate": error_rate,
+        "quota": _Quota(rate_limit) if rate_limit else None,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_mock_server(host="127.0.0.1", port=0, latency_ms=0, latency_jitter_ms=0, error_rate=0.0, rate_limit=None):
+    """Inicia o servidor mock em uma thread daemon.
+
+    Returns:
+        server: Instância do servidor (use server.shutdown() para parar).
+        url: URL base para usar como api_url do RoboflowBackend.
+    """
+    server = make_server(host, port, latency_ms, latency_jitter_ms, error_rate, rate_limit)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita a API Roboflow.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latência artificial por requisição")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0, help="Latência aleatória extra (0 a N ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração das requisições que recebem HTTP 500")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="Cota de requisições por segundo; acima dela, HTTP 429")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency_ms, args.latency_jitter_ms, args.error_rate,
+                         args.rate_limit)
+    print(f"Servidor mock Roboflow ouvindo em http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
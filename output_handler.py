@@ -1,24 +1,41 @@
 import cv2
 import os
 import csv
-import matplotlib.pyplot as plt
+import logging
 import numpy as np
 
+import metrics
+
+logger = logging.getLogger(__name__)
+
 def save_image(image, output_path):
     """Salva uma imagem em um arquivo."""
     try:
         output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        cv2.imwrite(output_path, image)
-        print(f"Imagem salva com sucesso em: {output_path}")
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        # Codifica e grava separadamente para medir o tempo de cada etapa e os bytes escritos
+        with metrics.timer("image_encode_seconds"):
+            ok, encoded = cv2.imencode(os.path.splitext(output_path)[1] or ".jpg", image)
+        if not ok:
+            raise ValueError("falha na codificação da imagem")
+        with metrics.timer("image_write_seconds"):
+            with open(output_path, "wb") as f:
+                f.write(encoded)
+        metrics.inc("images_written_total")
+        metrics.inc("bytes_written_total", encoded.nbytes)
+        logger.debug("Imagem salva com sucesso em: %s", output_path)
         return True
     except Exception as e:
-        print(f"Erro ao salvar a imagem em {output_path}: {e}")
+        metrics.inc("write_errors_total")
+        logger.error("Erro ao salvar a imagem em %s: %s", output_path, e)
         return False
 
 def save_image_plot(image, title, output_path):
     """Salva a visualização de uma imagem como um plot Matplotlib."""
+    # Import local: o matplotlib leva centenas de ms para carregar e só é usado aqui
+    import matplotlib.pyplot as plt
+
     try:
         output_dir = os.path.dirname(output_path)
         if not os.path.exists(output_dir):
@@ -37,16 +54,16 @@ def save_image_plot(image, title, output_path):
         plt.axis('off') # Remove os eixos
         plt.savefig(output_path, bbox_inches='tight', dpi=150) # Salva com boa resolução
         plt.close() # Fecha a figura para liberar memória
-        print(f"Plot da imagem salvo com sucesso em: {output_path}")
+        logger.debug("Plot da imagem salvo com sucesso em: %s", output_path)
         return True
     except Exception as e:
-        print(f"Erro ao salvar o plot da imagem em {output_path}: {e}")
+        logger.error("Erro ao salvar o plot da imagem em %s: %s", output_path, e)
         return False
 
 def save_detections_to_csv(detections, output_path):
     """Salva os dados de detecção em um arquivo CSV."""
     if not detections:
-        print("Nenhuma detecção para salvar.")
+        logger.info("Nenhuma detecção para salvar.")
         return False
     
     try:
@@ -60,9 +77,10 @@ def save_detections_to_csv(detections, output_path):
             writer = csv.DictWriter(csvfile, fieldnames=header)
             writer.writeheader()
             writer.writerows(detections)
-        print(f"Dados de detecção salvos com sucesso em: {output_path}")
+        logger.debug("Dados de detecção salvos com sucesso em: %s", output_path)
         return True
     except Exception as e:
-        print(f"Erro ao salvar os dados de detecção em {output_path}: {e}")
+        metrics.inc("write_errors_total")
+        logger.error("Erro ao salvar os dados de detecção em %s: %s", output_path, e)
         return False
 
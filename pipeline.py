@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Execução em pipeline dos estágios decodificação -> pré-processamento -> inferência -> escrita.
+
+Cada estágio tem seu próprio grupo de threads e os estágios são ligados por
+filas limitadas: quando um estágio posterior fica para trás, as filas enchem
+e os estágios anteriores bloqueiam (backpressure), então o uso de memória
+fica limitado pelo tamanho das filas e não pelo número de entradas.
+
+Threads são suficientes aqui porque o OpenCV (imread/imwrite/cvtColor/CLAHE)
+e as chamadas de rede liberam o GIL.
+"""
+import logging
+import queue
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Stage:
+    """Um estágio do pipeline.
+
+    Args:
+        name: Nome do estágio (usado nas mensagens de erro).
+        fn: Função aplicada a cada item. Se batch_size > 1, recebe uma lista de itens e deve
+            retornar uma lista de resultados. Resultados None são descartados.
+        workers: Número de threads do estágio.
+        batch_size: Quantos itens agrupar por chamada de fn (1 = sem agrupamento).
+        batch_timeout: Tempo máximo (s) esperando completar um lote antes de processá-lo.
+    """
+
+    def __init__(self, name, fn, workers=1, batch_size=1, batch_timeout=0.05):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_timeout = batch_timeout
+
+
+class Pipeline:
+    """Encadeia estágios com filas limitadas entre eles."""
+
+    def __init__(self, stages, queue_size=16):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self._queues = []
+        self._cancelled = threading.Event()
+
+    def queue_depths(self):
+        """Retorna o número de itens aguardando na entrada de cada estágio (e na saída final)."""
+        names = [stage.name for stage in self.stages] + ["saida"]
+        return {name: q.qsize() for name, q in zip(names, self._queues)}
+
+    def _put(self, q, item):
+        # put com timeout para não ficar preso em uma fila cheia após um cancelamento
+        while not self._cancelled.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self, items):
+        try:
+            for item in items:
+                if not self._put(self._queues[0], item):
+                    return
+        except Exception as e:
+            logger.error("Erro ao ler as entradas do pipeline: %s", e)
+        finally:
+            self._put(self._queues[0], _STOP)
+
+    def _get(self, q, timeout=None):
+        """get que também retorna _STOP se o pipeline for cancelado. Levanta queue.Empty no timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._cancelled.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _next_batch(self, stage, in_q):
+        """Lê até stage.batch_size itens. Retorna (lote, recebeu_stop)."""
+        first = self._get(in_q)
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + stage.batch_timeout
+        while len(batch) < stage.batch_size:
+            try:
+                item = self._get(in_q, timeout=deadline - time.monotonic())
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _work(self, stage, in_q, out_q, remaining_workers, lock):
+        try:
+            while not self._cancelled.is_set():
+                batch, stopped = self._next_batch(stage, in_q)
+                metrics.set_gauge("pipeline_queue_depth", in_q.qsize(), stage=stage.name)
+                if batch:
+                    try:
+                        if stage.batch_size > 1:
+                            results = stage.fn(batch)
+                        else:
+                            results = [stage.fn(batch[0])]
+                    except Exception as e:
+                        logger.error("Erro no estágio '%s' do pipeline: %s", stage.name, e)
+                        metrics.inc("pipeline_errors_total", stage=stage.name)
+                        results = []
+                    for result in results:
+                        if result is not None and not self._put(out_q, result):
+                            return
+                if stopped:
+                    # Devolve o sinal de parada para as outras threads do mesmo estágio
+                    self._put(in_q, _STOP)
+                    return
+        finally:
+            with lock:
+                remaining_workers[0] -= 1
+                last = remaining_workers[0] == 0
+            if last:
+                self._put(out_q, _STOP)
+
+    def run(self, items):
+        """Processa os itens e gera os resultados do último estágio conforme ficam prontos.
+
+        A ordem de saída não é garantida; inclua um índice no item se precisar reordenar.
+        """
+        self._cancelled.clear()
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(items,), daemon=True)]
+
+        for i, stage in enumerate(self.stages):
+            remaining_workers = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, self._queues[i], self._queues[i + 1], remaining_workers, lock),
+                    daemon=True,
+                ))
+
+        for thread in threads:
+            thread.start()
+
+        out_q = self._queues[-1]
+        try:
+            while True:
+                result = out_q.get()
+                if result is _STOP:
+                    break
+                yield result
+        finally:
+            # Se o consumidor parar antes do fim, libera as threads bloqueadas nas filas
+            self._cancelled.set()
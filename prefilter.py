@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Pré-filtro clássico (OpenCV) que decide quais frames e tiles vão para o detector.
+
+A maioria dos frames de dashcam é asfalto limpo. Antes de gastar uma chamada
+de inferência, cada imagem é reduzida (PREFILTER_WORK_WIDTH) e recebe um
+score de 0 a 1 a partir de três mapas calculados uma única vez:
+
+- densidade de bordas (Canny), alta em bordas de buracos e rachaduras;
+- área de manchas escuras: pixels bem abaixo da mediana do cinza, após uma
+  abertura morfológica que remove ruído;
+- textura: desvio padrão local (janela 7x7) médio.
+
+Cada feature é normalizada por um valor de referência (satura em 1) e o
+score é a média ponderada. Scores de regiões (tiles) usam imagens integrais
+sobre os mesmos mapas, então todas as janelas são avaliadas de forma
+vetorizada. Frames/tiles com score abaixo do limiar não são enviados.
+
+O modo relatório compara os scores com uma referência (detecções de uma
+execução sem o filtro, ou labels YOLO) e mostra, para vários limiares, a
+perda de recall e as chamadas economizadas:
+
+    python prefilter.py --inputs frames/ --results output_processed/detections.parquet
+    python prefilter.py --inputs frames/ --labels labels/ --thresholds 0.1,0.2,0.3
+"""
+import argparse
+import logging
+import os
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+from classic_processing import PreprocessingPipeline, _morph_kernel
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ("edge_density", "dark_fraction", "texture")
+
+_edges = PreprocessingPipeline(["grayscale", ("blur", {"kernel_size": (5, 5)}),
+                                ("canny", {"low_threshold": 50, "high_threshold": 150})])
+
+
+def _small_gray(image, work_width):
+    height, width = image.shape[:2]
+    scale = min(1.0, work_width / width) if work_width else 1.0
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return gray, scale
+
+
+def feature_maps(image, work_width=None, dark_ratio=None):
+    """Calcula os mapas por pixel (na imagem reduzida) usados pelos scores.
+
+    Returns:
+        maps: Array float32 (3, H, W) com borda (0/1), mancha escura (0/1) e desvio padrão local.
+        scale: Fator de redução aplicado à imagem (para converter janelas).
+    """
+    work_width = config.PREFILTER_WORK_WIDTH if work_width is None else work_width
+    dark_ratio = config.PREFILTER_DARK_RATIO if dark_ratio is None else dark_ratio
+    gray, scale = _small_gray(image, work_width)
+
+    edges = _edges.apply(gray, copy_output=False)
+    # Manchas escuras: bem abaixo da mediana do cinza (o asfalto), sem os pixels isolados
+    dark = (gray < np.median(gray) * dark_ratio).view(np.uint8)
+    dark = cv2.morphologyEx(dark, cv2.MORPH_OPEN, _morph_kernel((3, 3)))
+
+    gray_f = gray.astype(np.float32)
+    mean = cv2.blur(gray_f, (7, 7))
+    mean_sq = cv2.blur(gray_f * gray_f, (7, 7))
+    local_std = np.sqrt(np.maximum(mean_sq - mean * mean, 0))
+
+    maps = np.stack([edges > 0, dark > 0, local_std]).astype(np.float32)
+    return maps, scale
+
+
+def _combine(features, weights=None):
+    """Normaliza as features (N, 3) pelas referências e retorna o score ponderado (N)."""
+    references = np.array(config.PREFILTER_REFERENCES, dtype=np.float32)
+    weights = np.array(weights or config.PREFILTER_WEIGHTS, dtype=np.float32)
+    normalized = np.minimum(features / references, 1.0)
+    return normalized @ (weights / weights.sum())
+
+
+def score_image(image, weights=None, work_width=None):
+    """Score (0 a 1) de uma imagem inteira. Retorna (score, {feature: valor})."""
+    maps, _ = feature_maps(image, work_width)
+    features = maps.reshape(3, -1).mean(axis=1)
+    score = float(_combine(features[None, :], weights)[0])
+    return score, dict(zip(FEATURES, features.tolist()))
+
+
+def score_regions(image, windows, weights=None, work_width=None):
+    """Score de cada janela (x1, y1, x2, y2), em coordenadas da imagem original.
+
+    Os mapas são calculados uma vez para a imagem inteira e as médias por janela vêm de
+    imagens integrais, então o custo por janela é constante.
+
+    Returns:
+        Array float32 com um score por janela.
+    """
+    if not len(windows):
+        return np.zeros(0, dtype=np.float32)
+    maps, scale = feature_maps(image, work_width)
+    height, width = maps.shape[1:]
+    boxes = np.round(np.asarray(windows, dtype=np.float64) * scale).astype(np.int64)
+    x1 = np.clip(boxes[:, 0], 0, width - 1)
+    y1 = np.clip(boxes[:, 1], 0, height - 1)
+    x2 = np.clip(boxes[:, 2], x1 + 1, width)
+    y2 = np.clip(boxes[:, 3], y1 + 1, height)
+    area = ((x2 - x1) * (y2 - y1)).astype(np.float64)
+
+    features = np.empty((len(boxes), 3), dtype=np.float32)
+    for i in range(3):
+        integral = cv2.integral(maps[i], sdepth=cv2.CV_64F)
+        sums = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        features[:, i] = sums / area
+    return _combine(features, weights)
+
+
+def should_infer(image, threshold=None):
+    """True se a imagem deve ir para o detector (score >= limiar)."""
+    threshold = config.PREFILTER_THRESHOLD if threshold is None else threshold
+    with metrics.timer("prefilter_seconds"):
+        score, _ = score_image(image)
+    forward = score >= threshold
+    metrics.inc("prefilter_forwarded_total" if forward else "prefilter_skipped_total")
+    logger.debug("Pré-filtro: score %.3f (limiar %.3f) -> %s", score, threshold,
+                 "detector" if forward else "pulado")
+    return forward
+
+
+def recall_report(scores, positives, thresholds):
+    """Recall e chamadas economizadas para cada limiar.
+
+    Args:
+        scores: Score de cada imagem.
+        positives: Booleano por imagem: a referência tem algum buraco.
+        thresholds: Limiares a avaliar.
+
+    Returns:
+        Lista de dicionários {threshold, forwarded, calls_saved, recall, missed}.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    positives = np.asarray(positives, dtype=bool)
+    thresholds = np.asarray(thresholds, dtype=np.float32)
+    # (limiares x imagens): vetorizado sobre todos os limiares de uma vez
+    forwarded = scores[None, :] >= thresholds[:, None]
+    num_positives = max(int(positives.sum()), 1)
+    hits = (forwarded & positives[None, :]).sum(axis=1)
+    rows = []
+    for threshold, fwd, hit in zip(thresholds.tolist(), forwarded.sum(axis=1).tolist(), hits.tolist()):
+        rows.append({
+            "threshold": threshold,
+            "forwarded": fwd,
+            "calls_saved": 1 - fwd / max(len(scores), 1),
+            "recall": hit / num_positives,
+            "missed": int(positives.sum()) - hit,
+        })
+    return rows
+
+
+def _reference_from_results(path, keys):
+    """Imagens com pelo menos uma detecção em um dataset de resultados (execução sem filtro)."""
+    from manifest import batch_image_name
+    from result_store import read_results
+
+    df = read_results(path)
+    with_detections = set(df["image_name"].astype(str))
+    names = [os.path.splitext(os.path.basename(key))[0] for key in keys]
+    batch_names = [batch_image_name(key) for key in keys]
+    return [a in with_detections or b in with_detections for a, b in zip(names, batch_names)]
+
+
+def _reference_from_labels(labels_dir, keys):
+    """Imagens com pelo menos uma caixa no label YOLO (.txt com o mesmo caminho relativo)."""
+    positives = []
+    for key in keys:
+        label_path = os.path.join(labels_dir, os.path.splitext(key)[0] + ".txt")
+        positive = False
+        if os.path.exists(label_path) and os.path.getsize(label_path) > 0:
+            with open(label_path, encoding="utf-8") as f:
+                positive = any(line.strip() for line in f)
+        positives.append(positive)
+    return positives
+
+
+def main():
+    from input_handler import load_image
+    from manifest import discover_inputs
+
+    parser = argparse.ArgumentParser(description="Relatório do pré-filtro: recall x chamadas economizadas.")
+    parser.add_argument("--inputs", action="append", required=True, help="Pasta ou padrão glob das imagens")
+    reference = parser.add_mutually_exclusive_group(required=True)
+    reference.add_argument("--results", help="Dataset de detecções de uma execução sem o pré-filtro")
+    reference.add_argument("--labels", help="Pasta com labels YOLO (.txt) no mesmo layout das imagens")
+    parser.add_argument("--thresholds", default="0.05,0.1,0.15,0.2,0.25,0.3,0.4,0.5")
+    args = parser.parse_args()
+
+    inputs = discover_inputs(args.inputs)
+    keys = [key for key, _ in inputs]
+    scores = []
+    for key, path in inputs:
+        image = load_image(path)
+        scores.append(score_image(image)[0] if image is not None else 1.0)
+    if args.results:
+        positives = _reference_from_results(args.results, keys)
+    else:
+        positives = _reference_from_labels(args.labels, keys)
+
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    print(f"{len(keys)} imagens, {sum(positives)} com buracos na referência.")
+    print(f"{'limiar':>8} {'enviadas':>9} {'economia':>9} {'recall':>7} {'perdidas':>9}")
+    for row in recall_report(scores, positives, thresholds):
+        print(f"{row['threshold']:8.2f} {row['forwarded']:9d} {row['calls_saved']:9.1%} "
+              f"{row['recall']:7.1%} {row['missed']:9d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""Armazenamento colunar das detecções de uma execução inteira.
+
+Em vez de um CSV por imagem e variante, todas as detecções da execução vão
+para um único dataset com colunas tipadas (imagem, variante, classe,
+confiança e caixa x1/y1/x2/y2). As escritas são acumuladas em memória e
+gravadas em blocos, então o estágio de escrita do pipeline pode chamar
+append() de várias threads sem criar arquivos pequenos.
+
+Formatos (config.RESULT_STORE_FORMAT):
+
+- "parquet": um row group por bloco (requer pyarrow). O arquivo é gravado como
+  `<nome>.parquet.tmp` e só recebe o nome final ao fechar, quando fica legível.
+  Com segmented=True, `<nome>.parquet` é uma pasta com um arquivo fechado por
+  bloco (`part-00000.parquet`, ...), legível mesmo se a execução for interrompida;
+- "binary": registros de tamanho fixo (RECORD_DTYPE) em `<nome>.bin`, com os
+  nomes de imagens, variantes e classes em `<nome>.json`. Pode ser lido com
+  np.memmap sem carregar o arquivo; o sidecar só conta os registros de blocos
+  completos, então uma execução interrompida continua legível;
+- "jsonl": uma detecção por linha, para inspeção manual;
+- "auto": parquet se pyarrow estiver instalado, senão binary.
+
+    with ResultStore("./output_processed/detections") as store:
+        store.append(detections, "rua_asfaltada1", "clahe")
+    df = read_results(store.path)
+
+Para execuções retomáveis (ver manifest.py), when_durable() avisa quando as
+detecções já adicionadas estão gravadas em disco.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_FORMATS = ("auto", "parquet", "binary", "jsonl")
+EXTENSIONS = {"parquet": ".parquet", "binary": ".bin", "jsonl": ".jsonl"}
+
+# Registro do formato binário (little-endian, 32 bytes por detecção)
+RECORD_DTYPE = np.dtype([
+    ("image_id", "<i8"),
+    ("variant_id", "<i2"),
+    ("class_id", "<i2"),
+    ("confidence", "<f4"),
+    ("x1", "<f4"),
+    ("y1", "<f4"),
+    ("x2", "<f4"),
+    ("y2", "<f4"),
+])
+
+
+def _pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_format(fmt=None):
+    fmt = fmt or config.RESULT_STORE_FORMAT
+    if fmt not in RESULT_STORE_FORMATS:
+        raise ValueError(f"Formato de resultados desconhecido: {fmt}. Opções: {', '.join(RESULT_STORE_FORMATS)}")
+    if fmt == "auto":
+        return "parquet" if _pyarrow_available() else "binary"
+    return fmt
+
+
+def _sidecar_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+class ResultStore:
+    """Coletor append-only das detecções de uma execução (thread-safe).
+
+    Args:
+        base_path: Caminho do dataset sem extensão (a extensão vem do formato).
+        fmt: "auto", "parquet", "binary" ou "jsonl" (padrão: config.RESULT_STORE_FORMAT).
+        flush_rows: Detecções acumuladas antes de gravar um bloco (padrão: config.RESULT_STORE_FLUSH_ROWS).
+        segmented: No formato parquet, grava cada bloco como um arquivo fechado dentro da pasta
+                   `<base_path>.parquet`, para que when_durable() não espere o close().
+    """
+
+    def __init__(self, base_path, fmt=None, flush_rows=None, segmented=False):
+        self.format = resolve_format(fmt)
+        self.segmented = segmented and self.format == "parquet"
+        self.path = base_path + EXTENSIONS[self.format]
+        self.flush_rows = max(1, flush_rows or config.RESULT_STORE_FLUSH_ROWS)
+        self.rows_written = 0
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_rows = 0
+        self._image_ids = {}
+        self._variant_ids = {}
+        self._class_names = {}
+        self._writer = None
+        self._segments = 0
+        self._durable_callbacks = []
+        self._closed = False
+
+        output_dir = os.path.dirname(self.path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        # Cada execução começa um dataset novo
+        stale = [self.path, _sidecar_path(self.path)] if self.format == "binary" else [self.path]
+        for path in stale:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        if self.segmented:
+            os.makedirs(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _id_for(self, table, name):
+        if name not in table:
+            table[name] = len(table)
+        return table[name]
+
+    def append(self, detections, image_name, variant):
+        """Adiciona as detecções (objeto Detections) de uma imagem e variante."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"ResultStore {self.path} já foi fechado.")
+            image_id = self._id_for(self._image_ids, image_name)
+            variant_id = self._id_for(self._variant_ids, variant)
+            if detections is None or not len(detections):
+                return
+            self._class_names.update(detections.class_names)
+            records = np.empty(len(detections), dtype=RECORD_DTYPE)
+            records["image_id"] = image_id
+            records["variant_id"] = variant_id
+            records["class_id"] = detections.class_id
+            records["confidence"] = detections.confidence
+            for column, name in enumerate(("x1", "y1", "x2", "y2")):
+                records[name] = detections.xyxy[:, column]
+            self._pending.append(records)
+            self._pending_rows += len(records)
+            if self._pending_rows >= self.flush_rows:
+                self._flush()
+
+    def when_durable(self, callback):
+        """Chama callback() quando tudo o que já foi adicionado estiver gravado em disco.
+
+        Nos formatos binary, jsonl e parquet segmentado isso acontece no próximo bloco
+        gravado; no parquet em arquivo único, só ao fechar (antes disso o arquivo não tem
+        rodapé e não pode ser lido).
+        """
+        with self._lock:
+            if not self._pending and self._durable_per_flush:
+                callback()
+            else:
+                self._durable_callbacks.append(callback)
+
+    @property
+    def _durable_per_flush(self):
+        return self.format != "parquet" or self.segmented
+
+    def _run_durable_callbacks(self):
+        callbacks, self._durable_callbacks = self._durable_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Erro no callback de gravação do ResultStore %s: %s", self.path, e)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        records = np.concatenate(self._pending)
+        self._pending, self._pending_rows = [], 0
+        with metrics.timer("result_store_flush_seconds", format=self.format):
+            if self.format == "parquet":
+                self._write_parquet(records)
+            elif self.format == "binary":
+                self._write_binary(records)
+            else:
+                self._write_jsonl(records)
+        self.rows_written += len(records)
+        metrics.inc("result_store_rows_total", len(records), format=self.format)
+        if self._durable_per_flush:
+            self._run_durable_callbacks()
+
+    def _names(self, table):
+        names = [None] * len(table)
+        for name, index in table.items():
+            names[index] = name
+        return names
+
+    def _write_parquet(self, records):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        image_names = np.array(self._names(self._image_ids), dtype=object)
+        variant_names = np.array(self._names(self._variant_ids), dtype=object)
+        class_names = [self._class_names.get(int(c), str(int(c))) for c in records["class_id"]]
+        table = pa.table({
+            "image_id": pa.array(records["image_id"]),
+            "image_name": pa.array(image_names[records["image_id"]], type=pa.string()).dictionary_encode(),
+            "variant": pa.array(variant_names[records["variant_id"]], type=pa.string()).dictionary_encode(),
+            "class_id": pa.array(records["class_id"]),
+            "class_name": pa.array(class_names, type=pa.string()).dictionary_encode(),
+            "confidence": pa.array(records["confidence"]),
+            "x1": pa.array(records["x1"]),
+            "y1": pa.array(records["y1"]),
+            "x2": pa.array(records["x2"]),
+            "y2": pa.array(records["y2"]),
+        })
+        if self.segmented:
+            # Arquivo oculto enquanto é gravado (read_results e o pyarrow ignoram), depois a troca
+            name = f"part-{self._segments:05d}.parquet"
+            tmp_path = os.path.join(self.path, f".{name}.tmp")
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, os.path.join(self.path, name))
+            self._segments += 1
+            return
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path + ".tmp", table.schema)
+        self._writer.write_table(table)
+
+    def _write_binary(self, records):
+        with open(self.path, "ab") as f:
+            f.write(records.tobytes())
+        self._write_sidecar(self.rows_written + len(records))
+
+    def _write_sidecar(self, rows):
+        sidecar = {
+            "format": "binary",
+            "rows": rows,
+            "dtype": RECORD_DTYPE.descr,
+            "images": self._names(self._image_ids),
+            "variants": self._names(self._variant_ids),
+            "class_names": {str(k): v for k, v in self._class_names.items()},
+        }
+        # Grava em arquivo temporário e troca, para nunca deixar um sidecar pela metade
+        sidecar_path = _sidecar_path(self.path)
+        with open(sidecar_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(sidecar, f)
+        os.replace(sidecar_path + ".tmp", sidecar_path)
+
+    def _write_jsonl(self, records):
+        image_names = self._names(self._image_ids)
+        variant_names = self._names(self._variant_ids)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for r in records.tolist():
+                image_id, variant_id, class_id, confidence, x1, y1, x2, y2 = r
+                f.write(json.dumps({
+                    "image_id": image_id,
+                    "image_name": image_names[image_id],
+                    "variant": variant_names[variant_id],
+                    "class_id": class_id,
+                    "class_name": self._class_names.get(class_id, str(class_id)),
+                    "confidence": confidence,
+                    "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                }) + "\n")
+
+    def close(self):
+        """Grava o bloco pendente e fecha o dataset."""
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            if self.format == "binary":
+                # Sidecar também para execuções sem nenhuma detecção
+                self._write_sidecar(self.rows_written)
+            if self._writer is not None:
+                self._writer.close()
+                os.replace(self.path + ".tmp", self.path)
+            self._closed = True
+            self._run_durable_callbacks()
+        logger.info("%d detecções salvas em %s", self.rows_written, self.path)
+
+
+def memmap_records(path):
+    """Abre um dataset binário como array estruturado mapeado em memória.
+
+    Returns:
+        (records, sidecar): array com RECORD_DTYPE (sem cópia) e os metadados do sidecar
+        (nomes de imagens, variantes e classes).
+    """
+    with open(_sidecar_path(path), "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    if sidecar["rows"] == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE), sidecar
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(sidecar["rows"],))
+    return records, sidecar
+
+
+def read_results(path):
+    """Lê um dataset de resultados (qualquer formato) como DataFrame pandas.
+
+    `path` também pode ser um diretório com vários datasets (ex.: um por execução),
+    que são concatenados; arquivos .tmp de execuções interrompidas são ignorados.
+
+    Colunas: image_id, image_name, variant, class_id, class_name, confidence, x1, y1, x2, y2.
+    """
+    import pandas as pd
+
+    if os.path.isdir(path):
+        segments = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if os.path.splitext(name)[1] in EXTENSIONS.values()
+        )
+        frames = [read_results(segment) for segment in segments]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, memory_map=True).to_pandas()
+    if path.endswith(".jsonl"):
+        return pd.read_json(path, lines=True)
+
+    records, sidecar = memmap_records(path)
+    images = np.array(sidecar["images"], dtype=object)
+    variants = np.array(sidecar["variants"], dtype=object)
+    class_names = {int(k): v for k, v in sidecar["class_names"].items()}
+    return pd.DataFrame({
+        "image_id": records["image_id"],
+        "image_name": pd.Categorical.from_codes(records["image_id"], images) if len(images) else [],
+        "variant": pd.Categorical.from_codes(records["variant_id"], variants) if len(variants) else [],
+        "class_id": records["class_id"],
+        "class_name": [class_names.get(int(c), str(int(c))) for c in records["class_id"]],
+        "confidence": records["confidence"],
+        "x1": records["x1"],
+        "y1": records["y1"],
+        "x2": records["x2"],
+        "y2": records["y2"],
+    })
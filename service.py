@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""Serviço de inferência residente: backend aquecido, API local e micro-lotes.
+
+Cada `python main.py` paga de novo a inicialização do backend (cliente HTTP,
+pesos do modelo local). Este serviço cria o backend uma vez e atende pedidos
+de inferência por um socket Unix ou por HTTP em localhost:
+
+    python service.py --socket /tmp/detectar_buracos.sock
+    python service.py --port 9100 --backend onnx
+
+    python main.py --service unix:///tmp/detectar_buracos.sock
+    INFERENCE_BACKEND=service INFERENCE_SERVICE_ADDRESS=http://127.0.0.1:9100 python main.py
+
+API (JSON):
+
+- POST /detect: {"images": [job, ...], "confidence": 0.25, "format": "json" | "columnar"},
+  onde cada job é {"path": "foto.jpg"}, {"bytes": "<base64 do arquivo>"} ou
+  {"shm": {"name": ..., "shape": [h, w, 3], "dtype": "uint8", "pid": ...}} (imagem já decodificada
+  em multiprocessing.shared_memory, sem codificar/decodificar). Também aceita o
+  arquivo da imagem direto no corpo (Content-Type image/*). Retorna
+  {"model_key": ..., "results": [...]}, com as predições de cada imagem no formato
+  Roboflow ("json") ou em colunas xywh/confidence/class_id ("columnar"), ou
+  {"error": ...} para a imagem que falhou.
+- GET /health: backend e model_key (entra nas chaves do cache dos clientes).
+- GET /metrics: métricas no formato Prometheus.
+
+Imagens que chegam juntas (de uma ou de várias conexões) são agrupadas em um
+único infer_batch do backend: o MicroBatcher espera até SERVICE_BATCH_DEADLINE_MS
+pelo próximo pedido ou até juntar INFERENCE_BATCH_SIZE imagens.
+"""
+import argparse
+import base64
+import http.client
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Junta pedidos de inferência concorrentes em lotes para o backend.
+
+    Args:
+        backend: InferenceBackend já criado (fica aquecido durante toda a vida do serviço).
+        max_batch: Máximo de imagens por chamada (padrão: config.INFERENCE_BATCH_SIZE).
+        deadline_ms: Quanto o primeiro pedido de um lote espera por outros (padrão:
+                     config.SERVICE_BATCH_DEADLINE_MS).
+    """
+
+    def __init__(self, backend, max_batch=None, deadline_ms=None):
+        self.backend = backend
+        self.max_batch = max(1, max_batch or config.INFERENCE_BATCH_SIZE)
+        self.deadline = (config.SERVICE_BATCH_DEADLINE_MS if deadline_ms is None else deadline_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """Enfileira uma imagem BGR; retorna um Future com a lista de predições raw."""
+        future = Future()
+        self._queue.put((image, future, time.perf_counter()))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.deadline
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._run(batch)
+
+    def _run(self, batch):
+        start = time.perf_counter()
+        for _, _, submitted in batch:
+            metrics.observe("service_queue_wait_seconds", start - submitted)
+        metrics.observe("service_batch_size", len(batch))
+        try:
+            with metrics.timer("service_batch_seconds"):
+                results = self.backend.infer_batch([image for image, _, _ in batch])
+        except Exception as e:
+            logger.error("Erro no lote de %d imagens: %s", len(batch), e)
+            metrics.inc("service_errors_total", len(batch))
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), predictions in zip(batch, results):
+            future.set_result(predictions)
+
+
+def _attach_shared_memory(name, owner_pid=None):
+    from multiprocessing import resource_tracker, shared_memory
+
+    shm = shared_memory.SharedMemory(name=name)
+    if owner_pid != os.getpid():
+        # O bloco pertence ao cliente: sem isso, o resource_tracker deste processo o apagaria ao sair
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _decode_job(job):
+    """Imagem BGR de um job."""
+    if "path" in job:
+        image = cv2.imread(job["path"], cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Não foi possível ler a imagem {job['path']}")
+        return image
+    if "bytes" in job:
+        image = cv2.imdecode(np.frombuffer(base64.b64decode(job["bytes"]), np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Não foi possível decodificar a imagem enviada")
+        return image
+    if "shm" in job:
+        spec = job["shm"]
+        shm = _attach_shared_memory(spec["name"], spec.get("pid"))
+        try:
+            # Uma cópia em memória (sem codificar nem decodificar); o bloco pode ser liberado pelo
+            # cliente assim que a resposta chegar, enquanto o lote ainda referencia a imagem
+            return np.array(np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec.get("dtype", "uint8")),
+                                       buffer=shm.buf))
+        finally:
+            shm.close()
+    raise ValueError("Job sem 'path', 'bytes' ou 'shm'")
+
+
+def _columnar(predictions):
+    return {
+        "xywh": [[p["x"], p["y"], p["width"], p["height"]] for p in predictions],
+        "confidence": [p["confidence"] for p in predictions],
+        "class_id": [p.get("class_id", 0) for p in predictions],
+        "class_names": {str(p.get("class_id", 0)): p.get("class", "") for p in predictions},
+    }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Requisições da API do serviço. O batcher é definido em make_server()."""
+
+    protocol_version = "HTTP/1.1"
+    batcher = None
+
+    def do_GET(self):
+        if self.path == "/health":
+            backend = self.batcher.backend
+            self._send(200, json.dumps({"status": "ok", "backend": backend.name,
+                                        "model_key": backend.model_key}).encode("utf-8"))
+        elif self.path == "/metrics":
+            self._send(200, metrics.get_registry().prometheus_text().encode("utf-8"),
+                       "text/plain; version=0.0.4")
+        else:
+            self._send(404, b'{"error": "not found"}')
+
+    def do_POST(self):
+        if self.path != "/detect":
+            self._send(404, b'{"error": "not found"}')
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        content_type = self.headers.get("Content-Type", "")
+        try:
+            if content_type.startswith("image/"):
+                request = {"images": [{"bytes": base64.b64encode(body).decode("ascii")}]}
+            else:
+                request = json.loads(body)
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send(400, json.dumps({"error": f"Requisição inválida: {e}"}).encode("utf-8"))
+            return
+        metrics.inc("service_requests_total")
+
+        confidence = request.get("confidence", 0.0)
+        columnar = request.get("format", "json") == "columnar"
+        # Decodifica tudo e enfileira junto, para as imagens do pedido caírem no mesmo lote
+        pending = []
+        for job in request.get("images", []):
+            try:
+                pending.append(self.batcher.submit(_decode_job(job)))
+            except Exception as e:
+                pending.append(e)
+        results = []
+        for item in pending:
+            try:
+                if not isinstance(item, Future):
+                    raise item
+                predictions = item.result()
+                if predictions is None:
+                    raise RuntimeError("falha na inferência desta imagem")
+            except Exception as e:
+                results.append({"error": str(e)})
+                continue
+            predictions = [p for p in predictions if p.get("confidence", 0.0) >= confidence]
+            results.append(_columnar(predictions) if columnar else {"predictions": predictions})
+        self._send(200, json.dumps({"model_key": self.batcher.backend.model_key, "results": results}).encode("utf-8"))
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Conexões por socket Unix não têm (host, porta)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    # Vários clientes (ou threads de um cliente) conectando ao mesmo tempo
+    request_queue_size = 128
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+def parse_address(address):
+    """("unix", caminho) ou ("tcp", (host, porta)) de "unix:///caminho", "/caminho.sock",
+    "http://host:porta" ou "host:porta"."""
+    address = address or config.INFERENCE_SERVICE_ADDRESS
+    if address.startswith("unix://"):
+        return "unix", address[len("unix://"):]
+    if address.startswith("/") or address.endswith(".sock"):
+        return "unix", address
+    parsed = urlparse(address if "://" in address else f"http://{address}")
+    return "tcp", (parsed.hostname or "127.0.0.1", parsed.port or 9100)
+
+
+def make_server(backend, address=None, max_batch=None, deadline_ms=None):
+    """Cria o servidor (ainda sem atender) e o MicroBatcher do backend."""
+    batcher = MicroBatcher(backend, max_batch, deadline_ms)
+    handler = type("ConfiguredServiceHandler", (ServiceHandler,), {"batcher": batcher})
+    kind, target = parse_address(address)
+    server = UnixHTTPServer(target, handler) if kind == "unix" else LocalHTTPServer(target, handler)
+    return server, batcher
+
+
+def start_service(backend, address=None, max_batch=None, deadline_ms=None):
+    """Inicia o serviço em uma thread daemon. Retorna (server, batcher)."""
+    server, batcher = make_server(backend, address, max_batch, deadline_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, batcher
+
+
+# --- Cliente ---
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class ServiceClient:
+    """Cliente do serviço (conexões keep-alive, uma por thread).
+
+    Args:
+        address: Endereço do serviço (ver parse_address; padrão: config.INFERENCE_SERVICE_ADDRESS).
+        timeout: Timeout de cada requisição, em segundos.
+    """
+
+    def __init__(self, address=None, timeout=120.0):
+        self.kind, self.target = parse_address(address)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.kind == "unix":
+                connection = _UnixHTTPConnection(self.target, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(*self.target, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def request(self, method, path, body=None):
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # Conexão keep-alive fechada pelo servidor: reconecta uma vez
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"Serviço de inferência respondeu {response.status}: {data[:200]!r}")
+        return data
+
+    def health(self):
+        return json.loads(self.request("GET", "/health"))
+
+    def detect(self, jobs, confidence=0.0, fmt="json"):
+        """Envia jobs ({"path"}, {"bytes"} ou {"shm"}) e retorna a lista de resultados por imagem."""
+        body = json.dumps({"images": jobs, "confidence": confidence, "format": fmt}).encode("utf-8")
+        return json.loads(self.request("POST", "/detect", body))["results"]
+
+
+def main():
+    from inference_backends import create_backend
+
+    parser = argparse.ArgumentParser(description="Serviço de inferência residente (socket Unix ou HTTP local).")
+    address = parser.add_mutually_exclusive_group()
+    address.add_argument("--socket", help="Caminho do socket Unix")
+    address.add_argument("--port", type=int, help="Porta HTTP em 127.0.0.1")
+    parser.add_argument("--backend", default=config.INFERENCE_BACKEND,
+                        help="Backend aquecido pelo serviço: roboflow, ultralytics ou onnx")
+    parser.add_argument("--max-batch", type=int, default=config.INFERENCE_BATCH_SIZE)
+    parser.add_argument("--deadline-ms", type=float, default=config.SERVICE_BATCH_DEADLINE_MS)
+    parser.add_argument("--log-level", default=config.LOG_LEVEL)
+    args = parser.parse_args()
+    metrics.setup_logging(args.log_level)
+
+    if args.backend == "service":
+        parser.error("O serviço precisa de um backend real (roboflow, ultralytics ou onnx).")
+    address = (f"unix://{args.socket}" if args.socket else
+               f"127.0.0.1:{args.port}" if args.port else config.INFERENCE_SERVICE_ADDRESS)
+    backend = create_backend(args.backend)
+    server, batcher = make_server(backend, address, args.max_batch, args.deadline_ms)
+    logger.info("Serviço de inferência (%s) ouvindo em %s", backend.model_key, address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        if parse_address(address)[0] == "unix" and os.path.exists(server.server_address):
+            os.remove(server.server_address)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from analysis import SurveyIndex, ingest_results
+from detections import Detections
+from result_store import ResultStore
+
+pytest.importorskip("pyarrow")
+
+
+def _write_segmented(base_path, names):
+    # flush_rows=1: um segmento por imagem, como em uma execução em lote longa
+    store = ResultStore(base_path, fmt="parquet", flush_rows=1, segmented=True)
+    for name in names:
+        store.append(Detections([[10, 10, 50, 50]], [0.8]), name, "fused_wbf")
+    store.close()
+    return store.path
+
+
+def test_ingest_segmented_parquet_dataset(tmp_path):
+    path = _write_segmented(str(tmp_path / "run"), ["a%2Fb.jpg", "c.jpg"])
+    positions = {"a%2Fb.jpg": (-23.55, -46.63, 0.0), "c.jpg": (-23.56, -46.64, 0.0)}
+    index = SurveyIndex()
+
+    assert ingest_results(index, path, positions) == 2
+    assert len(index) == 2
+    # O mesmo dataset não é somado duas vezes
+    assert ingest_results(index, path, positions) is None
+
+
+def test_segmented_dataset_id_changes_with_new_segments(tmp_path):
+    from manifest import dataset_hash
+
+    first = _write_segmented(str(tmp_path / "one"), ["a.jpg"])
+    second = _write_segmented(str(tmp_path / "two"), ["a.jpg", "b.jpg"])
+    assert dataset_hash(first) != dataset_hash(second)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from detections import Detections
+from evaluation import choose_config, evaluate_predictions, match_predictions, rank_configs
+
+LABEL = [0, 0, 100, 100]
+
+
+def boxes(*items, class_id=0):
+    """Detections a partir de pares (caixa, confiança)."""
+    if not items:
+        return Detections.empty()
+    xyxy, confidence = zip(*items)
+    return Detections(xyxy, confidence, [class_id] * len(items))
+
+
+def labels(*xyxy, class_id=0):
+    return Detections(xyxy, np.ones(len(xyxy)), [class_id] * len(xyxy))
+
+
+def test_perfect_match():
+    result = evaluate_predictions([boxes((LABEL, 0.9))], [labels(LABEL)])
+    assert result["precision"] == result["recall"] == 1.0
+    assert result["map50"] == pytest.approx(1.0)
+    assert result["map50_95"] == pytest.approx(1.0)
+
+
+def test_false_positive_ranked_above_true_positive():
+    # Ordem por confiança: FP, TP -> precisão 0.5 no recall 1; o envelope vale 0.5 nos 101 pontos
+    predictions = boxes(([200, 200, 300, 300], 0.9), (LABEL, 0.8))
+    result = evaluate_predictions([predictions], [labels(LABEL)])
+    assert result["precision"] == pytest.approx(0.5)
+    assert result["recall"] == pytest.approx(1.0)
+    assert result["map50"] == pytest.approx(0.5)
+
+
+def test_101_point_interpolation():
+    # TP, FP, TP com 2 labels: recall (0.5, 0.5, 1), envelope da precisão (1, 2/3, 2/3).
+    # Os 51 pontos de recall em [0, 0.5] valem 1 e os 50 em (0.5, 1] valem 2/3.
+    second = [200, 200, 300, 300]
+    predictions = boxes((LABEL, 0.9), ([400, 400, 500, 500], 0.8), (second, 0.7))
+    result = evaluate_predictions([predictions], [labels(LABEL, second)])
+    assert result["map50"] == pytest.approx((51 + 50 * 2 / 3) / 101)
+
+
+def test_two_predictions_competing_for_one_label():
+    # A de maior confiança tem IoU 0.8; a outra, IoU 1. O label só casa com uma (a de maior IoU).
+    predictions = boxes(([0, 0, 100, 80], 0.9), (LABEL, 0.7))
+    tp = match_predictions(predictions, labels(LABEL), [0.5, 0.75, 0.9])
+    np.testing.assert_array_equal(tp, [[False, False, False], [True, True, True]])
+
+    result = evaluate_predictions([predictions], [labels(LABEL)])
+    assert result["precision"] == pytest.approx(0.5)
+    assert result["map50"] == pytest.approx(0.5)
+
+
+def test_iou_thresholds_of_map50_95():
+    # IoU 0.72: acerto nos limiares 0.5 a 0.7 (5 de 10)
+    result = evaluate_predictions([boxes(([0, 0, 100, 72], 0.9))], [labels(LABEL)])
+    assert result["map50"] == pytest.approx(1.0)
+    assert result["map50_95"] == pytest.approx(0.5)
+
+
+def test_label_without_predictions():
+    result = evaluate_predictions([boxes()], [labels(LABEL)])
+    assert result["recall"] == 0.0
+    assert result["map50"] == 0.0
+
+
+def test_map_averages_classes_present_in_labels():
+    # Classe 0 perfeita, classe 1 sem predições: mAP = (1 + 0) / 2
+    ground_truth = Detections([LABEL, [200, 200, 300, 300]], [1, 1], [0, 1])
+    result = evaluate_predictions([boxes((LABEL, 0.9))], [ground_truth])
+    assert result["map50"] == pytest.approx(0.5)
+
+
+def test_failed_image_counts_as_no_predictions():
+    result = evaluate_predictions([None, boxes((LABEL, 0.9))], [labels(LABEL), labels(LABEL)])
+    assert result["recall"] == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("class_agnostic, expected", [(False, 0.0), (True, 1.0)])
+def test_class_mismatch(class_agnostic, expected):
+    predictions = boxes((LABEL, 0.9), class_id=1)
+    result = evaluate_predictions([predictions], [labels(LABEL, class_id=0)], class_agnostic=class_agnostic)
+    assert result["precision"] == expected
+    assert result["map50"] == pytest.approx(expected)
+
+
+def test_rank_and_choose_config():
+    rows = [
+        {"config": "clahe_lento", "map50": 0.8, "total_ms": 30.0},
+        {"config": "original", "map50": 0.6, "total_ms": 10.0},
+        {"config": "clahe_rapido", "map50": 0.8, "total_ms": 20.0},
+        {"config": "blur", "map50": 0.4, "total_ms": 5.0},
+    ]
+    # Métrica decrescente; empate decidido pela mais rápida
+    assert [row["config"] for row in rank_configs(rows)] == ["clahe_rapido", "clahe_lento", "original", "blur"]
+    assert choose_config(rows, 0.5)["config"] == "original"
+    assert choose_config(rows, 0.8)["config"] == "clahe_rapido"
+    assert choose_config(rows, 0.9) is None
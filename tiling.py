@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Divisão de imagens de alta resolução em tiles para inferência fatiada.
+
+O modelo reduz a imagem inteira para o seu tamanho de entrada (640 px), e
+buracos pequenos em ortofotos ou frames 4K somem nessa redução. Inferindo em
+tiles sobrepostos, cada buraco é visto na resolução original. Os tiles são
+views (fatias) do array original, sem cópia.
+"""
+import numpy as np
+
+
+def tile_windows(height, width, tile_size, overlap=0.2):
+    """Calcula as janelas (x1, y1, x2, y2) que cobrem a imagem com a sobreposição pedida.
+
+    A última janela de cada linha/coluna é alinhada à borda, então todas as janelas
+    têm tile_size x tile_size (exceto quando a própria imagem é menor que o tile).
+    """
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def is_uninformative_tile(tile, min_std=6.0, sky_brightness=170, sky_blue_margin=15, sample_step=8):
+    """Verificação barata para pular tiles que não podem conter buracos.
+
+    Usa só uma amostra esparsa dos pixels (a cada `sample_step`). Um tile é pulado se:
+    - é praticamente liso (desvio padrão do cinza < min_std): área vazia, borda preta,
+      capô do veículo ou céu sem nuvens;
+    - parece céu: claro e com o canal azul dominante.
+
+    Returns:
+        True se o tile pode ser pulado.
+    """
+    sample = tile[::sample_step, ::sample_step]
+    if sample.size == 0:
+        return True
+    sample = sample.astype(np.float32)
+    if sample.ndim == 3:
+        blue, green, red = sample[..., 0], sample[..., 1], sample[..., 2]
+        gray = 0.114 * blue + 0.587 * green + 0.299 * red
+        if gray.mean() > sky_brightness and blue.mean() > red.mean() + sky_blue_margin and blue.mean() >= green.mean():
+            return True
+    else:
+        gray = sample
+    return float(gray.std()) < min_std
+
+
+def split_into_tiles(image, tile_size, overlap=0.2, skip_uninformative=True, min_score=None):
+    """Divide a imagem em tiles (views do array original).
+
+    Args:
+        min_score: Se informado, tiles com score do pré-filtro (prefilter.score_regions)
+                   abaixo desse valor também são pulados.
+
+    Returns:
+        Lista de (x_offset, y_offset, tile) apenas com os tiles que devem ir ao detector.
+    """
+    height, width = image.shape[:2]
+    windows = tile_windows(height, width, tile_size, overlap)
+    keep = [True] * len(windows)
+    if min_score is not None:
+        from prefilter import score_regions
+
+        keep = (score_regions(image, windows) >= min_score).tolist()
+    tiles = []
+    for (x1, y1, x2, y2), forward in zip(windows, keep):
+        tile = image[y1:y2, x1:x2]
+        if not forward or (skip_uninformative and is_uninformative_tile(tile)):
+            continue
+        tiles.append((x1, y1, tile))
+    return tiles
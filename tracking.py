@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""Rastreamento de buracos entre frames de vídeo, com o detector só em keyframes.
+
+Frames consecutivos de um vídeo a 30 fps mostram quase sempre os mesmos
+buracos. Em vez de chamar o detector em todo frame:
+
+- KeyframeScheduler decide quando chamar o detector: a cada N frames
+  (stride fixo) ou quando o movimento acumulado da cena passa de um limiar
+  (adaptativo, com um máximo de frames entre keyframes);
+- BoxTracker propaga as caixas entre keyframes com fluxo óptico esparso
+  (Lucas-Kanade) sobre pontos de canto dentro de cada caixa, e nos keyframes
+  associa as detecções às trilhas existentes por IoU (guloso). Cada buraco
+  recebe um id persistente e é contado uma vez só.
+
+O resultado é um registro por trilha: primeiro e último frame em que foi
+detectado, melhor confiança, frame da melhor confiança e o recorte (crop)
+da imagem nesse frame.
+"""
+import json
+import logging
+import os
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+from utils import box_iou_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class KeyframeScheduler:
+    """Decide quais frames vão para o detector.
+
+    Args:
+        stride: Com adaptive=False, um keyframe a cada `stride` frames processados. Com
+                adaptive=True, é o máximo de frames entre keyframes.
+        adaptive: Se True, também gera um keyframe quando o movimento acumulado da cena
+                  desde o último keyframe passa de motion_threshold.
+        motion_threshold: Deslocamento acumulado (fração da largura do frame).
+    """
+
+    def __init__(self, stride=None, adaptive=None, motion_threshold=None):
+        self.stride = max(1, stride or config.TRACK_KEYFRAME_STRIDE)
+        self.adaptive = config.TRACK_ADAPTIVE_KEYFRAMES if adaptive is None else adaptive
+        self.motion_threshold = config.TRACK_MOTION_THRESHOLD if motion_threshold is None else motion_threshold
+        self._since_keyframe = None
+        self._motion = 0.0
+
+    def is_keyframe(self, motion=0.0):
+        """Registra o próximo frame (com o movimento medido desde o anterior) e diz se é keyframe."""
+        if self._since_keyframe is None:
+            keyframe = True
+        else:
+            self._since_keyframe += 1
+            self._motion += motion
+            keyframe = self._since_keyframe >= self.stride or (
+                self.adaptive and self._motion >= self.motion_threshold)
+        if keyframe:
+            self._since_keyframe, self._motion = 0, 0.0
+        return keyframe
+
+
+class Track:
+    """Uma trilha (um buraco) acompanhada entre frames."""
+
+    __slots__ = ("track_id", "box", "class_id", "class_name", "first_frame", "last_frame", "hits", "misses",
+                 "best_confidence", "best_frame", "best_box", "best_crop", "points")
+
+    def __init__(self, track_id, box, confidence, class_id, class_name, frame_index, frame):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.class_id = int(class_id)
+        self.class_name = class_name
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.hits = 0
+        self.misses = 0
+        self.best_confidence = -1.0
+        self.best_frame = None
+        self.best_box = None
+        self.best_crop = None
+        self.points = np.zeros((0, 1, 2), dtype=np.float32)
+        self.update(box, confidence, frame_index, frame)
+
+    def update(self, box, confidence, frame_index, frame):
+        """Associa uma detecção (em um keyframe) à trilha."""
+        self.box = np.asarray(box, dtype=np.float32)
+        self.last_frame = frame_index
+        self.hits += 1
+        self.misses = 0
+        if confidence > self.best_confidence:
+            self.best_confidence = float(confidence)
+            self.best_frame = frame_index
+            self.best_box = self.box.copy()
+            height, width = frame.shape[:2]
+            x1, y1, x2, y2 = np.clip(np.round(self.box), 0, [width, height, width, height]).astype(int)
+            # Cópia: o frame é descartado depois, o crop fica com a trilha
+            self.best_crop = frame[y1:y2, x1:x2].copy()
+
+    def to_record(self):
+        return {
+            "track_id": self.track_id,
+            "class_id": self.class_id,
+            "class_name": self.class_name,
+            "first_frame": self.first_frame,
+            "last_frame": self.last_frame,
+            "keyframe_hits": self.hits,
+            "best_confidence": self.best_confidence,
+            "best_frame": self.best_frame,
+            "best_box": [float(v) for v in self.best_box],
+        }
+
+
+class BoxTracker:
+    """Rastreador de caixas: fluxo óptico entre frames e associação por IoU nos keyframes.
+
+    Args:
+        iou_threshold: IoU mínimo para associar uma detecção a uma trilha.
+        max_misses: Keyframes seguidos sem detecção associada antes de encerrar a trilha.
+        min_hits: Detecções mínimas para a trilha aparecer no resultado.
+        work_width: Largura (px) do frame reduzido usado no fluxo óptico.
+    """
+
+    def __init__(self, iou_threshold=None, max_misses=None, min_hits=None, work_width=None):
+        self.iou_threshold = config.TRACK_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+        self.max_misses = config.TRACK_MAX_MISSES if max_misses is None else max_misses
+        self.min_hits = config.TRACK_MIN_HITS if min_hits is None else min_hits
+        self.work_width = work_width or config.TRACK_WORK_WIDTH
+        self.active = []
+        self.finished = []
+        self._next_id = 1
+        self._prev_gray = None
+        self._scale = 1.0
+        self._background = np.zeros((0, 1, 2), dtype=np.float32)
+        self._lk_params = dict(winSize=(21, 21), maxLevel=3,
+                               criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+    def _gray(self, frame):
+        height, width = frame.shape[:2]
+        self._scale = min(1.0, self.work_width / width)
+        if self._scale < 1.0:
+            frame = cv2.resize(frame, (int(width * self._scale), int(height * self._scale)),
+                               interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+    def _features(self, gray, box=None, max_corners=20):
+        """Pontos de canto (em coordenadas do frame reduzido) dentro da caixa, ou no frame inteiro."""
+        if box is None:
+            x1, y1, roi = 0, 0, gray
+        else:
+            x1, y1, x2, y2 = np.clip(np.round(box * self._scale), 0,
+                                     [gray.shape[1], gray.shape[0]] * 2).astype(int)
+            roi = gray[y1:y2, x1:x2]
+        if roi.shape[0] < 5 or roi.shape[1] < 5:
+            return np.zeros((0, 1, 2), dtype=np.float32)
+        points = cv2.goodFeaturesToTrack(roi, maxCorners=max_corners, qualityLevel=0.01, minDistance=3)
+        if points is None:
+            return np.zeros((0, 1, 2), dtype=np.float32)
+        return points + np.array([x1, y1], dtype=np.float32)
+
+    def propagate(self, frame_index, frame):
+        """Move as caixas das trilhas para o frame atual com fluxo óptico.
+
+        Returns:
+            Movimento global da cena desde o frame anterior (fração da largura), para o
+            KeyframeScheduler adaptativo.
+        """
+        gray = self._gray(frame)
+        prev_gray, self._prev_gray = self._prev_gray, gray
+        if prev_gray is None or prev_gray.shape != gray.shape:
+            self._background = self._features(gray, max_corners=200)
+            return 0.0
+
+        # Um único cálculo de fluxo para os pontos de fundo e de todas as trilhas
+        counts = [len(self._background)] + [len(track.points) for track in self.active]
+        all_points = np.concatenate([self._background] + [track.points for track in self.active])
+        if not len(all_points):
+            self._background = self._features(gray, max_corners=200)
+            return 0.0
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, all_points, None, **self._lk_params)
+        ok = status.reshape(-1).astype(bool)
+        offsets = np.cumsum([0] + counts)
+
+        flow = (moved - all_points).reshape(-1, 2)
+        background_ok = ok[:counts[0]]
+        global_shift = np.median(flow[:counts[0]][background_ok], axis=0) if background_ok.any() else np.zeros(2)
+        motion = float(np.hypot(*global_shift)) / gray.shape[1]
+
+        height, width = frame.shape[:2]
+        still_active = []
+        for track, start, end in zip(self.active, offsets[1:-1], offsets[2:]):
+            track_ok = ok[start:end]
+            if track_ok.sum() >= 3:
+                old, new = all_points[start:end][track_ok], moved[start:end][track_ok]
+                shift = np.median(new - old, axis=0).reshape(2)
+                # Escala pela razão das distâncias ao centroide (o buraco cresce ao se aproximar)
+                old_spread = np.median(np.linalg.norm(old - old.mean(axis=0), axis=-1))
+                new_spread = np.median(np.linalg.norm(new - new.mean(axis=0), axis=-1))
+                scale = float(np.clip(new_spread / old_spread, 0.8, 1.25)) if old_spread > 1 else 1.0
+                track.points = new.reshape(-1, 1, 2)
+            else:
+                # Poucos pontos na caixa: acompanha o movimento global da cena
+                shift, scale = global_shift, 1.0
+                track.points = np.zeros((0, 1, 2), dtype=np.float32)
+            center = (track.box[:2] + track.box[2:]) / 2 + shift / self._scale
+            half = (track.box[2:] - track.box[:2]) / 2 * scale
+            track.box = np.concatenate([center - half, center + half]).astype(np.float32)
+            x1, y1, x2, y2 = track.box
+            if x2 <= 0 or y2 <= 0 or x1 >= width or y1 >= height:
+                # Saiu do quadro
+                self._finish(track)
+            else:
+                still_active.append(track)
+        self.active = still_active
+
+        self._background = moved[:counts[0]][background_ok].reshape(-1, 1, 2)
+        if len(self._background) < 50:
+            self._background = self._features(gray, max_corners=200)
+        return motion
+
+    def update(self, frame_index, frame, detections):
+        """Associa as detecções de um keyframe às trilhas (IoU guloso) e cria trilhas novas."""
+        metrics.inc("keyframes_total")
+        boxes = detections.xyxy
+        matched_tracks, matched_dets = set(), set()
+        if self.active and len(boxes):
+            track_boxes = np.stack([track.box for track in self.active])
+            iou = box_iou_matrix(track_boxes, boxes)
+            same_class = np.array([t.class_id for t in self.active])[:, None] == detections.class_id[None, :]
+            iou = np.where(same_class, iou, 0.0)
+            # Pares em ordem decrescente de IoU
+            for flat in np.argsort(-iou, axis=None):
+                t, d = np.unravel_index(flat, iou.shape)
+                if iou[t, d] < self.iou_threshold:
+                    break
+                if t in matched_tracks or d in matched_dets:
+                    continue
+                matched_tracks.add(t)
+                matched_dets.add(d)
+                self.active[t].update(boxes[d], detections.confidence[d], frame_index, frame)
+
+        still_active = []
+        for t, track in enumerate(self.active):
+            if t not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    self._finish(track)
+                    continue
+            still_active.append(track)
+        self.active = still_active
+
+        names = detections.class_name_array()
+        for d in range(len(boxes)):
+            if d in matched_dets:
+                continue
+            self.active.append(Track(self._next_id, boxes[d], detections.confidence[d], detections.class_id[d],
+                                     names[d], frame_index, frame))
+            self._next_id += 1
+
+        # Novos pontos de canto nas caixas atualizadas
+        gray = self._prev_gray if self._prev_gray is not None else self._gray(frame)
+        for track in self.active:
+            track.points = self._features(gray, track.box)
+
+    def _finish(self, track):
+        if track.hits >= self.min_hits:
+            self.finished.append(track)
+            metrics.inc("tracks_total")
+
+    def finish(self):
+        """Encerra as trilhas ativas e retorna todas as trilhas válidas, em ordem de id."""
+        for track in self.active:
+            self._finish(track)
+        self.active = []
+        return sorted(self.finished, key=lambda track: track.track_id)
+
+
+def save_tracks(tracks, output_dir, name):
+    """Salva um registro por trilha em <output_dir>/<name>_tracks.jsonl e o melhor crop de cada uma.
+
+    Returns:
+        Caminho do arquivo de trilhas.
+    """
+    from output_handler import save_image
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{name}_tracks.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for track in tracks:
+            record = track.to_record()
+            if track.best_crop is not None and track.best_crop.size:
+                record["best_crop"] = os.path.join(output_dir, "tracks", f"{name}_track{track.track_id:05d}.jpg")
+                save_image(track.best_crop, record["best_crop"])
+            f.write(json.dumps(record) + "\n")
+    logger.info("%d trilhas salvas em %s", len(tracks), path)
+    return path
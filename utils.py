@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Funções auxiliares de geometria de caixas (formato [x1, y1, x2, y2]) em NumPy."""
+import numpy as np
+
+
+def box_area(boxes):
+    """Área de cada caixa de um array Nx4."""
+    boxes = np.asarray(boxes)
+    if boxes.dtype.kind != "f":
+        boxes = boxes.astype(np.float32)
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def box_iou_matrix(boxes_a, boxes_b, metric="iou"):
+    """Matriz NxM de sobreposição entre dois conjuntos de caixas.
+
+    Args:
+        metric: "iou" (interseção sobre união) ou "ios" (interseção sobre a área da
+                menor caixa, útil para juntar pedaços de uma caixa cortada entre tiles).
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = box_area(boxes_a)[:, None]
+    area_b = box_area(boxes_b)[None, :]
+    if metric == "ios":
+        denominator = np.minimum(area_a, area_b)
+    else:
+        denominator = area_a + area_b - inter
+    return inter / np.maximum(denominator, 1e-9)
+
+
+def nms(boxes, scores, iou_threshold=0.5, class_ids=None, metric="iou"):
+    """Non-maximum suppression vetorizada.
+
+    Args:
+        boxes: Array Nx4 [x1, y1, x2, y2].
+        scores: Array N de confianças.
+        iou_threshold: Sobreposição acima da qual a caixa de menor confiança é removida.
+        class_ids: Se informado, a supressão só acontece entre caixas da mesma classe.
+        metric: "iou" ou "ios" (ver box_iou_matrix).
+
+    Returns:
+        Índices das caixas mantidas, em ordem decrescente de confiança.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if class_ids is not None:
+        # Desloca cada classe para uma região própria: caixas de classes diferentes nunca se sobrepõem.
+        # float64 para não perder precisão quando há muitos grupos (deslocamentos grandes).
+        offset = float(boxes.max() - min(float(boxes.min()), 0.0)) + 1.0
+        boxes = boxes.astype(np.float64) + np.asarray(class_ids, dtype=np.float64).reshape(-1, 1) * offset
+
+    areas = box_area(boxes)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        top_left = np.maximum(boxes[i, :2], boxes[rest, :2])
+        bottom_right = np.minimum(boxes[i, 2:], boxes[rest, 2:])
+        wh = np.clip(bottom_right - top_left, 0, None)
+        inter = wh[:, 0] * wh[:, 1]
+        if metric == "ios":
+            overlap = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        else:
+            overlap = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[overlap <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
@@ -1,35 +1,23 @@
 # -*- coding: utf-8 -*-
 import cv2
-import numpy as np
-import os
-import pandas as pd
-from inference_sdk import InferenceHTTPClient, InferenceConfiguration
-
-# --- Configuração Roboflow ---
-ROBOFLOW_API_KEY = "d3nDPMwWE1xqV74ma2MN"
-ROBOFLOW_MODEL_ID = "pothole-detection-yolov8/1"
-ROBOFLOW_API_URL = "https://detect.roboflow.com"
-
-# Variável global para o cliente de inferência
-client = None
-
-# Tentar inicializar o cliente Roboflow
-try:
-    print(f"Inicializando cliente HTTP de inferência Roboflow para o modelo: {ROBOFLOW_MODEL_ID}")
-    client = InferenceHTTPClient(
-        api_url=ROBOFLOW_API_URL,
-        api_key=ROBOFLOW_API_KEY
-    )
-    client.select_api_v0()
-    print("Cliente Roboflow inicializado com sucesso.")
-except Exception as e:
-    print(f"Erro ao inicializar o cliente Roboflow: {e}")
-    client = None
+import logging
+
+from config import INFERENCE_BATCH_SIZE, TILE_OVERLAP, TILE_MERGE_THRESHOLD
+from cache import get_cache, make_cache_key
+from inference_backends import get_backend
+from detections import Detections
+from tiling import split_into_tiles
+import metrics
+
+logger = logging.getLogger(__name__)
 
 def draw_predictions(image, predictions):
     """Desenha as caixas delimitadoras e labels na imagem usando OpenCV.
-       MODIFICADO: Espera predições com a chave 'box' contendo [x1, y1, x2, y2].
+       MODIFICADO: Espera predições com a chave 'box' contendo [x1, y1, x2, y2]
+                   ou um objeto Detections.
     """
+    if isinstance(predictions, Detections):
+        predictions = predictions.to_predictions()
     annotated_image = image.copy()
     height, width, _ = annotated_image.shape
     
@@ -38,7 +26,7 @@ def draw_predictions(image, predictions):
             # Extrair dados do dicionário de predição
             box = p.get("box") # Espera [x1, y1, x2, y2]
             if box is None or len(box) != 4:
-                print(f"Skipping prediction due to missing or invalid 'box': {p}")
+                logger.warning("Skipping prediction due to missing or invalid 'box': %s", p)
                 continue
                 
             confidence = p.get("confidence", 0.0)
@@ -69,92 +57,243 @@ def draw_predictions(image, predictions):
             # Desenhar texto do label (cor BGR: Preto)
             cv2.putText(annotated_image, label, (x1, label_y1 - baseline), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1, cv2.LINE_AA)
         except Exception as e:
-            print(f"Erro ao desenhar predição {p}: {e}")
+            logger.error("Erro ao desenhar predição %s: %s", p, e)
             continue
             
     return annotated_image
 
-def detect_objects_yolo(image, confidence_threshold=0.25):
-    """Detecta objetos (buracos) em uma imagem usando a API Roboflow.
-       MODIFICADO: Assume que a API retorna predições com 'box' [x1, y1, x2, y2].
-                   Remove a chamada para extract_detection_data.
+def _infer_raw_batch(backend, image_list, batch_size, variants=None, cache=None):
+    """Obtém as predições raw de cada imagem, consultando o cache antes do backend.
+
+    Returns:
+        Lista com as predições raw de cada imagem, ou None para as imagens cujo lote falhou.
+    """
+    raw_results = [None] * len(image_list)
+    keys = [None] * len(image_list)
+    pending = list(range(len(image_list)))
+
+    if cache is not None:
+        pending = []
+        for i, image in enumerate(image_list):
+            keys[i] = make_cache_key(image, backend.model_key, variants[i] if variants else None)
+            raw_results[i] = cache.get(keys[i])
+            if raw_results[i] is None:
+                pending.append(i)
+        hits = len(image_list) - len(pending)
+        metrics.inc("inference_cache_hits_total", hits)
+        metrics.inc("inference_cache_misses_total", len(pending))
+        if hits:
+            logger.debug("Cache de inferência: %d de %d imagens já processadas.", hits, len(image_list))
+
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        for i in chunk:
+            metrics.observe("inference_input_bytes", image_list[i].nbytes, backend=backend.name)
+        try:
+            with metrics.timer("inference_latency_seconds", backend=backend.name):
+                raw_batch = backend.infer_batch([image_list[i] for i in chunk])
+        except Exception as e:
+            logger.error("Erro durante a inferência em lote com o backend '%s': %s", backend.name, e)
+            metrics.inc("inference_errors_total", len(chunk), backend=backend.name)
+            continue
+        metrics.inc("inference_images_total", len(chunk), backend=backend.name)
+        for i, predictions_raw in zip(chunk, raw_batch):
+            if predictions_raw is None:
+                # Falha só desta imagem (ex.: esgotou as tentativas no cliente assíncrono)
+                metrics.inc("inference_errors_total", backend=backend.name)
+                continue
+            raw_results[i] = predictions_raw
+            if cache is not None:
+                cache.put(keys[i], predictions_raw)
+    return raw_results
+
+def _infer_raw_tiled(backend, image_list, batch_size, tile_size, tile_overlap, variants=None, cache=None,
+                     prefilter_threshold=None):
+    """Como _infer_raw_batch, mas divide cada imagem em tiles e envia os tiles de todas as
+    imagens juntos em lote.
+
+    Returns:
+        Lista com um Detections por imagem (caixas já nas coordenadas da imagem inteira),
+        ou None para as imagens com algum tile que falhou.
+    """
+    tile_images, tile_variants, tile_origins = [], [], []
+    for i, image in enumerate(image_list):
+        for x_offset, y_offset, tile in split_into_tiles(image, tile_size, tile_overlap,
+                                                         min_score=prefilter_threshold):
+            tile_images.append(tile)
+            tile_variants.append(f"{variants[i] if variants else ''}|tile{tile_size}")
+            tile_origins.append((i, x_offset, y_offset))
+    logger.debug("Inferência em tiles de %dpx: %d tiles úteis para %d imagens.",
+                 tile_size, len(tile_images), len(image_list))
+    metrics.inc("tiles_total", len(tile_images))
+
+    tile_results = _infer_raw_batch(backend, tile_images, batch_size, tile_variants, cache)
+
+    per_image = [[] for _ in image_list]
+    for (i, x_offset, y_offset), predictions_raw in zip(tile_origins, tile_results):
+        if per_image[i] is None:
+            continue
+        if predictions_raw is None:
+            # Falha em um tile invalida a imagem inteira, como no caminho sem tiles
+            per_image[i] = None
+            continue
+        per_image[i].append(Detections.from_predictions(predictions_raw).offset(x_offset, y_offset))
+    return [None if parts is None else Detections.concatenate(parts) for parts in per_image]
+
+def detect_objects_yolo(image, confidence_threshold=0.25, backend=None, variant=None, use_cache=True,
+                        tile_size=None, tile_overlap=TILE_OVERLAP, as_detections=False, prefilter_threshold=None):
+    """Detecta objetos (buracos) em uma imagem usando o backend de inferência configurado.
+       MODIFICADO: Assume que o backend retorna predições com 'x', 'y', 'width', 'height'
+                   e calcula 'box' [x1, y1, x2, y2].
     Args:
         image: A imagem de entrada (formato NumPy BGR).
         confidence_threshold: Limiar de confiança mínimo para considerar uma detecção.
+        backend: Backend de inferência (ver inference_backends). Se None, usa o backend
+                 padrão definido por config.INFERENCE_BACKEND.
+        variant: Descrição do pré-processamento aplicado (ex.: "clahe(clip_limit=2.0, ...)"),
+                 usada na chave do cache de inferência.
+        use_cache: Se True, consulta o cache de inferência (cache.py) antes do backend.
+        tile_size: Se informado, faz a inferência em tiles de tile_size x tile_size pixels
+                   (ver tiling.py) e junta as caixas nas bordas entre tiles.
+        tile_overlap: Fração de sobreposição entre tiles vizinhos.
+        as_detections: Se True, retorna um objeto Detections (arrays NumPy, ver detections.py)
+                       em vez da lista de dicionários.
+        prefilter_threshold: Com tiles, os tiles com score do pré-filtro (prefilter.py) abaixo
+                             desse valor não vão para o detector. None desliga.
 
     Returns:
-        results_list: Lista de dicionários com as detecções filtradas, ou None se falhar.
+        results_list: Lista de dicionários com as detecções filtradas (ou Detections), ou None se falhar.
         annotated_image: Imagem com as detecções desenhadas manualmente.
     """
-    if client is None:
-        print("Cliente Roboflow não está inicializado. Abortando detecção.")
-        return None, image.copy()
+    if tile_size:
+        return detect_objects_yolo_batch([image], confidence_threshold, backend, variants=[variant],
+                                         use_cache=use_cache, tile_size=tile_size, tile_overlap=tile_overlap,
+                                         as_detections=as_detections,
+                                         prefilter_threshold=prefilter_threshold)[0]
 
-    print(f"Executando inferência via API Roboflow com limiar de confiança: {confidence_threshold}")
-
-    try:
-        result_dict = client.infer(image, model_id=ROBOFLOW_MODEL_ID)
-        predictions_raw = result_dict.get("predictions", [])
-        
-        # Adiciona a chave 'box' [x1, y1, x2, y2] a cada predição raw
-        # Isso assume que a API retorna 'x', 'y', 'width', 'height'
-        # Se a API já retornar 'box', esta etapa pode ser simplificada/removida.
-        # Vamos assumir por agora que precisamos calcular 'box'.
-        predictions_processed = []
-        for p in predictions_raw:
-            try:
-                x_center = p["x"]
-                y_center = p["y"]
-                w = p["width"]
-                h = p["height"]
-                x1 = x_center - w / 2
-                y1 = y_center - h / 2
-                x2 = x_center + w / 2
-                y2 = y_center + h / 2
-                p["box"] = [float(x1), float(y1), float(x2), float(y2)]
-                predictions_processed.append(p)
-            except KeyError as ke:
-                print(f"Predição raw não contém chaves esperadas ('x', 'y', 'width', 'height'): {p}. Erro: {ke}. Pulando predição.")
-                continue
-            except Exception as e:
-                 print(f"Erro ao processar predição raw {p}: {e}. Pulando predição.")
-                 continue
-        
-        # Filtrar predições com base no limiar de confiança
-        predictions_filtered = [p for p in predictions_processed if p["confidence"] >= confidence_threshold]
-        
-        # A lista de resultados é a própria lista filtrada
-        results_list = predictions_filtered
-
-        # Chamar a função manual para desenhar as caixas (agora espera 'box')
-        annotated_image = draw_predictions(image, predictions_filtered)
-
-        if predictions_filtered:
-             print(f"Detecções encontradas e filtradas via Roboflow API: {len(predictions_filtered)}")
-        else:
-             print("Nenhuma detecção encontrada com o limiar especificado via Roboflow API.")
+    if backend is None:
+        try:
+            backend = get_backend()
+        except Exception as e:
+            logger.error("Erro ao inicializar o backend de inferência: %s. Abortando detecção.", e)
+            return None, image.copy()
 
-        # Retorna a lista de dicionários filtrados (que agora inclui 'box')
-        return results_list, annotated_image
+    logger.debug("Executando inferência via backend '%s' com limiar de confiança: %s",
+                 backend.name, confidence_threshold)
 
-    except Exception as e:
-        print(f"Erro durante a inferência com a API Roboflow: {e}")
+    cache = get_cache() if use_cache else None
+    predictions_raw = _infer_raw_batch(backend, [image], 1, [variant], cache)[0]
+    if predictions_raw is None:
         return None, image.copy()
 
+    detections = Detections.from_predictions(predictions_raw).filter_by_confidence(confidence_threshold)
+    metrics.observe("detections_per_image", len(detections))
+
+    # Chamar a função manual para desenhar as caixas
+    annotated_image = draw_predictions(image, detections)
+
+    if len(detections):
+        logger.debug("Detecções encontradas e filtradas via backend '%s': %d", backend.name, len(detections))
+    else:
+        logger.debug("Nenhuma detecção encontrada com o limiar especificado via backend '%s'.", backend.name)
+
+    # Retorna as detecções filtradas (lista de dicionários com 'box', ou Detections)
+    return (detections if as_detections else detections.to_predictions()), annotated_image
+
+def detect_objects_yolo_batch(images, confidence_threshold=0.25, backend=None, batch_size=None,
+                              variants=None, use_cache=True, tile_size=None, tile_overlap=TILE_OVERLAP,
+                              as_detections=False, prefilter_threshold=None):
+    """Detecta objetos em várias imagens, agrupando-as em poucas chamadas ao backend.
+
+    Backends locais processam cada grupo em um único forward pass; o backend
+    Roboflow envia o grupo como um conjunto de requisições em paralelo.
+
+    Args:
+        images: Lista de imagens BGR, ou dicionário {chave: imagem}. A chave pode ser, por
+                exemplo, (nome_da_imagem, variante) para mapear originais e CLAHE no mesmo lote.
+        confidence_threshold: Limiar de confiança mínimo para considerar uma detecção.
+        backend: Backend de inferência. Se None, usa o backend padrão.
+        batch_size: Máximo de imagens por chamada ao backend (padrão: config.INFERENCE_BATCH_SIZE).
+        variants: Descrição do pré-processamento de cada imagem, para a chave do cache:
+                  uma string para todas, uma lista paralela a `images` ou um dicionário
+                  com as mesmas chaves de `images`.
+        use_cache: Se True, só envia ao backend as imagens que não estão no cache de inferência.
+        tile_size: Se informado, cada imagem é dividida em tiles (ver detect_objects_yolo) e os
+                   tiles de todas as imagens vão juntos nos lotes enviados ao backend.
+        tile_overlap: Fração de sobreposição entre tiles vizinhos.
+        as_detections: Se True, results_list é um objeto Detections em vez de lista de dicionários.
+        prefilter_threshold: Com tiles, pula os tiles com score do pré-filtro abaixo desse valor.
+
+    Returns:
+        Lista (ou dicionário com as mesmas chaves da entrada) de tuplas
+        (results_list, annotated_image), como em detect_objects_yolo. results_list é None
+        para as imagens cujo lote falhou.
+    """
+    if isinstance(images, dict):
+        keys, image_list = list(images.keys()), list(images.values())
+    else:
+        keys, image_list = None, list(images)
+    batch_size = max(1, batch_size or INFERENCE_BATCH_SIZE)
+
+    if isinstance(variants, dict):
+        variants = [variants.get(key) for key in keys]
+    elif isinstance(variants, str):
+        variants = [variants] * len(image_list)
+
+    if backend is None:
+        try:
+            backend = get_backend()
+        except Exception as e:
+            logger.error("Erro ao inicializar o backend de inferência: %s. Abortando detecção.", e)
+            outputs = [(None, image.copy()) for image in image_list]
+            return dict(zip(keys, outputs)) if keys is not None else outputs
+
+    logger.debug("Executando inferência em lote (%d imagens, lotes de até %d) via backend '%s' "
+                 "com limiar de confiança: %s", len(image_list), batch_size, backend.name, confidence_threshold)
+
+    cache = get_cache() if use_cache else None
+    if tile_size:
+        raw_results = _infer_raw_tiled(backend, image_list, batch_size, tile_size, tile_overlap, variants, cache,
+                                       prefilter_threshold)
+    else:
+        raw_results = _infer_raw_batch(backend, image_list, batch_size, variants, cache)
+
+    outputs = []
+    for image, predictions_raw in zip(image_list, raw_results):
+        if predictions_raw is None:
+            outputs.append((None, image.copy()))
+            continue
+        if tile_size:
+            # Interseção sobre a menor caixa: um buraco cortado por um tile fica contido na caixa do vizinho
+            detections = predictions_raw.filter_by_confidence(confidence_threshold)
+            detections = detections.nms(TILE_MERGE_THRESHOLD, metric="ios")
+        else:
+            detections = Detections.from_predictions(predictions_raw).filter_by_confidence(confidence_threshold)
+        metrics.observe("detections_per_image", len(detections))
+        results = detections if as_detections else detections.to_predictions()
+        outputs.append((results, draw_predictions(image, detections)))
+
+    total = sum(len(results) for results, _ in outputs if results)
+    logger.info("Inferência em lote concluída: %d detecções em %d imagens.", total, len(image_list))
+    return dict(zip(keys, outputs)) if keys is not None else outputs
+
 def extract_detection_data(predictions):
     """Extrai dados relevantes das detecções do DataFrame YOLOv5.
 
     Args:
-        predictions: Lista de dicionários com as predições (cada uma contendo 'box', 'confidence', 'class').
+        predictions: Lista de dicionários com as predições (cada uma contendo 'box', 'confidence', 'class'),
+                     ou um objeto Detections.
 
     Returns:
         detections: Uma lista de dicionários, cada um representando um objeto detectado.
                     Ex: [{"class_id": 0, "class_name": "pothole", "confidence": 0.85, "box": [x1, y1, x2, y2]}]
     """
     detections = []
-    if not predictions:
-        print("Lista de predições vazia para extrair dados.")
+    if predictions is None or not len(predictions):
+        logger.debug("Lista de predições vazia para extrair dados.")
         return detections
+    if isinstance(predictions, Detections):
+        predictions = predictions.to_predictions()
 
     for p in predictions:
         try:
@@ -171,12 +310,12 @@ def extract_detection_data(predictions):
                     "box": box
                 })
             else:
-                print(f"Predição incompleta, pulando: {p}")
+                logger.warning("Predição incompleta, pulando: %s", p)
         except Exception as e:
-            print(f"Erro ao processar predição {p}: {e}")
+            logger.error("Erro ao processar predição %s: %s", p, e)
             continue
 
-    print(f"Dados extraídos para {len(detections)} detecções.")
+    logger.debug("Dados extraídos para %d detecções.", len(detections))
     return detections
 
 